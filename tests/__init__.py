@@ -3,4 +3,4 @@
 """ Vehicle optimization module's tests
 """
 
-from tests import test_solution, test_test_utils, test_utils
+from tests import test_annealing, test_incremental, test_population, test_score, test_solution, test_test_utils, test_utils
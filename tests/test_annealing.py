@@ -0,0 +1,200 @@
+# tests/test_annealing.py
+
+""" Simulated annealing tests
+"""
+
+import unittest
+from unittest import mock
+import numpy as np
+
+from vehicle_carpooling import annealing, problem
+from tests.test_solution import PATH_MAP, NB_NODES, NB_STEPS
+from tests.test_score import TIME_MAP
+
+NB_PASSENGERS = 3
+NB_VEHICLES = 2
+VEHICLE_CAPACITY = 2
+
+PROBLEM_PARAM = {
+    "nb_nodes": NB_NODES,
+    "nb_vehicles": NB_VEHICLES,
+    "vehicle_capacity": VEHICLE_CAPACITY,
+    "nb_passengers": NB_PASSENGERS,
+    "nb_steps": NB_STEPS,
+    "path_map": PATH_MAP,
+    "time_map": TIME_MAP,
+    "passenger_start_points": np.array([0, 1, 1]),
+    "passenger_finish_points": np.array([1, 2, 3]),
+    "vehicle_start_points": np.array([0, 1]),
+    "alpha": 0.5
+}
+
+
+class TestSimulatedAnnealing(unittest.TestCase):
+    """Simulated annealing tests
+    """
+
+    def setUp(self):
+        np.random.seed(0)
+        self.problem = problem.Problem(**PROBLEM_PARAM)
+
+    def test_cooling(self):
+        """Check the cooling schedules
+
+        Tests:
+            - The schedules go from the initial to the final temperature
+        """
+        for cooling in annealing.COOLING_SCHEDULES.values():
+            self.assertAlmostEqual(cooling(0, 1.0, 0.01), 1.0)
+        self.assertAlmostEqual(annealing.exponential_cooling(1, 1.0, 0.01), 0.01)
+        self.assertAlmostEqual(annealing.exponential_cooling(0.5, 1.0, 0.01), 0.1)
+        self.assertAlmostEqual(annealing.linear_cooling(0.5, 1.0, 0.0), 0.5)
+
+    def test_run(self):
+        """Check an annealing run
+
+        Tests:
+            - The best solution is not worse than the initial solution
+            - The evaluators match check_constraint on the restored best solution
+            - The evaluations per second are reported
+        """
+        solver = annealing.SimulatedAnnealing(self.problem, seed=0)
+        initial_energy = solver.energy
+        result = solver.run(max_iterations=300)
+        self.assertEqual(result["iterations"], 300)
+        self.assertEqual(result["evaluations"], 301)
+        self.assertGreater(result["evaluations_per_second"], 0)
+        self.assertLessEqual(result["energy"], initial_energy)
+        self.assertAlmostEqual(solver.energy, result["energy"])
+        solver.ride_path.check_constraint()
+        solver.drive.check_constraint()
+        solver.ride_vehicle.check_constraint(solver.ride_path, solver.drive)
+        self.assertEqual(result["violation_count"], solver.ride_path.violation_count +
+                         solver.drive.violation_count + solver.ride_vehicle.violation_count)
+        solver.close()
+
+    def test_seed(self):
+        """Check that a run only depends on the seed
+
+        Tests:
+            - Two runs with the same seed give the same best solution, whatever the global random state
+        """
+        results = []
+        for global_seed in [1, 2]:
+            np.random.seed(global_seed)
+            solver = annealing.SimulatedAnnealing(self.problem, seed=0)
+            result = solver.run(max_iterations=200)
+            results.append((result["energy"], result["accepted"], solver.get_state()))
+            solver.close()
+        (energy, accepted, state), (other_energy, other_accepted, other_state) = results
+        self.assertEqual(energy, other_energy)
+        self.assertEqual(accepted, other_accepted)
+        for name in state:
+            np.testing.assert_array_equal(state[name], other_state[name])
+
+    def test_rollback(self):
+        """Check that a rejected move restores the solution
+
+        Tests:
+            - The state and the energy are unchanged after rejected moves
+        """
+        solver = annealing.SimulatedAnnealing(self.problem, seed=0)
+        for _ in range(50):
+            state, energy = solver.get_state(), solver.energy
+            accepted, new_energy = solver.step(temperature=0)
+            if not accepted:
+                for name, array in solver.get_state().items():
+                    self.assertEqual(array.tolist(), state[name].tolist())
+            self.assertAlmostEqual(solver.energy, new_energy)
+            self.assertLessEqual(new_energy, energy)
+
+    def test_limits(self):
+        """Check the limits of a run
+
+        Tests:
+            - A run needs an iteration or a time limit
+            - A run stops at its time limit
+        """
+        solver = annealing.SimulatedAnnealing(self.problem, seed=0)
+        with self.assertRaises(ValueError):
+            solver.run()
+        result = solver.run(time_limit=0.05)
+        self.assertLess(result["elapsed"], 1)
+        self.assertGreater(result["iterations"], 0)
+
+
+class TestParallelTempering(unittest.TestCase):
+    """Parallel tempering tests
+    """
+
+    def setUp(self):
+        self.problem = problem.Problem(**PROBLEM_PARAM)
+
+    def test_run(self):
+        """Check a parallel tempering run
+
+        Tests:
+            - Each replica runs the iterations, the swaps are tried between the rounds
+            - The best state gives the best energy in a solver
+            - The serial backend leaves the global random state unchanged
+        """
+        np.random.seed(0)
+        with annealing.ParallelTempering(self.problem, nb_replicas=3, swap_interval=20,
+                                         backend="serial", seed=0) as tempering:
+            result = tempering.run(max_iterations=100)
+        self.assertEqual(np.random.random(), np.random.RandomState(0).random_sample())
+        self.assertEqual(result["rounds"], 5)
+        self.assertEqual(result["evaluations"], 300)
+        self.assertEqual(len(result["acceptance_rates"]), 3)
+        self.assertTrue(0 <= result["swap_rate"] <= 1)
+        solver = annealing.SimulatedAnnealing(self.problem)
+        solver.set_state(result["state"])
+        self.assertAlmostEqual(solver.energy, result["energy"])
+        self.assertEqual(solver.violation_count, result["violation_count"])
+
+    def test_partial_last_round(self):
+        """Check that the last round stops at max_iterations
+
+        Tests:
+            - A max_iterations that is not a multiple of swap_interval shortens the last round
+        """
+        with annealing.ParallelTempering(self.problem, nb_replicas=2, swap_interval=100,
+                                         backend="serial", seed=0) as tempering:
+            with mock.patch.object(annealing, "_run_replica", wraps=annealing._run_replica) as run_replica:
+                result = tempering.run(max_iterations=150)
+        self.assertEqual([call.args[3] for call in run_replica.call_args_list], [
+                         100, 100, 50, 50])
+        self.assertEqual(result["rounds"], 2)
+        self.assertEqual(result["iterations"], 150)
+        self.assertEqual(result["evaluations"], 300)
+
+    def test_process_backend(self):
+        """Check that the replicas run in worker processes
+
+        Tests:
+            - The process backend gives a state usable by a solver
+        """
+        with annealing.ParallelTempering(self.problem, nb_replicas=2, swap_interval=10,
+                                         max_workers=2, seed=0) as tempering:
+            result = tempering.run(max_iterations=20)
+        self.assertEqual(result["rounds"], 2)
+        solver = annealing.SimulatedAnnealing(self.problem)
+        solver.set_state(result["state"])
+        self.assertAlmostEqual(solver.energy, result["energy"])
+
+    def test_swap(self):
+        """Check the swap rule
+
+        Tests:
+            - The temperatures are sorted from the coldest
+            - A lower energy always moves to the colder temperature
+        """
+        tempering = annealing.ParallelTempering(
+            self.problem, temperatures=[1.0, 0.1], backend="serial", seed=0)
+        self.assertEqual(tempering.temperatures, [0.1, 1.0])
+        tempering.states = ["cold", "hot"]
+        tempering.energies = [5.0, 1.0]
+        self.assertEqual(tempering._swap(0), (1, 1))
+        self.assertEqual(tempering.states, ["hot", "cold"])
+        self.assertEqual(tempering.energies, [1.0, 5.0])
+        self.assertEqual(tempering._swap(1), (0, 0))
@@ -0,0 +1,134 @@
+# tests/test_incremental.py
+
+""" Incremental evaluators tests
+"""
+
+import unittest
+import numpy as np
+
+from vehicle_carpooling import solution, incremental
+from tests.test_solution import RIDE_PATH_PARAM, RIDE_VEHICLE_PARAM, DRIVE_PARAM, NB_NODES, NB_STEPS
+
+NB_PASSENGERS = 3
+NB_VEHICLES = 2
+
+
+class TestIncrementalEvaluator(unittest.TestCase):
+    """Incremental evaluators tests
+    """
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        ride_path_param = RIDE_PATH_PARAM.copy()
+        ride_path_param["nb_passengers"] = NB_PASSENGERS
+        ride_path_param["nb_vehicles"] = NB_VEHICLES
+        ride_vehicle_param = RIDE_VEHICLE_PARAM.copy()
+        ride_vehicle_param["nb_passengers"] = NB_PASSENGERS
+        ride_vehicle_param["nb_vehicles"] = NB_VEHICLES
+        drive_param = DRIVE_PARAM.copy()
+        drive_param["nb_vehicles"] = NB_VEHICLES
+        self.ride_path = solution.RidePath(**ride_path_param)
+        self.ride_vehicle = solution.RideVehicle(**ride_vehicle_param)
+        self.drive = solution.DrivePath(**drive_param)
+        self.ride_path.solution = self.rng.integers(
+            0, NB_NODES, (NB_PASSENGERS, NB_STEPS, 2))
+        self.ride_vehicle.solution = self.rng.integers(
+            -1, NB_VEHICLES, (NB_PASSENGERS, NB_STEPS))
+        self.drive.solution = self.rng.integers(
+            0, NB_NODES, (NB_VEHICLES, NB_STEPS, 2))
+
+    def _random_move(self):
+        """Change a random cell of a random solution
+        """
+        choice = self.rng.integers(3)
+        if choice == 0:
+            self.ride_path.set_cells(self.rng.integers(NB_PASSENGERS), self.rng.integers(NB_STEPS),
+                                     self.rng.integers(0, NB_NODES, 2))
+        elif choice == 1:
+            self.drive.set_cells(self.rng.integers(NB_VEHICLES), self.rng.integers(NB_STEPS),
+                                 self.rng.integers(0, NB_NODES, 2))
+        else:
+            self.ride_vehicle.set_cells(self.rng.integers(NB_PASSENGERS), self.rng.integers(NB_STEPS),
+                                        self.rng.integers(-1, NB_VEHICLES))
+
+    def test_incremental_matches_check_constraint(self):
+        """Check that the evaluators follow the changes of the solutions
+
+        Tests:
+            - After each move, the evaluators give the same result as check_constraint
+        """
+        ride_evaluator = incremental.RidePathEvaluator(self.ride_path)
+        drive_evaluator = incremental.DrivePathEvaluator(self.drive)
+        ride_vehicle_evaluator = incremental.RideVehicleEvaluator(
+            self.ride_vehicle, self.ride_path, self.drive)
+        for _ in range(200):
+            self._random_move()
+            self.assertEqual(bool(self.ride_path.check_constraint()),
+                             ride_evaluator.check_constraint())
+            self.assertEqual(self.ride_path.violation_count,
+                             ride_evaluator.violation_count)
+            self.assertEqual(bool(self.drive.check_constraint()),
+                             drive_evaluator.check_constraint())
+            self.assertEqual(self.drive.violation_count,
+                             drive_evaluator.violation_count)
+            self.assertEqual(bool(self.ride_vehicle.check_constraint(self.ride_path, self.drive)),
+                             ride_vehicle_evaluator.check_constraint())
+            self.assertEqual(self.ride_vehicle.violation_count,
+                             ride_vehicle_evaluator.violation_count)
+
+    def test_undo_move(self):
+        """Check that undoing a move restores the state of the evaluator
+
+        Tests:
+            - Setting back the old value gives back the same violations
+        """
+        evaluator = incremental.RideVehicleEvaluator(
+            self.ride_vehicle, self.ride_path, self.drive)
+        violations = evaluator.violations.copy()
+        old_value = self.ride_path.solution[0, 1].copy()
+        self.ride_path.set_cells(0, 1, [3, 0])
+        self.ride_path.set_cells(0, 1, old_value)
+        self.assertEqual(evaluator.violations, violations)
+
+    def test_compact_one_edge(self):
+        """Check the one edge count of the evaluator on compact paths with int8 nodes
+
+        Tests:
+            - After each move, the evaluator gives the same result as check_constraint
+        """
+        nb_nodes = 30
+        path_map = np.ones((nb_nodes, nb_nodes), dtype=int)
+        ride_path = solution.RidePath(**{**RIDE_PATH_PARAM, "nb_passengers": NB_PASSENGERS, "nb_vehicles": NB_VEHICLES,
+                                         "nb_nodes": nb_nodes, "path_map": path_map, "compact": True})
+        ride_vehicle = solution.RideVehicle(**{**RIDE_VEHICLE_PARAM, "nb_passengers": NB_PASSENGERS,
+                                               "nb_vehicles": NB_VEHICLES, "nb_nodes": nb_nodes, "path_map": path_map})
+        drive = solution.DrivePath(**{**DRIVE_PARAM, "nb_vehicles": NB_VEHICLES,
+                                      "nb_nodes": nb_nodes, "path_map": path_map, "compact": True})
+        self.assertEqual(ride_path.nodes.dtype, np.int8)
+        ride_path.nodes[:] = self.rng.integers(
+            0, nb_nodes, ride_path.nodes.shape)
+        drive.nodes[:] = self.rng.integers(0, nb_nodes, drive.nodes.shape)
+        ride_vehicle.solution = self.rng.integers(
+            -1, NB_VEHICLES, (NB_PASSENGERS, NB_STEPS))
+        evaluator = incremental.RideVehicleEvaluator(
+            ride_vehicle, ride_path, drive, False, False, False, True)
+        for _ in range(200):
+            choice = self.rng.integers(3)
+            if choice == 0:
+                ride_path.set_cells(self.rng.integers(NB_PASSENGERS), self.rng.integers(NB_STEPS),
+                                    self.rng.integers(0, nb_nodes, 2))
+            elif choice == 1:
+                drive.set_cells(self.rng.integers(NB_VEHICLES), self.rng.integers(NB_STEPS),
+                                self.rng.integers(0, nb_nodes, 2))
+            else:
+                ride_vehicle.set_cells(self.rng.integers(NB_PASSENGERS), self.rng.integers(NB_STEPS),
+                                       self.rng.integers(-1, NB_VEHICLES))
+            self.assertEqual(bool(ride_vehicle.check_constraint(ride_path, drive, False, False, False, True)),
+                             evaluator.check_constraint())
+
+    def test_close(self):
+        """Check that a closed evaluator is not notified anymore
+        """
+        evaluator = incremental.RidePathEvaluator(self.ride_path)
+        evaluator.close()
+        self.assertEqual(self.ride_path._listeners, [])
@@ -0,0 +1,87 @@
+# tests/test_population.py
+
+""" Population evaluator tests
+"""
+
+import unittest
+import numpy as np
+
+from vehicle_carpooling import incremental, population, score, solution
+from tests.test_solution import RIDE_PATH_PARAM, RIDE_VEHICLE_PARAM, DRIVE_PARAM, NB_NODES, NB_STEPS
+from tests.test_score import TIME_MAP
+
+NB_PASSENGERS = 3
+NB_VEHICLES = 2
+NB_CANDIDATES = 50
+ALPHA = 0.25
+
+
+class TestPopulationEvaluator(unittest.TestCase):
+    """Population evaluator tests
+    """
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        ride_path_param = RIDE_PATH_PARAM.copy()
+        ride_path_param["nb_passengers"] = NB_PASSENGERS
+        ride_path_param["nb_vehicles"] = NB_VEHICLES
+        ride_vehicle_param = RIDE_VEHICLE_PARAM.copy()
+        ride_vehicle_param["nb_passengers"] = NB_PASSENGERS
+        ride_vehicle_param["nb_vehicles"] = NB_VEHICLES
+        drive_param = DRIVE_PARAM.copy()
+        drive_param["nb_vehicles"] = NB_VEHICLES
+        self.ride_path = solution.RidePath(**ride_path_param)
+        self.ride_vehicle = solution.RideVehicle(**ride_vehicle_param)
+        self.drive = solution.DrivePath(**drive_param)
+        self.ride_paths = self.rng.integers(
+            0, NB_NODES, (NB_CANDIDATES, NB_PASSENGERS, NB_STEPS, 2))
+        self.ride_vehicles = self.rng.integers(
+            -1, NB_VEHICLES, (NB_CANDIDATES, NB_PASSENGERS, NB_STEPS))
+        self.drives = self.rng.integers(
+            0, NB_NODES, (NB_CANDIDATES, NB_VEHICLES, NB_STEPS, 2))
+
+    def test_evaluate(self):
+        """Check the evaluation of a population against the evaluation of each candidate
+
+        Tests:
+            - The violated constraints are the ones of check_constraint
+            - The violating units are the ones of the incremental evaluators
+            - The scores are the ones of score.compute_score
+        """
+        evaluator = population.PopulationEvaluator(
+            self.ride_path, self.ride_vehicle, self.drive, TIME_MAP, ALPHA)
+        result = evaluator.evaluate(
+            self.ride_paths, self.ride_vehicles, self.drives)
+        for candidate in range(NB_CANDIDATES):
+            self.ride_path.solution = self.ride_paths[candidate]
+            self.ride_vehicle.solution = self.ride_vehicles[candidate]
+            self.drive.solution = self.drives[candidate]
+            self.ride_path.check_constraint()
+            self.drive.check_constraint()
+            self.ride_vehicle.check_constraint(self.ride_path, self.drive)
+            self.assertEqual(result["violation_count"][candidate], self.ride_path.violation_count +
+                             self.drive.violation_count + self.ride_vehicle.violation_count)
+            for prefix, evaluator_class, args in [("ride_path.", incremental.RidePathEvaluator, [self.ride_path]),
+                                                  ("drive.", incremental.DrivePathEvaluator, [self.drive]),
+                                                  ("ride_vehicle.", incremental.RideVehicleEvaluator,
+                                                   [self.ride_vehicle, self.ride_path, self.drive])]:
+                incremental_evaluator = evaluator_class(*args)
+                for name, units in incremental_evaluator.violations.items():
+                    self.assertEqual(
+                        result["violations"][prefix + name][candidate], units)
+                incremental_evaluator.close()
+            self.assertAlmostEqual(result["score"][candidate], score.compute_score(
+                self.ride_path, self.ride_vehicle, TIME_MAP, ALPHA))
+
+    def test_evaluate_ride_paths(self):
+        """Check the evaluation of ride paths only
+
+        Tests:
+            - Only the RidePath constraints are evaluated, without score
+        """
+        evaluator = population.PopulationEvaluator(self.ride_path)
+        result = evaluator.evaluate(self.ride_paths)
+        self.assertEqual(sorted(result["violations"]), [
+            "ride_path.continuous", "ride_path.limit_vehicle", "ride_path.path", "ride_path.start_finish"])
+        self.assertEqual(result["violation_count"].shape, (NB_CANDIDATES,))
+        self.assertNotIn("score", result)
@@ -0,0 +1,104 @@
+# tests/test_score.py
+
+""" Score tests
+"""
+
+import unittest
+import numpy as np
+
+from vehicle_carpooling import score, solution
+from vehicle_carpooling.utils import graphs
+from tests.test_solution import RIDE_PATH_PARAM, RIDE_VEHICLE_PARAM, PATH_MAP, NB_NODES, NB_STEPS
+
+NB_PASSENGERS = 3
+NB_VEHICLES = 2
+ALPHA = 0.25
+
+TIME_MAP = np.array([[0, 1, 2, 0],
+                     [1, 0, 3, 4],
+                     [2, 3, 0, 5],
+                     [0, 4, 5, 0]])
+
+
+class TestScore(unittest.TestCase):
+    """Score tests
+    """
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        ride_path_param = RIDE_PATH_PARAM.copy()
+        ride_path_param["nb_passengers"] = NB_PASSENGERS
+        ride_path_param["nb_vehicles"] = NB_VEHICLES
+        ride_vehicle_param = RIDE_VEHICLE_PARAM.copy()
+        ride_vehicle_param["nb_passengers"] = NB_PASSENGERS
+        ride_vehicle_param["nb_vehicles"] = NB_VEHICLES
+        self.ride_path = solution.RidePath(**ride_path_param)
+        self.ride_vehicle = solution.RideVehicle(**ride_vehicle_param)
+        self.ride_path.solution = np.array([[[0, 1], [1, 1]],
+                                            [[1, 2], [2, 2]],
+                                            [[1, 1], [1, 3]]])
+        self.ride_vehicle.solution = np.array([[0, -1],
+                                               [0, -1],
+                                               [-1, 1]])
+
+    def test_compute_score(self):
+        """Check the score of a solution
+
+        Tests:
+            - The travel time only counts the moving cells
+            - The vehicles in use are counted once per step
+        """
+        self.assertEqual(score.get_travel_times(self.ride_path.solution, TIME_MAP).tolist(),
+                         [[1, 0], [3, 0], [0, 4]])
+        self.assertEqual(score.get_vehicles_in_use(
+            self.ride_vehicle.solution, NB_VEHICLES).tolist(), [1, 1])
+        self.assertEqual(score.compute_score(self.ride_path, self.ride_vehicle, TIME_MAP, ALPHA),
+                         0.75 * 8 + 0.25 * 2)
+        # sparse time map and stacked solutions
+        time_graph = graphs.SparseGraph.from_dense(PATH_MAP, TIME_MAP)
+        self.assertEqual(score.get_travel_times(self.ride_path.solution, time_graph).tolist(),
+                         [[1, 0], [3, 0], [0, 4]])
+        stacked = np.stack([self.ride_vehicle.solution,
+                            np.full((NB_PASSENGERS, NB_STEPS), -1)])
+        self.assertEqual(score.get_vehicles_in_use(
+            stacked, NB_VEHICLES).tolist(), [[1, 1], [0, 0]])
+
+    def test_score_evaluator(self):
+        """Check that the evaluator follows the changes of the solutions
+
+        Tests:
+            - The delta of a move is the change of the score
+            - After each move, the score is the computed score
+            - On a compact ride path, the delta covers the neighbouring cells
+        """
+        compact_ride_path_param = RIDE_PATH_PARAM.copy()
+        compact_ride_path_param["nb_passengers"] = NB_PASSENGERS
+        compact_ride_path_param["nb_vehicles"] = NB_VEHICLES
+        compact_ride_path = solution.RidePath(
+            **compact_ride_path_param, compact=True)
+        compact_ride_path.set_node_sequence(
+            self.ride_path.get_node_sequence().copy())
+        for ride_path in [self.ride_path, compact_ride_path]:
+            with self.subTest(compact=ride_path.compact):
+                evaluator = score.ScoreEvaluator(
+                    ride_path, self.ride_vehicle, TIME_MAP, ALPHA)
+                for _ in range(200):
+                    passenger = self.rng.integers(NB_PASSENGERS)
+                    step = self.rng.integers(NB_STEPS)
+                    previous_score = evaluator.score
+                    if self.rng.integers(2):
+                        value = self.rng.integers(0, NB_NODES, 2)
+                        delta = evaluator.ride_path_delta(
+                            passenger, step, value)
+                        ride_path.set_cells(passenger, step, value)
+                    else:
+                        value = self.rng.integers(-1, NB_VEHICLES)
+                        delta = evaluator.ride_vehicle_delta(
+                            passenger, step, value)
+                        self.ride_vehicle.set_cells(passenger, step, value)
+                    self.assertAlmostEqual(
+                        evaluator.score, previous_score + delta)
+                    self.assertAlmostEqual(evaluator.score, score.compute_score(
+                        ride_path, self.ride_vehicle, TIME_MAP, ALPHA))
+                evaluator.close()
+                self.assertEqual(ride_path._listeners, [])
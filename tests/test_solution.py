@@ -5,10 +5,13 @@
 
 import unittest
 import copy
+import pickle
+import tempfile
 import numpy as np
 
 
-from vehicle_carpooling import solution
+from vehicle_carpooling import incremental, problem, solution
+from vehicle_carpooling.utils import cache, graphs, trees, workers
 from tests.utils import matrix_utils
 
 # Object arguments for tests
@@ -68,7 +71,134 @@ matrix_u = matrix_utils.MatrixUtils(NB_STEPS, NB_NODES, NB_ENTITY)
 class TestSolution(unittest.TestCase):
     """ Solution class tests
     """
-    ...
+
+    def test_shared_topology(self):
+        """Check that the solutions of a problem share the same topology
+
+        Tests:
+            - The solutions hold the problem topology
+            - The topology cannot be modified
+        """
+        prob = problem.Problem(NB_NODES, NB_VEHICLES, VEHICLE_CAPACITY, NB_PASSENGERS, NB_STEPS, PATH_MAP, PATH_MAP,
+                               PASSENGER_START_POINTS, PASSENGER_FINISH_POINTS, VEHICLE_START_POINTS, 0)
+        drive_param = DRIVE_PARAM.copy()
+        drive_param["path_map"] = None
+        drive = solution.DrivePath(**drive_param, topology=prob.topology)
+        ride_vehicle = solution.RideVehicle(
+            **RIDE_VEHICLE_PARAM, topology=prob.topology)
+        self.assertIs(drive.topology, prob.topology)
+        self.assertIs(drive.next_nodes, ride_vehicle.next_nodes)
+        self.assertIs(drive.path_map, PATH_MAP)
+        with self.assertRaises(AttributeError):
+            prob.topology.path_map = None
+
+    def test_copy(self):
+        """Check that copying a solution only duplicates the assignment arrays
+
+        Tests:
+            - The copy shares the topology and the computed solutions
+            - Changing the copy does not change the solution
+        """
+        drive = solution.DrivePath(**DRIVE_PARAM)
+        drive.shuffle(1)
+        neighbor = drive.copy()
+        self.assertIs(neighbor.topology, drive.topology)
+        self.assertIs(neighbor.solutions_pe, drive.solutions_pe)
+        neighbor.solution[0, 0] = [3, 3]
+        self.assertFalse(np.array_equal(neighbor.solution, drive.solution))
+        pickled = pickle.loads(pickle.dumps(drive))
+        self.assertTrue(np.array_equal(pickled.solution, drive.solution))
+        self.assertEqual(pickled.next_nodes, drive.next_nodes)
+
+    def test_move_rollback(self):
+        """Check that in place moves can be undone
+
+        Tests:
+            - rollback restores the solution and the incremental evaluator
+            - commit keeps the moves
+        """
+        np.random.seed(0)
+        drive = solution.DrivePath(**DRIVE_PARAM)
+        drive.shuffle(1)
+        evaluator = incremental.DrivePathEvaluator(drive)
+        before = drive.solution.copy()
+        violations = evaluator.violations.copy()
+        drive.move(1, 1)
+        self.assertFalse(np.array_equal(drive.solution, before))
+        drive.move(1, 1)
+        drive.rollback()
+        self.assertTrue(np.array_equal(drive.solution, before))
+        self.assertEqual(evaluator.violations, violations)
+        drive.move(1, 1)
+        after = drive.solution.copy()
+        drive.commit()
+        drive.rollback()
+        self.assertTrue(np.array_equal(drive.solution, after))
+
+    def test_generator_neighbor(self):
+        """Check the bulk sampled neighbors
+
+        Tests:
+            - The same generator seed gives the same neighbor
+            - The neighbor is still continuous
+            - The bulk sampled shuffle gives a valid drive path
+        """
+        drive_param = DRIVE_PARAM.copy()
+        drive_param["nb_vehicles"] = 2
+        drive_param["nb_steps"] = 5
+        drive = solution.DrivePath(**drive_param)
+        drive.shuffle(1, np.random.default_rng(0))
+        self.assertTrue(drive.check_constraint())
+        neighbor = drive.get_neighbor(0.5, 1, np.random.default_rng(1))
+        same_neighbor = drive.get_neighbor(0.5, 1, np.random.default_rng(1))
+        self.assertTrue(np.array_equal(
+            neighbor.solution, same_neighbor.solution))
+        self.assertFalse(np.array_equal(neighbor.solution, drive.solution))
+        self.assertTrue(neighbor.check_constraint(False, False, True))
+
+    def test_compact_path(self):
+        """Check the node sequence encoding of the paths
+
+        Tests:
+            - The nodes use the smallest integer dtype
+            - Writing an edge keeps the path continuous
+            - The constraint checks, copies and pickles work on the edge view
+        """
+        drive = solution.DrivePath(**DRIVE_PARAM, compact=True)
+        self.assertEqual(drive.nodes.shape, (NB_VEHICLES, NB_STEPS + 1))
+        self.assertEqual(drive.nodes.dtype, np.int8)
+        evaluator = incremental.DrivePathEvaluator(drive)
+        drive.set_cells(0, 0, [0, 1])
+        drive.set_cells(0, 1, [2, 2])
+        self.assertEqual(drive.nodes.tolist(), [[0, 2, 2]])
+        self.assertTrue(drive.check_constraint(False, False, True))
+        self.assertEqual(evaluator.violation_count, drive.violation_count)
+        drive.set_node_sequence(np.array([[0, 1, 3]], dtype=np.int8))
+        self.assertEqual(drive.solution.tolist(), [[[0, 1], [1, 3]]])
+        neighbor = drive.copy()
+        neighbor.set_cells(0, 1, [1, 2])
+        self.assertEqual(drive.nodes.tolist(), [[0, 1, 3]])
+        self.assertEqual(neighbor.nodes.tolist(), [[0, 1, 2]])
+        pickled = pickle.loads(pickle.dumps(drive))
+        pickled.set_cells(0, 0, [1, 2])
+        self.assertEqual(pickled.solution.tolist(), [[[1, 2], [2, 3]]])
+
+    def test_tree_move_rollback(self):
+        """Check that tree moves can be undone
+
+        Tests:
+            - rollback restores the solution and the computed solution indexes
+        """
+        drive = solution.DrivePath(**DRIVE_PARAM)
+        drive.solutions_pe[0] = [[[0, 1], [1, 1]], [[0, 2], [2, 2]]]
+        drive.solutions_pe_index[0] = 0
+        drive.solution[0] = drive.solutions_pe[0][0]
+        drive.tree_move(1)
+        self.assertEqual(drive.solutions_pe_index[0], 1)
+        self.assertEqual(drive.solution[0].tolist(), [[0, 2], [2, 2]])
+        drive.rollback()
+        self.assertEqual(drive.solutions_pe_index[0], 0)
+        self.assertEqual(drive.solution[0].tolist(), [[0, 1], [1, 1]])
 
 
 class TestRidePath(unittest.TestCase):
@@ -125,6 +255,183 @@ class TestRidePath(unittest.TestCase):
         self.assertFalse(ride.check_constraint(
             False, True, False, False))
 
+    def test_path_constraint_sparse_graph(self):
+        """Check the path constraint on a sparse map
+
+        Tests:
+            - If passenger is on path then true
+            - If passenger is not on path then false
+        """
+        ride_param = RIDE_PATH_PARAM.copy()
+        ride_param["path_map"] = graphs.SparseGraph.from_dense(PATH_MAP)
+        ride = solution.RidePath(**ride_param)
+        ride.solution = matrix_u.make_matrix(
+            [[(0, 0, 1), (1, 1, 1)], [(0, 1, 1), (1, 1, 2)]])
+        self.assertTrue(ride.check_constraint(
+            False, True, False, False))
+        ride.solution = matrix_u.make_matrix(
+            [[(0, 0, 3), (1, 3, 1)], [(0, 1, 1), (1, 1, 2)]])
+        self.assertFalse(ride.check_constraint(
+            False, True, False, False))
+        ride.vectorized = False
+        self.assertFalse(ride.check_constraint(
+            False, True, False, False))
+
+    def test_trip_cache(self):
+        """Check that the trips are read back from the trip cache
+
+        Tests:
+            - The cached trips are the computed trips
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            ride_param = RIDE_PATH_PARAM.copy()
+            ride_param["trip_cache"] = cache.TripCache(directory)
+            ride = solution.RidePath(**ride_param)
+            self.assertEqual(len(ride_param["trip_cache"]), NB_PASSENGERS)
+            cached_ride = solution.RidePath(**ride_param)
+            for passenger in range(NB_PASSENGERS):
+                self.assertEqual(cached_ride.solutions_pe[passenger].nodes().tolist(),
+                                 ride.solutions_pe[passenger].nodes().tolist())
+
+    def test_trip_pool(self):
+        """Check that the passengers with the same OD pair share their trips
+
+        Tests:
+            - Each distinct OD pair is stored once in the pool
+            - The passengers with the same OD pair get the same trips
+        """
+        ride_param = RIDE_PATH_PARAM.copy()
+        ride_param["nb_passengers"] = 3
+        ride_param["passenger_start_points"] = np.array([0, 1, 0])
+        ride_param["passenger_finish_points"] = np.array([1, 2, 1])
+        ride = solution.RidePath(**ride_param)
+        self.assertEqual(len(ride.trip_pool.ranges), 2)
+        self.assertEqual(len(ride.trip_pool), 7)
+        self.assertEqual(ride.trip_ranges[0].tolist(),
+                         ride.trip_ranges[2].tolist())
+        self.assertEqual(sorted(trip.tolist() for trip in ride.solutions_pe[0]), [
+            [[0, 0], [0, 1]], [[0, 1], [1, 1]], [[0, 2], [2, 1]]])
+        ride.tree_suffle()
+        self.assertTrue(ride.check_constraint(True, True, True, False))
+        for passenger in range(3):
+            self.assertEqual(ride.solution[passenger].tolist(),
+                             ride.solutions_pe[passenger][ride.solutions_pe_index[passenger]].tolist())
+        ride.tree_move(1)
+        self.assertTrue(ride.check_constraint(True, True, True, False))
+        ride.rollback()
+        self.assertEqual(ride.solution[1].tolist(),
+                         ride.solutions_pe[1][ride.solutions_pe_index[1]].tolist())
+
+    def test_trip_tree(self):
+        """Check the trip trees of the passengers
+
+        Tests:
+            - The tree is built once per OD pair and shared by the copies
+            - The tree walks give the trips of the passenger
+        """
+        ride_param = RIDE_PATH_PARAM.copy()
+        ride_param["nb_passengers"] = 3
+        ride_param["passenger_start_points"] = np.array([0, 1, 0])
+        ride_param["passenger_finish_points"] = np.array([1, 2, 1])
+        ride = solution.RidePath(**ride_param)
+        tree = ride.trip_tree(0)
+        self.assertIs(ride.trip_tree(2), tree)
+        self.assertIs(ride.copy().trip_tree(0), tree)
+        tree_paths = trees.get_all_tree_paths(tree)
+        self.assertEqual(sorted(trees.get_solution_from_tree(tree, tree_path) for tree_path in tree_paths),
+                         [[[0, 0], [0, 1]], [[0, 1]], [[0, 2], [2, 1]]])
+        self.assertIn(trees.get_tree_neighbor(tree, tree_paths[0], 0), tree_paths)
+
+    def test_trip_spill(self):
+        """Check that a spilled trip pool gives the same solutions
+
+        Tests:
+            - The trip pool is stored in files above the threshold
+            - The solutions are the in-memory solutions
+        """
+        ride_param = RIDE_PATH_PARAM.copy()
+        ride = solution.RidePath(**ride_param)
+        ride_param["trip_spill_threshold"] = 0
+        spilled_ride = solution.RidePath(**ride_param)
+        self.assertTrue(spilled_ride.trip_pool.spilled)
+        for passenger in range(NB_PASSENGERS):
+            self.assertEqual(spilled_ride.solutions_pe[passenger].nodes().tolist(),
+                             ride.solutions_pe[passenger].nodes().tolist())
+        spilled_ride.tree_suffle()
+        self.assertTrue(spilled_ride.check_constraint(True, True, True, False))
+
+    def test_streaming(self):
+        """Check that the trips computed in the background are added to the solutions
+
+        Tests:
+            - Each passenger starts with its shortest trip
+            - The solutions are the computed trips once all the trips are added
+        """
+        ride_param = RIDE_PATH_PARAM.copy()
+        ride = solution.RidePath(**ride_param)
+        ride_param["streaming"] = True
+        streaming_ride = solution.RidePath(**ride_param)
+        self.assertEqual(streaming_ride.solutions_pe[1].nodes().tolist(), [
+            [1, 2, 2]])
+        streaming_ride.tree_suffle()
+        self.assertTrue(streaming_ride.check_constraint(
+            True, True, True, False))
+        self.assertTrue(streaming_ride.poll_solutions(wait=True))
+        for passenger in range(NB_PASSENGERS):
+            self.assertEqual(streaming_ride.solutions_pe[passenger].nodes().tolist(),
+                             ride.solutions_pe[passenger].nodes().tolist())
+
+    def test_streaming_indexes(self):
+        """Check that the trip indexes follow the trips added in the background
+
+        Tests:
+            - After the trips are added, the index of each passenger gives its current trip
+            - A copy made before the trips are added is remapped too
+        """
+        # the direct paths are the slowest, the shortest trips are not the first ones
+        time_map = np.ones(PATH_MAP.shape)
+        time_map[[0, 1], [1, 2]] = 10
+        ride_param = RIDE_PATH_PARAM.copy()
+        ride_param["path_map"] = graphs.SparseGraph.from_dense(PATH_MAP, time_map)
+        ride_param["nb_trips"] = 3
+        ride_param["time_ranking"] = True
+        ride_param["streaming"] = True
+        ride_param["executor"] = workers.TripExecutor("serial")
+        ride = solution.RidePath(**ride_param)
+        passengers = np.arange(NB_PASSENGERS)
+        # on the shortest trips, without adding the computed trips
+        ride._set_trips(passengers, np.zeros(NB_PASSENGERS, dtype=np.int64))
+        shortest_trips = ride.solution.copy()
+        neighbor = ride.copy()
+        for streaming_ride in [ride, neighbor]:
+            self.assertTrue(streaming_ride.poll_solutions())
+            self.assertEqual(streaming_ride.solution.tolist(), shortest_trips.tolist())
+            for passenger in range(NB_PASSENGERS):
+                self.assertGreater(len(streaming_ride.solutions_pe[passenger]), 1)
+                self.assertEqual(streaming_ride.solutions_pe[passenger][streaming_ride.solutions_pe_index[passenger]].tolist(),
+                                 streaming_ride.solution[passenger].tolist())
+
+    def test_trip_sampling(self):
+        """Check the tree moves on counted trips
+
+        Tests:
+            - The sampled solutions respect the start finish, path and continuous constraints
+            - The tree neighbor is the next trip by rank
+        """
+        ride_param = RIDE_PATH_PARAM.copy()
+        ride_param["trip_sampling"] = True
+        ride = solution.RidePath(**ride_param)
+        self.assertEqual(ride.solutions_pe[0].nb_trips, 3)
+        np.random.seed(0)
+        ride.tree_suffle()
+        self.assertTrue(ride.check_constraint(True, True, True, False))
+        index = ride.solutions_pe_index[1]
+        ride.get_tree_neighbor(1)
+        self.assertEqual(ride.solutions_pe_index[1],
+                         (index + 1) % ride.solutions_pe[1].nb_trips)
+        self.assertEqual(ride.solution[1].tolist(),
+                         ride.solutions_pe[1][ride.solutions_pe_index[1]])
+
     def test_continuous_constraint(self):
         """Check if the path are continuous
 
@@ -165,6 +472,23 @@ class TestRidePath(unittest.TestCase):
         self.assertFalse(ride.check_constraint(
             False, False, False, True))
 
+    def test_vectorized_constraints(self):
+        """Check that the vectorized constraints match the loop constraints
+
+        Tests:
+            - Random solutions give the same check and violation count in both modes
+        """
+        ride = solution.RidePath(**RIDE_PATH_PARAM)
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            ride.solution = rng.integers(0, NB_NODES, (NB_PASSENGERS, NB_STEPS, 2))
+            ride.vectorized = False
+            check = ride.check_constraint()
+            violation_count = ride.violation_count
+            ride.vectorized = True
+            self.assertEqual(bool(ride.check_constraint()), bool(check))
+            self.assertEqual(ride.violation_count, violation_count)
+
 
 class TestRideVehicle(unittest.TestCase):
     """RideVehicle class tests
@@ -302,6 +626,112 @@ class TestRideVehicle(unittest.TestCase):
         self.assertFalse(ride_vehicle.check_constraint(
             ride_path, drive, False, False, False, True))
 
+    def test_vehicle_in_one_edge_constraint_logging(self):
+        """Check that the vehicles in several edges are logged at the debug level
+
+        Tests:
+            - The conflicting vehicle, step and edges are logged
+        """
+        ride_vehicle = solution.RideVehicle(**RIDE_VEHICLE_PARAM)
+        ride_path = solution.RidePath(**RIDE_PATH_PARAM)
+        drive = solution.DrivePath(**DRIVE_PARAM)
+        ride_path.solution = matrix_u.make_matrix(
+            [[(0, 0, 1), (1, 1, 1)], [(0, 1, 2), (1, 2, 2)]]
+        )
+        ride_vehicle.solution = matrix_u.make_vehicle_matrix(
+            [[(0, 0)], [(0, 0)]]
+        )
+        drive.solution = matrix_u.make_matrix(
+            [[(0, 0, 1), (1, 1, 2)]]
+        )
+        with self.assertLogs(solution.logger, "DEBUG") as logs:
+            ride_vehicle.check_constraint(
+                ride_path, drive, False, False, False, True)
+        self.assertEqual(logs.output, [
+            "DEBUG:vehicle_carpooling.solution:Vehicle 0 is in several edges at step 0: [(0, 1), (1, 2)]"])
+
+    def test_vectorized_constraints(self):
+        """Check that the vectorized constraints match the loop constraints
+
+        Tests:
+            - Random solutions give the same check and violation count in both modes
+        """
+        nb_passengers = 3
+        ride_path_param = RIDE_PATH_PARAM.copy()
+        ride_path_param["nb_passengers"] = nb_passengers
+        ride_vehicle_param = RIDE_VEHICLE_PARAM.copy()
+        ride_vehicle_param["nb_passengers"] = nb_passengers
+        ride_vehicle_param["nb_vehicles"] = 2
+        drive_param = DRIVE_PARAM.copy()
+        drive_param["nb_vehicles"] = 2
+        ride_path = solution.RidePath(**ride_path_param)
+        ride_vehicle = solution.RideVehicle(**ride_vehicle_param)
+        drive = solution.DrivePath(**drive_param)
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            ride_path.solution = rng.integers(
+                0, NB_NODES, (nb_passengers, NB_STEPS, 2))
+            ride_vehicle.solution = rng.integers(
+                -1, 3, (nb_passengers, NB_STEPS))
+            drive.solution = rng.integers(0, NB_NODES, (2, NB_STEPS, 2))
+            ride_vehicle.vectorized = False
+            check = ride_vehicle.check_constraint(ride_path, drive)
+            violation_count = ride_vehicle.violation_count
+            ride_vehicle.vectorized = True
+            self.assertEqual(bool(ride_vehicle.check_constraint(
+                ride_path, drive)), bool(check))
+            self.assertEqual(ride_vehicle.violation_count, violation_count)
+
+    def test_compact_one_edge_constraint(self):
+        """Check the one edge constraint on compact paths with int8 nodes
+
+        Tests:
+            - Edges (0, 20) and (8, 28) are different edges on a 30 nodes map
+            - Random compact paths give the same result as the non compact paths in both modes
+        """
+        nb_nodes = 30
+        path_map = np.ones((nb_nodes, nb_nodes), dtype=int)
+        ride_vehicle = solution.RideVehicle(**{**RIDE_VEHICLE_PARAM, "nb_steps": 1,
+                                               "nb_nodes": nb_nodes, "path_map": path_map})
+        ride_path = solution.RidePath(**{**RIDE_PATH_PARAM, "nb_steps": 1, "nb_nodes": nb_nodes,
+                                         "path_map": path_map, "compact": True})
+        drive = solution.DrivePath(**{**DRIVE_PARAM, "nb_steps": 1, "nb_nodes": nb_nodes,
+                                      "path_map": path_map, "compact": True})
+        self.assertEqual(ride_path.nodes.dtype, np.int8)
+        ride_path.nodes[:] = [[8, 28], [1, 1]]
+        drive.nodes[:] = [[0, 20]]
+        ride_vehicle.solution = np.array([[0], [-1]])
+        for vectorized in (True, False):
+            ride_vehicle.vectorized = vectorized
+            self.assertFalse(ride_vehicle.check_constraint(
+                ride_path, drive, False, False, False, True))
+        # random compact paths against the same non compact paths
+        ride_path_param = {**RIDE_PATH_PARAM,
+                           "nb_nodes": nb_nodes, "path_map": path_map}
+        drive_param = {**DRIVE_PARAM,
+                       "nb_nodes": nb_nodes, "path_map": path_map}
+        ride_vehicle = solution.RideVehicle(
+            **{**RIDE_VEHICLE_PARAM, "nb_nodes": nb_nodes, "path_map": path_map})
+        ride_path = solution.RidePath(**ride_path_param)
+        drive = solution.DrivePath(**drive_param)
+        compact_ride_path = solution.RidePath(
+            **ride_path_param, compact=True)
+        compact_drive = solution.DrivePath(**drive_param, compact=True)
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            compact_ride_path.nodes[:] = rng.integers(
+                0, nb_nodes, compact_ride_path.nodes.shape)
+            compact_drive.nodes[:] = rng.integers(
+                0, nb_nodes, compact_drive.nodes.shape)
+            ride_path.set_node_sequence(compact_ride_path.nodes)
+            drive.set_node_sequence(compact_drive.nodes)
+            ride_vehicle.solution = rng.integers(
+                -1, NB_VEHICLES, (NB_PASSENGERS, NB_STEPS))
+            for vectorized in (True, False):
+                ride_vehicle.vectorized = vectorized
+                self.assertEqual(bool(ride_vehicle.check_constraint(compact_ride_path, compact_drive, False, False, False, True)),
+                                 bool(ride_vehicle.check_constraint(ride_path, drive, False, False, False, True)))
+
 
 class TestDrive(unittest.TestCase):
     """Drive class tests
@@ -364,6 +794,23 @@ class TestDrive(unittest.TestCase):
         self.assertFalse(drive.check_constraint(
             False, False, True))
 
+    def test_vectorized_constraints(self):
+        """Check that the vectorized constraints match the loop constraints
+
+        Tests:
+            - Random solutions give the same check and violation count in both modes
+        """
+        drive = solution.DrivePath(**DRIVE_PARAM)
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            drive.solution = rng.integers(0, NB_NODES, (NB_VEHICLES, NB_STEPS, 2))
+            drive.vectorized = False
+            check = drive.check_constraint()
+            violation_count = drive.violation_count
+            drive.vectorized = True
+            self.assertEqual(bool(drive.check_constraint()), bool(check))
+            self.assertEqual(drive.violation_count, violation_count)
+
 
 if __name__ == '__main__':
     unittest.main()
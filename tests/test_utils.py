@@ -1,10 +1,19 @@
 # tests/test_utils.py
 
+import os
+import tempfile
 import unittest
+from unittest import mock
 
 import numpy as np
 
-from vehicle_carpooling.utils import paths, trees
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+from vehicle_carpooling.topology import Topology
+from vehicle_carpooling.utils import cache, graphs, paths, profiling, trees, trips, workers
 
 #   0
 #  / \
@@ -18,6 +27,298 @@ PATH_MAP = np.array([[1, 1, 1, 0],
                      [0, 1, 1, 1]])
 
 
+class TestGraphUtils(unittest.TestCase):
+    """Tests for sparse graph utils
+    """
+
+    def test_from_dense(self):
+        """Tests that a sparse graph gives the same paths as the dense map
+        """
+        graph = graphs.SparseGraph.from_dense(PATH_MAP)
+        self.assertEqual(graph.nb_edges, np.count_nonzero(PATH_MAP))
+        self.assertEqual(paths.get_paths(graph), paths.get_paths(PATH_MAP))
+        self.assertEqual(paths.get_next_paths(graph),
+                         paths.get_next_paths(PATH_MAP))
+        self.assertEqual(paths.get_next_nodes(graph),
+                         paths.get_next_nodes(PATH_MAP))
+
+    def test_has_edge(self):
+        """Tests the vectorized edge lookup, negative nodes are wrapped like numpy indexes
+        """
+        graph = graphs.SparseGraph.from_dense(PATH_MAP)
+        rows, cols = np.indices(PATH_MAP.shape) - 1
+        self.assertTrue(np.array_equal(
+            graph[rows, cols], PATH_MAP[rows, cols].astype(bool)))
+
+    @unittest.skipIf(sparse is None, "scipy is not installed")
+    def test_from_sparse(self):
+        """Tests that a graph created from scipy sparse matrices is the graph of the dense maps
+        """
+        time_map = PATH_MAP * (1 + np.arange(PATH_MAP.size).reshape(PATH_MAP.shape))
+        expected = graphs.SparseGraph.from_dense(PATH_MAP, time_map)
+        graph = graphs.SparseGraph.from_sparse(
+            sparse.csr_matrix(PATH_MAP), sparse.csr_matrix(time_map))
+        self.assertEqual(graph.indptr.tolist(), expected.indptr.tolist())
+        self.assertEqual(graph.indices.tolist(), expected.indices.tolist())
+        self.assertEqual(graph.times.tolist(), expected.times.tolist())
+        rows, cols = np.indices(PATH_MAP.shape)
+        self.assertTrue(np.array_equal(
+            graph.has_edge(rows, cols), expected.has_edge(rows, cols)))
+        # the explicit zeros are not paths
+        matrix = sparse.csr_matrix(PATH_MAP)
+        matrix.data[0] = 0
+        self.assertEqual(graphs.SparseGraph.from_sparse(matrix).nb_edges,
+                         expected.nb_edges - 1)
+
+    def test_from_edges(self):
+        """Tests a graph created from an edge list with travel times
+        """
+        graph = graphs.SparseGraph.from_edges(
+            3, [(2, 0), (0, 1), (1, 2)], times=[3., 1., 2.])
+        self.assertEqual(graph.indptr.dtype, np.int32)
+        self.assertEqual(graph.neighbors(0).tolist(), [1])
+        self.assertTrue(np.array_equal(
+            graph.edge_times([0, 1, 2], [1, 2, 0]), [1., 2., 3.]))
+        self.assertTrue(np.isnan(graph.edge_times(0, 2)))
+
+
+class TestCacheUtils(unittest.TestCase):
+    """Tests the trip cache utils
+    """
+
+    def test_fingerprint(self):
+        """Tests that the fingerprints only match for the same values
+        """
+        graph = graphs.SparseGraph.from_dense(PATH_MAP)
+        self.assertEqual(cache.get_fingerprint(graph, 1, None),
+                         cache.get_fingerprint(graphs.SparseGraph.from_dense(PATH_MAP), 1, None))
+        self.assertNotEqual(cache.get_fingerprint(graph, 1, None),
+                            cache.get_fingerprint(graph, 2, None))
+        self.assertNotEqual(cache.get_fingerprint(PATH_MAP),
+                            cache.get_fingerprint(PATH_MAP.astype(np.uint8)))
+
+    def test_trip_cache(self):
+        """Tests storing, memory-mapping and evicting trips
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            trip_cache = cache.TripCache(directory)
+            self.assertIsNone(trip_cache.get("a"))
+            trips = np.array([[0, 1, 3], [0, 2, 3]], dtype=np.uint8)
+            trip_cache.put("a", trips)
+            cached = trip_cache.get("a")
+            self.assertIsInstance(cached, np.memmap)
+            np.testing.assert_array_equal(cached, trips)
+            del cached
+            size = os.path.getsize(os.path.join(directory, "a.npy"))
+            trip_cache = cache.TripCache(directory, max_bytes=2 * size)
+            trip_cache.put("b", trips)
+            # make a the most recently used
+            os.utime(os.path.join(directory, "b.npy"), (0, 0))
+            trip_cache.get("a")
+            trip_cache.put("c", trips)
+            self.assertEqual(len(trip_cache), 2)
+            self.assertIsNone(trip_cache.get("b"))
+            self.assertIsNotNone(trip_cache.get("a"))
+            trip_cache.clear()
+            self.assertEqual(len(trip_cache), 0)
+
+    def test_trip_cache_index(self):
+        """Tests that the cache directory is only scanned when it is full
+
+        Tests:
+            - The puts below max_bytes do not scan the directory
+            - The cache keeps at most max_bytes
+        """
+        trips = np.array([[0, 1, 3], [0, 2, 3]], dtype=np.uint8)
+        with tempfile.TemporaryDirectory() as directory:
+            trip_cache = cache.TripCache(directory)
+            trip_cache.put("a", trips)
+            size = os.path.getsize(os.path.join(directory, "a.npy"))
+            trip_cache = cache.TripCache(directory, max_bytes=3 * size)
+            with mock.patch.object(trip_cache, "_files", wraps=trip_cache._files) as files:
+                for key in "bc":
+                    trip_cache.put(key, trips)
+                # the first put reads the directory
+                self.assertEqual(files.call_count, 1)
+                trip_cache.put("b", trips)
+                self.assertEqual(files.call_count, 1)
+                trip_cache.put("d", trips)
+                self.assertEqual(files.call_count, 2)
+            self.assertEqual(len(trip_cache), 3)
+            self.assertEqual(trip_cache._total, 3 * size)
+
+
+class TestTripUtils(unittest.TestCase):
+    """Tests the trip storage utils
+    """
+
+    def test_trip_pool(self):
+        """Tests that the trips of an OD pair are stored once
+        """
+        pool = trips.TripPool(2, np.int8)
+        self.assertEqual(pool.add((0, 3), [[0, 1, 3], [0, 2, 3]]), (0, 2))
+        self.assertEqual(pool.add((1, 3), [[1, 3, 3]]), (2, 3))
+        self.assertEqual(pool.add((0, 3), [[0, 1, 3]]), (0, 2))
+        self.assertIn((1, 3), pool)
+        self.assertEqual(len(pool), 3)
+        self.assertEqual(pool.nodes.dtype, np.int8)
+        # the padding is not stored
+        self.assertEqual(pool.nodes.tolist(), [0, 1, 3, 0, 2, 3, 1, 3])
+        self.assertEqual(pool.offsets.tolist(), [0, 3, 6, 8])
+        self.assertEqual(pool.gather([2, 0]).tolist(), [[1, 3, 3], [0, 1, 3]])
+        self.assertEqual([trip.tolist() for trip in pool.trips((1, 3))], [
+                         [[1, 3], [3, 3]]])
+        self.assertEqual(pool.add((1, 3), [[1, 1, 3]], replace=True), (3, 4))
+
+    def test_trip_pool_spill(self):
+        """Tests that a trip pool above its threshold is stored in files
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            pool = trips.TripPool(2, np.int8, spill_threshold=32,
+                                  spill_directory=directory)
+            pool.add((0, 3), [[0, 1, 3], [0, 2, 3]])
+            self.assertFalse(pool.spilled)
+            pool.add((1, 3), [[1, 3, 3]])
+            self.assertTrue(pool.spilled)
+            pool.add((2, 3), [[2, 3, 3]])
+            self.assertIsInstance(pool.nodes, np.memmap)
+            self.assertEqual(pool.nodes.tolist(), [0, 1, 3, 0, 2, 3, 1, 3, 2, 3])
+            self.assertEqual(pool.offsets.tolist(), [0, 3, 6, 8, 10])
+            self.assertEqual(pool.gather([3, 0]).tolist(), [[2, 3, 3], [0, 1, 3]])
+            spill_directory = pool.directory
+            del pool
+            self.assertFalse(os.path.exists(spill_directory))
+
+    def test_trip_lengths(self):
+        """Tests the lengths of padded trips
+        """
+        self.assertEqual(trips.get_trip_lengths(
+            [[0, 1, 3, 3], [0, 0, 1, 3], [2, 2, 2, 2]]).tolist(), [3, 4, 1])
+
+
+class TestWorkerUtils(unittest.TestCase):
+    """Tests the parallel trip computation utils
+    """
+
+    def test_trip_executor(self):
+        """Tests that the backends compute the same trips
+        """
+        topology = Topology(PATH_MAP)
+        od_pairs = [(0, 3), (1, 2), (3, 0), (2, 2)]
+        settings = dict(k=None, time_map=None, time_budget=None)
+        with workers.TripExecutor("serial") as executor:
+            expected = executor.compute_trips(
+                topology, od_pairs, 3, settings, np.int8)
+        self.assertEqual(expected[(2, 2)].tolist(), [[2, 2, 2, 2]])
+        self.assertEqual(sorted(expected[(0, 3)].tolist()), sorted(
+            trip + [3] * (4 - len(trip)) for trip in trees.new_compute_trips(0, 3, 3, paths.get_next_nodes(PATH_MAP))))
+        for backend in ("thread", "process"):
+            with workers.TripExecutor(backend, max_workers=2, chunk_size=1) as executor:
+                actual = executor.compute_trips(
+                    topology, od_pairs, 3, settings, np.int8)
+                # the pool and the shared graph are reused
+                executor.compute_trips(topology, od_pairs, 3, settings)
+            for od_pair in od_pairs:
+                np.testing.assert_array_equal(
+                    actual[od_pair], expected[od_pair])
+
+    def test_trip_executor_error(self):
+        """Tests that the errors of the workers are raised
+        """
+        with workers.TripExecutor("process", max_workers=2, chunk_size=1) as executor:
+            with self.assertRaises(workers.TripEnumerationError):
+                executor.compute_trips(Topology(PATH_MAP), [(0, 3), (1, 3)], 3, dict(
+                    k="a", time_map=None, time_budget=None))
+
+
+class TestProfilingUtils(unittest.TestCase):
+    """Tests the profiling utils
+    """
+
+    def test_profiling(self):
+        """Tests the timers and counters in a profiling block
+        """
+        @profiling.timed("test.function")
+        def function():
+            profiling.count("test.counter", 2)
+        with profiling.profiling():
+            function()
+            function()
+            with profiling.timer("test.block"):
+                pass
+            stats = profiling.get_stats()
+        self.assertEqual(stats["timers"]["test.function"]["calls"], 2)
+        self.assertEqual(stats["timers"]["test.block"]["calls"], 1)
+        self.assertEqual(stats["counters"]["test.counter"], 4)
+        if not profiling.is_enabled():
+            profiling.reset()
+            function()
+            self.assertEqual(profiling.get_stats(), dict(
+                timers=dict(), counters=dict()))
+
+    def test_environment_variable(self):
+        """Tests the parsing of the environment variable
+
+        Tests:
+            - Unset, empty and false values disable the profiling
+            - "1" prints the stats and other values are the export path
+        """
+        for value in [None, "", "0", "false", "FALSE", "no", " No "]:
+            self.assertEqual(profiling._parse_setting(value), (False, None))
+        for value in ["1", "true", "Yes"]:
+            self.assertEqual(profiling._parse_setting(value), (True, None))
+        self.assertEqual(profiling._parse_setting(
+            "stats.json"), (True, "stats.json"))
+
+    def test_collect(self):
+        """Tests that the stats of a worker call are merged back
+        """
+        with profiling.profiling():
+            profiling.count("test.counter")
+            result, stats = profiling.collect(
+                True, trees.compute_solutions, 0, 3, 2, graphs.SparseGraph.from_dense(PATH_MAP))
+            self.assertEqual(profiling.get_stats()["counters"], {
+                             "test.counter": 1})
+            profiling.merge(stats)
+            self.assertEqual(profiling.get_stats()[
+                             "counters"]["trees.trips"], len(result))
+
+
+class TestPathUtils(unittest.TestCase):
+    """Tests for path utils
+    """
+
+    def test_node_sequence(self):
+        """Tests the conversions between node sequences and [from, to] edges
+        """
+        solution = np.array([[[0, 1], [1, 3]], [[2, 2], [2, 1]]])
+        nodes = paths.get_node_sequence(
+            solution, paths.get_node_dtype(4))
+        self.assertEqual(nodes.dtype, np.int8)
+        self.assertEqual(nodes.tolist(), [[0, 1, 3], [2, 2, 1]])
+        self.assertTrue(np.array_equal(paths.get_edge_view(nodes), solution))
+
+    def test_shortest_path(self):
+        """Tests following the hop distances to the finish node
+        """
+        graph = graphs.SparseGraph.from_dense(PATH_MAP)
+        distances = paths.get_hop_distances(graph, 3)
+        self.assertEqual(paths.get_shortest_path(graph, 0, distances), [0, 1, 3])
+        self.assertEqual(paths.get_shortest_path(graph, 3, distances), [3])
+        distances[0] = np.inf
+        self.assertIsNone(paths.get_shortest_path(graph, 0, distances))
+
+    def test_hop_distances(self):
+        """Tests the minimum number of hops to a finish node
+        """
+        next_nodes = {0: [1], 1: [2], 2: [1], 3: [3]}
+        distances = paths.get_hop_distances(next_nodes, 2)
+        self.assertEqual(distances.tolist(), [2, 1, 0, np.inf])
+        graph = graphs.SparseGraph.from_dense(PATH_MAP)
+        self.assertEqual(paths.get_hop_distances(
+            graph, 3).tolist(), [2, 1, 1, 0])
+
+
 class TestTreeUtils(unittest.TestCase):
     """Tests for tree utils
     """
@@ -77,11 +378,69 @@ class TestTreeUtils(unittest.TestCase):
             [1, 3, 2]
         ]
         actual_paths = list(
-            trees.new_rec_compute_trips(start_point, finish_point, nb_steps, next_nodes))
+            trees.new_compute_trips(start_point, finish_point, nb_steps, next_nodes))
         expected_paths.sort()
         actual_paths.sort()
         self.assertEqual(actual_paths, expected_paths)
 
+    def test_compute_k_shortest_trips(self):
+        """Tests the k best trips, ranked by hops or by time
+        """
+        next_nodes = {
+            0: [0, 1, 2],
+            1: [0, 1, 2, 3],
+            2: [0, 1, 2, 3],
+            3: [1, 2, 3]
+        }
+        trips = trees.compute_k_shortest_trips(0, 3, 3, next_nodes, 3)
+        self.assertEqual(len(trips), 3)
+        self.assertEqual(sorted(trips[:2]), [[0, 1, 3], [0, 2, 3]])
+        self.assertEqual(trips[2], [0, 1, 2, 3])
+        self.assertEqual(trees.compute_k_shortest_trips(
+            0, 3, 1, next_nodes, 3), [])
+        time_map = np.ones((4, 4))
+        time_map[0, 1] = 5
+        self.assertEqual(trees.compute_k_shortest_trips(
+            0, 3, 3, next_nodes, 2, time_map), [[0, 2, 3], [0, 2, 1, 3]])
+        graph = graphs.SparseGraph.from_dense(PATH_MAP, time_map)
+        self.assertEqual(trees.compute_k_shortest_trips(
+            0, 3, 3, graph, 2, graph), [[0, 2, 3], [0, 2, 1, 3]])
+
+    def test_trip_dag(self):
+        """Tests the counted trips, by rank and sampled
+        """
+        graph = graphs.SparseGraph.from_dense(PATH_MAP)
+
+        def all_trips(node, nb_steps):
+            if node == 3:
+                return [[node]]
+            if nb_steps == 0:
+                return []
+            return [[node] + trip for next_node in graph.neighbors(node).tolist()
+                    for trip in all_trips(next_node, nb_steps - 1)]
+        dag = trees.TripDAG(0, 3, 3, graph)
+        trips = all_trips(0, 3)
+        self.assertEqual(dag.nb_trips, len(trips))
+        self.assertEqual([dag.trip(rank)
+                         for rank in range(dag.nb_trips)], trips)
+        self.assertEqual(dag[0], [[0, 0], [0, 1], [1, 3]])
+        self.assertEqual(trees.TripDAG(0, 3, 2, graph)[1], [[0, 2], [2, 3]])
+        self.assertFalse(trees.TripDAG(0, 3, 1, graph))
+        rng = np.random.default_rng(0)
+        self.assertIn(dag.sample(rng), trips)
+        with self.assertRaises(IndexError):
+            dag.trip(dag.nb_trips)
+
+    def test_trip_counts_overflow(self):
+        """Tests that the trip counts stay exact beyond the int64 range
+        """
+        counts = trees.compute_trip_counts(graphs.SparseGraph.from_dense(
+            np.ones((4, 4))), 3, 40)
+        self.assertEqual(counts.dtype, object)
+        self.assertEqual(counts[40, 0], (3**40 - 1) // 2)
+        rank = trees.random_rank(counts[40, 0], np.random.default_rng(0))
+        self.assertTrue(0 <= rank < counts[40, 0])
+
     def test_compute_tree_trips(self):
         """Tests compute tree trips funciton
         """
@@ -226,6 +585,57 @@ class TestTreeUtils(unittest.TestCase):
         self.assertTrue(neighbor_tree_path_y == [
                         1, 1, 1] or neighbor_tree_path_y == [1, 2, 1])
 
+    def test_flat_tree(self):
+        """Tests the flat array tree
+        """
+        tree = [
+            0,
+            [1,
+             [1,
+              [3]
+              ],
+             [2,
+              [3]
+              ]
+             ],
+            [3]
+        ]
+        flat_tree = trees.FlatTree.from_nested(tree)
+        self.assertEqual(flat_tree.nodes.tolist(), [0, 1, 3, 1, 2, 3, 3])
+        self.assertEqual(flat_tree.parents.tolist(), [-1, 0, 0, 1, 1, 3, 4])
+        self.assertEqual(flat_tree.first_children.tolist(),
+                         [1, 3, -1, 5, 6, -1, -1])
+        self.assertEqual(flat_tree.depths.tolist(), [0, 1, 1, 2, 2, 3, 3])
+        self.assertEqual(flat_tree.to_nested(), tree)
+        self.assertEqual(flat_tree.walk([1, 2, 1]), 6)
+        self.assertEqual(flat_tree.get_tree_path(6), [1, 2, 1])
+        self.assertEqual(trees.get_solution_from_tree(flat_tree, [1, 2, 1]), [
+                         [0, 1], [1, 2], [2, 3]])
+        self.assertEqual(trees.get_tree_neighbor(flat_tree, [1, 1, 1], 1), [1, 2, 1])
+        self.assertEqual(trees.get_tree_neighbor(flat_tree, [1, 2, 1], 0), [2])
+        self.assertEqual(len(trees.FlatTree.from_nested([])), 0)
+
+    def test_compute_flat_tree_trips(self):
+        """Tests that the flat tree is the tree of compute_tree_trips
+
+        Tests:
+            - Same tree nodes in the same order, with a dict or a SparseGraph
+            - Empty tree without trips
+        """
+        next_nodes = paths.get_next_nodes(PATH_MAP)
+        for nb_steps in range(1, 5):
+            expected = trees.FlatTree.from_nested(
+                trees.compute_tree_trips(0, 3, nb_steps, next_nodes))
+            for graph in [next_nodes, graphs.SparseGraph.from_dense(PATH_MAP)]:
+                flat_tree = trees.compute_flat_tree_trips(0, 3, nb_steps, graph)
+                self.assertEqual(flat_tree.to_nested(), expected.to_nested())
+                self.assertEqual(flat_tree.first_children.tolist(),
+                                 expected.first_children.tolist())
+                self.assertEqual(flat_tree.depths.tolist(),
+                                 expected.depths.tolist())
+        self.assertEqual(len(trees.compute_flat_tree_trips(0, 3, 1, next_nodes)), 0)
+        self.assertEqual(len(trees.compute_flat_tree_trips(3, 3, 2, next_nodes)), 0)
+
     def test_get_all_tree_paths(self):
         """Test private function get all tree paths
         """
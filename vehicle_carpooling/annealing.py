@@ -0,0 +1,528 @@
+# vehicle_carpooling/annealing.py
+
+"""Defines the simulated annealing and parallel tempering solvers
+
+The solver moves the RidePath, DrivePath and RideVehicle solutions of a
+problem in place and keeps or undoes each move (see Solution.commit and
+Solution.rollback). The energy of a solution is its score plus the weighted
+number of violating units of each constraint, both followed incrementally by
+listeners, so evaluating a move only costs the changed cells.
+"""
+
+import concurrent.futures
+import logging
+import math
+import os
+import time
+
+import numpy as np
+from vehicle_carpooling import incremental, score, solution
+import vehicle_carpooling.utils as utils
+
+logger = logging.getLogger(__name__)
+
+
+def exponential_cooling(progress, initial_temperature, final_temperature) -> float:
+    """Return the temperature decreasing geometrically from initial_temperature to final_temperature
+
+    Args:
+        progress (float): progress of the run, from 0 to 1
+        initial_temperature (float): temperature at the start of the run
+        final_temperature (float): temperature at the end of the run
+    """
+    return initial_temperature * (final_temperature / initial_temperature) ** progress
+
+
+def linear_cooling(progress, initial_temperature, final_temperature) -> float:
+    """Return the temperature decreasing linearly from initial_temperature to final_temperature, see exponential_cooling
+    """
+    return initial_temperature + (final_temperature - initial_temperature) * progress
+
+
+def constant_temperature(progress, initial_temperature, final_temperature) -> float:
+    """Return initial_temperature at any progress, see exponential_cooling
+    """
+    return initial_temperature
+
+
+COOLING_SCHEDULES = {
+    "exponential": exponential_cooling,
+    "linear": linear_cooling,
+    "constant": constant_temperature,
+}
+
+# move: weight of the move
+DEFAULT_MOVE_WEIGHTS = {
+    "ride_tree": 1.0,
+    "ride": 1.0,
+    "drive": 1.0,
+    "ride_vehicle": 1.0,
+}
+
+
+def _get_array(path_solution) -> np.ndarray:
+    """Return a copy of the compact array of a solution, the node sequence of a compact path
+    """
+    if getattr(path_solution, "compact", False):
+        return path_solution.nodes.copy()
+    return path_solution.solution.copy()
+
+
+def _set_array(path_solution, array):
+    """Set the solution from an array of _get_array
+    """
+    if getattr(path_solution, "compact", False):
+        path_solution.set_node_sequence(np.array(array))
+    else:
+        path_solution.solution = np.array(array)
+
+
+class SimulatedAnnealing:
+    """SimulatedAnnealing class
+
+    Anneals jointly the ride path, the drive path and the ride vehicle of a
+    problem. Each step applies one random move in place, evaluates the energy
+    and keeps the move with the Metropolis rule. The best state seen is kept
+    as arrays and restored at the end of run().
+    """
+
+    def __init__(self, problem, initial_temperature=1.0, final_temperature=1e-3, cooling="exponential", penalty=10.0, penalty_weights=None, move_weights=None, move_rate=0.1, tree_rate=0.2, seed=None, ride_path=None, drive=None, ride_vehicle=None, ride_path_settings=None) -> None:
+        """Initialize the SimulatedAnnealing object
+
+        Args:
+            problem (Problem): problem to solve
+            initial_temperature (float, optional): temperature at the start of a run. Defaults to 1.0.
+            final_temperature (float, optional): temperature at the end of a run. Defaults to 1e-3.
+            cooling (str or callable, optional): name of COOLING_SCHEDULES or function (progress, initial_temperature, final_temperature) -> temperature. Defaults to "exponential".
+            penalty (float, optional): weight of a violating unit of a constraint in the energy. Defaults to 10.0.
+            penalty_weights (dict, optional): weight of the violating units of some constraints ("ride_path.start_finish", "drive.path", "ride_vehicle.one_edge"...), penalty for the others. Defaults to None.
+            move_weights (dict, optional): relative weight of the moves, see DEFAULT_MOVE_WEIGHTS. Defaults to None.
+            move_rate (float, optional): rate of changed cells of the cell moves. Defaults to 0.1.
+            tree_rate (float, optional): rate of passengers changing trip in a tree move. Defaults to 0.2.
+            seed (int, optional): seed of the random generator of the shuffles and the moves. Defaults to None.
+            ride_path (RidePath, optional): initial ride path, built from the problem and tree shuffled if None. Defaults to None.
+            drive (DrivePath, optional): initial drive path, built from the problem and shuffled if None. Defaults to None.
+            ride_vehicle (RideVehicle, optional): initial ride vehicle, built from the problem if None. Defaults to None.
+            ride_path_settings (dict, optional): extra arguments of the built RidePath (nb_trips, executor...). Defaults to None.
+        """
+        self.problem = problem
+        self.initial_temperature = initial_temperature
+        self.final_temperature = final_temperature
+        self.cooling = COOLING_SCHEDULES[cooling] if isinstance(
+            cooling, str) else cooling
+        self.move_rate = move_rate
+        self.tree_rate = tree_rate
+        self.rng = np.random.default_rng(seed)
+        if ride_path is None:
+            ride_path = solution.RidePath(problem.nb_steps, problem.nb_nodes, problem.nb_passengers,
+                                          problem.passenger_start_points, problem.passenger_finish_points,
+                                          problem.path_map, problem.nb_vehicles, problem.vehicle_capacity,
+                                          topology=problem.topology, **(ride_path_settings or {}))
+            ride_path.tree_suffle(self.rng)
+        if drive is None:
+            drive = solution.DrivePath(problem.nb_steps, problem.nb_nodes, problem.nb_vehicles,
+                                       problem.vehicle_capacity, problem.vehicle_start_points,
+                                       problem.path_map, topology=problem.topology)
+            drive.shuffle(1.0, self.rng)
+        if ride_vehicle is None:
+            ride_vehicle = solution.RideVehicle(problem.nb_steps, problem.nb_nodes, problem.nb_passengers,
+                                                problem.path_map, problem.nb_vehicles, problem.vehicle_capacity,
+                                                topology=problem.topology)
+        self.ride_path = ride_path
+        self.drive = drive
+        self.ride_vehicle = ride_vehicle
+        # name: incremental evaluator
+        self.evaluators = {
+            "ride_path": incremental.RidePathEvaluator(ride_path),
+            "drive": incremental.DrivePathEvaluator(drive),
+            "ride_vehicle": incremental.RideVehicleEvaluator(ride_vehicle, ride_path, drive),
+        }
+        self.score_evaluator = None
+        if problem.time_map is not None:
+            self.score_evaluator = score.ScoreEvaluator(
+                ride_path, ride_vehicle, problem.time_map, problem.alpha)
+        self.penalty_weights = dict(
+            (f"{prefix}.{name}", penalty)
+            for prefix, evaluator in self.evaluators.items() for name in evaluator.constraints)
+        self.penalty_weights.update(penalty_weights or {})
+        move_weights = dict(DEFAULT_MOVE_WEIGHTS, **(move_weights or {}))
+        self.moves = [move for move, weight in move_weights.items() if weight > 0]
+        weights = np.array([move_weights[move] for move in self.moves], dtype=float)
+        self._move_thresholds = np.cumsum(weights) / weights.sum()
+
+    @property
+    def violations(self) -> dict:
+        """Number of violating units of each constraint, "solution.constraint": units
+        """
+        return dict((f"{prefix}.{name}", units) for prefix, evaluator in self.evaluators.items()
+                    for name, units in evaluator.violations.items())
+
+    @property
+    def violation_count(self) -> int:
+        """Number of violated constraints, as counted by the check_constraint methods
+        """
+        return sum(evaluator.violation_count for evaluator in self.evaluators.values())
+
+    @property
+    def score(self) -> float:
+        """Score of the current solution, see score.compute_score
+        """
+        return self.score_evaluator.score if self.score_evaluator is not None else 0.0
+
+    @property
+    def energy(self) -> float:
+        """Score plus the weighted violating units of the current solution, lower is better
+        """
+        penalty = sum(self.penalty_weights[name] * units
+                      for name, units in self.violations.items())
+        return self.score + penalty
+
+    def get_state(self) -> dict:
+        """Return a copy of the compact arrays of the current solution
+        """
+        return {
+            "ride_path": _get_array(self.ride_path),
+            "ride_path_index": np.array(self.ride_path.solutions_pe_index),
+            "drive": _get_array(self.drive),
+            "ride_vehicle": self.ride_vehicle.solution.copy(),
+        }
+
+    def set_state(self, state):
+        """Set the current solution from the arrays of get_state
+        """
+        _set_array(self.ride_path, state["ride_path"])
+        self.ride_path.solutions_pe_index = state["ride_path_index"].tolist()
+        _set_array(self.drive, state["drive"])
+        self.ride_vehicle.solution = np.array(state["ride_vehicle"])
+        # the arrays are replaced, the evaluators are not notified
+        for evaluator in self.evaluators.values():
+            evaluator.reset()
+        if self.score_evaluator is not None:
+            self.score_evaluator.reset()
+
+    def close(self):
+        """Stop the evaluators listening to the solutions
+        """
+        for evaluator in self.evaluators.values():
+            evaluator.close()
+        if self.score_evaluator is not None:
+            self.score_evaluator.close()
+
+    def shuffle(self):
+        """Start from a random solution: tree shuffled ride path, shuffled drive path and empty ride vehicle
+        """
+        self.ride_path.tree_suffle(self.rng)
+        self.drive.shuffle(1.0, self.rng)
+        self.ride_vehicle.solution = np.full_like(self.ride_vehicle.solution, -1)
+        self.set_state(self.get_state())
+
+    def _move(self, move):
+        """Apply a move in place and return the moved solution
+        """
+        if move == "ride_tree":
+            self.ride_path.tree_move(self.tree_rate, self.rng)
+            return self.ride_path
+        moved = {"ride": self.ride_path, "drive": self.drive,
+                 "ride_vehicle": self.ride_vehicle}[move]
+        moved.move(self.move_rate, 1, self.rng)
+        return moved
+
+    def step(self, temperature, energy=None) -> tuple:
+        """Apply a random move and keep it with the Metropolis rule
+
+        Args:
+            temperature (float): temperature of the acceptance rule
+            energy (float, optional): energy of the current solution, computed if None. Defaults to None.
+
+        Returns:
+            tuple: (accepted, energy of the solution after the step)
+        """
+        if energy is None:
+            energy = self.energy
+        move = self.moves[int(np.searchsorted(
+            self._move_thresholds, self.rng.random(), side="right"))]
+        moved = self._move(move)
+        new_energy = self.energy
+        delta = new_energy - energy
+        if delta <= 0 or (temperature > 0 and self.rng.random() < math.exp(-delta / temperature)):
+            moved.commit()
+            return True, new_energy
+        moved.rollback()
+        return False, energy
+
+    def run(self, max_iterations=None, time_limit=None) -> dict:
+        """Anneal from initial_temperature to final_temperature
+
+        The temperature follows the cooling schedule with the progress of the
+        run, the fraction of max_iterations or of time_limit that is used.
+
+        Args:
+            max_iterations (int, optional): maximum number of moves. Defaults to None.
+            time_limit (float, optional): maximum time in seconds. Defaults to None.
+
+        Raises:
+            ValueError: neither max_iterations nor time_limit are given
+
+        Returns:
+            dict: energy, score, violation_count and violations of the best solution, number of
+            iterations, accepted moves and evaluations, elapsed time and evaluations_per_second
+        """
+        if max_iterations is None and time_limit is None:
+            raise ValueError("The run needs max_iterations or time_limit")
+        start = time.perf_counter()
+        energy = self.energy
+        best_energy, best_state = energy, self.get_state()
+        iteration = accepted = 0
+        while max_iterations is None or iteration < max_iterations:
+            progress = iteration / max_iterations if max_iterations else 0.0
+            if time_limit is not None:
+                elapsed = time.perf_counter() - start
+                if elapsed >= time_limit:
+                    break
+                progress = max(progress, elapsed / time_limit)
+            temperature = self.cooling(
+                progress, self.initial_temperature, self.final_temperature)
+            is_accepted, energy = self.step(temperature, energy)
+            accepted += is_accepted
+            iteration += 1
+            if energy < best_energy:
+                best_energy, best_state = energy, self.get_state()
+        elapsed = time.perf_counter() - start
+        self.set_state(best_state)
+        # the initial energy and one energy per move
+        evaluations = iteration + 1
+        utils.profiling.count("annealing.evaluations", evaluations)
+        result = {
+            "energy": self.energy,
+            "score": self.score,
+            "violation_count": self.violation_count,
+            "violations": self.violations,
+            "iterations": iteration,
+            "accepted": accepted,
+            "evaluations": evaluations,
+            "elapsed": elapsed,
+            "evaluations_per_second": evaluations / elapsed if elapsed > 0 else math.inf,
+        }
+        logger.info("Annealing: %d iterations, best energy %g, %.0f evaluations per second",
+                    iteration, result["energy"], result["evaluations_per_second"])
+        return result
+
+
+# solver of a parallel tempering worker process, see _init_replica_worker
+_replica_solver = None
+
+
+def _get_replica_solver(problem, settings) -> SimulatedAnnealing:
+    """Return the solver running the replicas of a parallel tempering
+
+    The trips are computed in the process, a worker cannot start its own pool.
+    """
+    settings = dict(settings)
+    ride_path_settings = dict(settings.pop("ride_path_settings", None) or {})
+    ride_path_settings.setdefault("executor", utils.workers.TripExecutor("serial"))
+    return SimulatedAnnealing(problem, ride_path_settings=ride_path_settings, **settings)
+
+
+def _init_replica_worker(problem, settings):
+    """Build the solver of a worker process once, the replicas only send their states
+    """
+    global _replica_solver
+    _replica_solver = _get_replica_solver(problem, settings)
+
+
+def _run_replica(solver, state, temperature, nb_iterations, seed) -> dict:
+    """Run a replica for nb_iterations steps at a constant temperature
+
+    Args:
+        solver (SimulatedAnnealing): solver running the replica, the solver of the worker process if None
+        state (dict): state of the replica (see SimulatedAnnealing.get_state), a shuffled solution if None
+        temperature (float): temperature of the replica
+        nb_iterations (int): number of steps
+        seed (int): seed of the random generator of the replica
+
+    Returns:
+        dict: state and energy of the replica after the steps, best state, energy, score and violation_count seen and number of accepted moves
+    """
+    solver = solver or _replica_solver
+    # the moves of the replica only draw from its own generator
+    solver.rng = np.random.default_rng(seed)
+    if state is None:
+        solver.shuffle()
+    else:
+        solver.set_state(state)
+    energy = solver.energy
+    best = dict(state=solver.get_state(), energy=energy, score=solver.score,
+                violation_count=solver.violation_count)
+    accepted = 0
+    for _ in range(nb_iterations):
+        is_accepted, energy = solver.step(temperature, energy)
+        accepted += is_accepted
+        if energy < best["energy"]:
+            best = dict(state=solver.get_state(), energy=energy, score=solver.score,
+                        violation_count=solver.violation_count)
+    return dict(state=solver.get_state(), energy=energy, best=best, accepted=accepted)
+
+
+class ParallelTempering:
+    """ParallelTempering class
+
+    Runs one annealing replica per temperature at constant temperature and
+    swaps the states of neighboring temperatures between the rounds. With the
+    process backend, each worker builds its solver (and computes the trips)
+    once, then a round only sends the compact arrays of a replica state and
+    gets back its new state, so the rounds scale with the number of workers.
+    """
+
+    def __init__(self, problem, temperatures=None, nb_replicas=None, min_temperature=1e-2, max_temperature=1.0, swap_interval=100, backend="process", max_workers=None, seed=None, **solver_settings) -> None:
+        """Initialize the ParallelTempering object
+
+        Args:
+            problem (Problem): problem to solve
+            temperatures (list, optional): temperature of each replica, geometric from min_temperature to max_temperature if None. Defaults to None.
+            nb_replicas (int, optional): number of replicas if temperatures is None, max_workers if None. Defaults to None.
+            min_temperature (float, optional): temperature of the coldest replica. Defaults to 1e-2.
+            max_temperature (float, optional): temperature of the hottest replica. Defaults to 1.0.
+            swap_interval (int, optional): number of steps of each replica between two swaps. Defaults to 100.
+            backend (str, optional): "serial" or "process". Defaults to "process".
+            max_workers (int, optional): number of worker processes, the number of cpus if None. Defaults to None.
+            seed (int, optional): seed of the random generators. Defaults to None.
+            solver_settings: arguments of SimulatedAnnealing (penalty, move_weights, ride_path_settings...)
+        """
+        if backend not in ("serial", "process"):
+            raise ValueError(f"Unknown backend {backend}, expected serial or process")
+        self.problem = problem
+        self.backend = backend
+        self.max_workers = max_workers or os.cpu_count() or 1
+        if temperatures is None:
+            nb_replicas = nb_replicas or self.max_workers
+            temperatures = np.geomspace(
+                min_temperature, max_temperature, nb_replicas)
+        self.temperatures = sorted(float(temperature) for temperature in temperatures)
+        if self.temperatures[0] <= 0:
+            raise ValueError("The temperatures must be positive")
+        self.swap_interval = swap_interval
+        self.solver_settings = solver_settings
+        self.rng = np.random.default_rng(seed)
+        # state and energy of the replica at each temperature, None before the first round
+        self.states = [None] * len(self.temperatures)
+        self.energies = [math.inf] * len(self.temperatures)
+        self._executor = None
+        self._solver = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _submit(self, replica, nb_iterations) -> concurrent.futures.Future:
+        """Run a round of nb_iterations steps of a replica, inline or in the pool
+        """
+        args = (self.states[replica], self.temperatures[replica],
+                nb_iterations, int(self.rng.integers(2**63)))
+        if self.backend == "serial":
+            if self._solver is None:
+                self._solver = _get_replica_solver(self.problem, self.solver_settings)
+            future = concurrent.futures.Future()
+            future.set_result(_run_replica(self._solver, *args))
+            return future
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                min(self.max_workers, len(self.temperatures)), initializer=_init_replica_worker,
+                initargs=(self.problem, self.solver_settings))
+        return self._executor.submit(_run_replica, None, *args)
+
+    def _swap(self, offset) -> tuple:
+        """Swap the states of the pairs of neighboring temperatures starting at offset
+
+        Returns:
+            tuple: (number of swaps, number of tried swaps)
+        """
+        swaps = tries = 0
+        for replica in range(offset, len(self.temperatures) - 1, 2):
+            other = replica + 1
+            delta = (self.energies[replica] - self.energies[other]) * \
+                (1 / self.temperatures[replica] - 1 / self.temperatures[other])
+            tries += 1
+            if delta >= 0 or self.rng.random() < math.exp(delta):
+                swaps += 1
+                self.states[replica], self.states[other] = self.states[other], self.states[replica]
+                self.energies[replica], self.energies[other] = self.energies[other], self.energies[replica]
+        return swaps, tries
+
+    def run(self, max_iterations=None, time_limit=None) -> dict:
+        """Run rounds of swap_interval steps of each replica, then swap the states
+
+        The pairs of neighboring temperatures tried alternate between the
+        rounds. The last round is shortened to stop at max_iterations, the
+        time limit is checked between the rounds.
+
+        Args:
+            max_iterations (int, optional): maximum number of steps of each replica. Defaults to None.
+            time_limit (float, optional): maximum time in seconds. Defaults to None.
+
+        Raises:
+            ValueError: neither max_iterations nor time_limit are given
+
+        Returns:
+            dict: state (see SimulatedAnnealing.set_state), energy, score and violation_count of the best
+            solution, number of rounds, iterations of each replica, evaluations of all the replicas,
+            elapsed time, evaluations_per_second, swap_rate and acceptance_rates of the replicas
+        """
+        if max_iterations is None and time_limit is None:
+            raise ValueError("The run needs max_iterations or time_limit")
+        start = time.perf_counter()
+        nb_replicas = len(self.temperatures)
+        best = None
+        iterations = rounds = swaps = tries = 0
+        accepted = np.zeros(nb_replicas, dtype=np.int64)
+        while max_iterations is None or iterations < max_iterations:
+            if time_limit is not None and time.perf_counter() - start >= time_limit:
+                break
+            nb_iterations = self.swap_interval if max_iterations is None else min(
+                self.swap_interval, max_iterations - iterations)
+            futures = [self._submit(replica, nb_iterations)
+                       for replica in range(nb_replicas)]
+            for replica, future in enumerate(futures):
+                result = future.result()
+                self.states[replica] = result["state"]
+                self.energies[replica] = result["energy"]
+                accepted[replica] += result["accepted"]
+                if best is None or result["best"]["energy"] < best["energy"]:
+                    best = result["best"]
+            iterations += nb_iterations
+            round_swaps, round_tries = self._swap(rounds % 2)
+            swaps += round_swaps
+            tries += round_tries
+            rounds += 1
+        elapsed = time.perf_counter() - start
+        evaluations = iterations * nb_replicas
+        utils.profiling.count("annealing.evaluations", evaluations)
+        if best is None:
+            best = dict(state=None, energy=math.inf, score=None, violation_count=None)
+        result = {
+            "state": best["state"],
+            "energy": best["energy"],
+            "score": best["score"],
+            "violation_count": best["violation_count"],
+            "rounds": rounds,
+            "iterations": iterations,
+            "evaluations": evaluations,
+            "elapsed": elapsed,
+            "evaluations_per_second": evaluations / elapsed if elapsed > 0 else math.inf,
+            "swap_rate": swaps / tries if tries else 0.0,
+            "acceptance_rates": (accepted / iterations).tolist() if iterations else [0.0] * nb_replicas,
+        }
+        logger.info("Parallel tempering: %d rounds of %d replicas, best energy %g, %.0f evaluations per second",
+                    rounds, nb_replicas, result["energy"], result["evaluations_per_second"])
+        return result
+
+    def close(self):
+        """Shut the pool down
+        """
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        if self._solver is not None:
+            self._solver.close()
+            self._solver = None
@@ -0,0 +1,352 @@
+# vehicle_carpooling/incremental.py
+
+"""Defines the incremental constraint evaluators
+
+An evaluator keeps, for each constraint, the units (entity, step, vehicle...)
+that violate it. It listens to the in place changes of the solutions
+(see Solution.set_cells) and only updates the units touched by the changed
+cells, so evaluating a local move does not depend on the size of the fleet
+or on the number of passengers.
+
+The evaluators are not notified when the solution array is replaced
+(ex: solution.solution = matrix), call reset() in that case.
+"""
+
+import math
+from collections import Counter, defaultdict
+
+import numpy as np
+
+
+class IncrementalEvaluator:
+    """IncrementalEvaluator class
+
+    Base class of the evaluators
+    """
+
+    def __init__(self, solution, constraints) -> None:
+        """Initialize the IncrementalEvaluator object
+
+        Args:
+            solution (Solution): evaluated solution
+            constraints (list): names of the evaluated constraints
+        """
+        self.solution = solution
+        self.constraints = [name for name, enabled in constraints if enabled]
+        # number of violating units per constraint
+        self.violations = dict()
+        self.reset()
+        solution.add_listener(self)
+
+    @property
+    def violation_count(self) -> int:
+        """Number of violated constraints, as counted by Solution.check_constraint
+        """
+        return sum(1 for name in self.constraints if self.violations[name])
+
+    def check_constraint(self) -> bool:
+        """Return True if all the evaluated constraints are respected
+        """
+        return self.violation_count == 0
+
+    def close(self):
+        """Stop listening to the solutions
+        """
+        self.solution.remove_listener(self)
+
+    def reset(self):
+        """Compute the state of every constraint from scratch
+        """
+        raise NotImplementedError
+
+    def update(self, solution, entities, steps, old_values):
+        """Update the state after the cells (entities, steps) of solution changed
+
+        Args:
+            solution (Solution): changed solution
+            entities (np.ndarray): entities of the changed cells
+            steps (np.ndarray): steps of the changed cells
+            old_values (np.ndarray): values of the cells before the change
+        """
+        raise NotImplementedError
+
+    def _set_units(self, name, units):
+        """Store the violating units array of a constraint and count them
+        """
+        setattr(self, f"_{name}", units)
+        self.violations[name] = int(np.count_nonzero(units))
+
+    def _set_unit(self, name, index, violated):
+        """Set one unit of a constraint as violated or not
+        """
+        units = getattr(self, f"_{name}")
+        violated = bool(violated)
+        if units[index] != violated:
+            units[index] = violated
+            self.violations[name] += 1 if violated else -1
+
+
+class PathEvaluator(IncrementalEvaluator):
+    """PathEvaluator class
+
+    Evaluates the path and continuity constraints shared by RidePath and DrivePath
+    """
+
+    def reset(self):
+        path = self.solution
+        if "path" in self.constraints:
+            self._set_units("path", path._path_units(path.solution))
+        if "continuous" in self.constraints:
+            self._set_units(
+                "continuous", path._continuous_units(path.solution))
+
+    def _update_cell(self, entity, step, old_value):
+        """Update the units touched by the cell (entity, step)
+        """
+        solution = self.solution.solution
+        if "path" in self.constraints:
+            self._set_unit("path", (entity, step), not self.solution.path_map[
+                solution[entity, step, 0], solution[entity, step, 1]])
+        if "continuous" in self.constraints:
+            if step > 0:
+                self._set_unit("continuous", (entity, step - 1),
+                               solution[entity, step - 1, 1] != solution[entity, step, 0])
+            if step < self.solution.nb_steps - 1:
+                self._set_unit("continuous", (entity, step),
+                               solution[entity, step, 1] != solution[entity, step + 1, 0])
+
+    def update(self, solution, entities, steps, old_values):
+        for entity, step, old_value in zip(entities, steps, old_values):
+            if entity < self.solution.nb_entity:
+                self._update_cell(entity, step, old_value)
+
+
+class RidePathEvaluator(PathEvaluator):
+    """RidePathEvaluator class
+
+    Incremental version of RidePath.check_constraint
+    """
+
+    def __init__(self, ride_path, start_finish_constraint=True, path_constraint=True, continuous_constraint=True, limit_vehicle_constraint=True) -> None:
+        """Initialize the RidePathEvaluator object
+
+        Args:
+            ride_path (RidePath): evaluated ride path
+            start_finish_constraint (bool, optional): Constraint: Each passenger must start and finish in designated places. Defaults to True.
+            path_constraint (bool, optional): Constraint: Passengers cannot be on non paths (use R and M). Defaults to True.
+            continuous_constraint (bool, optional): Constraint: The path needs to be continuous. Defaults to True.
+            limit_vehicle_constraint (bool, optional): Constraint: There is a limited total number of vehicles at each step. Defaults to True.
+        """
+        super().__init__(ride_path, [("start_finish", start_finish_constraint),
+                                     ("path", path_constraint),
+                                     ("continuous", continuous_constraint),
+                                     ("limit_vehicle", limit_vehicle_constraint)])
+
+    def reset(self):
+        super().reset()
+        ride_path = self.solution
+        if "start_finish" in self.constraints:
+            self._set_units("start_finish",
+                            ride_path._start_finish_units(ride_path.solution))
+        if "limit_vehicle" in self.constraints:
+            # number of passengers moving at each step
+            self._moving = ride_path._moving_passengers(ride_path.solution)
+            self._set_units("limit_vehicle", self._moving /
+                            ride_path.vehicle_capacity > ride_path.nb_vehicles)
+
+    def update(self, solution, entities, steps, old_values):
+        ride_path = self.solution
+        for entity, step, old_value in zip(entities, steps, old_values):
+            value = ride_path.solution[entity, step]
+            if "limit_vehicle" in self.constraints:
+                self._moving[step] += int(value[0] != value[1]) - \
+                    int(old_value[0] != old_value[1])
+                self._set_unit("limit_vehicle", step, self._moving[step] /
+                               ride_path.vehicle_capacity > ride_path.nb_vehicles)
+            if entity >= ride_path.nb_entity:
+                continue
+            self._update_cell(entity, step, old_value)
+            if "start_finish" in self.constraints and step in (0, ride_path.nb_steps - 1):
+                self._set_unit("start_finish", entity,
+                               ride_path.solution[entity, 0, 0] != ride_path.passenger_start_points[entity] or
+                               ride_path.solution[entity, -1, 1] != ride_path.passenger_finish_points[entity])
+
+
+class DrivePathEvaluator(PathEvaluator):
+    """DrivePathEvaluator class
+
+    Incremental version of DrivePath.check_constraint
+    """
+
+    def __init__(self, drive, vehicle_start_constraint=True, vehicles_path_constraint=True, vehicles_continuous_constraint=True) -> None:
+        """Initialize the DrivePathEvaluator object
+
+        Args:
+            drive (DrivePath): evaluated drive path
+            vehicle_start_constraint (bool, optional): Constraint: Each vehicle must start at designated places. Defaults to True.
+            vehicles_path_constraint (bool, optional): Constraint: Vehicle cannot be on non paths. Defaults to True.
+            vehicles_continuous_constraint (bool, optional): Constraint: The path needs to be continuous. Defaults to True.
+        """
+        super().__init__(drive, [("start", vehicle_start_constraint),
+                                 ("path", vehicles_path_constraint),
+                                 ("continuous", vehicles_continuous_constraint)])
+
+    def reset(self):
+        super().reset()
+        drive = self.solution
+        if "start" in self.constraints:
+            self._set_units(
+                "start", drive._vehicle_start_units(drive.solution))
+
+    def _update_cell(self, entity, step, old_value):
+        super()._update_cell(entity, step, old_value)
+        drive = self.solution
+        if "start" in self.constraints and step == 0:
+            self._set_unit("start", entity, drive.solution[entity, 0, 0] !=
+                           drive.vehicle_start_points[entity])
+
+
+class RideVehicleEvaluator(IncrementalEvaluator):
+    """RideVehicleEvaluator class
+
+    Incremental version of RideVehicle.check_constraint, listens to the ride
+    vehicle, the ride path and the drive path
+    """
+
+    def __init__(self, ride_vehicle, ride_path, drive, ride_link_constraint=True, vehicle_number_link_ride_constraint=True, vehicle_capacity_constraint=True, vehicle_only_in_one_edge_condition=True) -> None:
+        """Initialize the RideVehicleEvaluator object
+
+        Args:
+            ride_vehicle (RideVehicle): evaluated ride vehicle
+            ride_path (RidePath): ride path object
+            drive (DrivePath): drive path object
+            ride_link_constraint (bool, optional): Constraint: passenger use car only when they use the path and contrary. Defaults to True.
+            vehicle_number_link_ride_constraint (bool, optional): Constraint: vehicle number is the same in ridePath and rideVehicle. Defaults to True.
+            vehicle_capacity_constraint (bool, optional): Constraint: Vehicle capacity limit. Defaults to True.
+            vehicle_only_in_one_edge_condition (bool, optional): Constraint: a vehicle can only be in a edge a a time at maximum. Defaults to True.
+        """
+        self.ride_path = ride_path
+        self.drive = drive
+        super().__init__(ride_vehicle, [("ride_link", ride_link_constraint),
+                                        ("vehicle_number_link",
+                                         vehicle_number_link_ride_constraint),
+                                        ("vehicle_capacity",
+                                         vehicle_capacity_constraint),
+                                        ("one_edge", vehicle_only_in_one_edge_condition)])
+        ride_path.add_listener(self)
+        if drive is not None:
+            drive.add_listener(self)
+
+    def close(self):
+        super().close()
+        self.ride_path.remove_listener(self)
+        if self.drive is not None:
+            self.drive.remove_listener(self)
+
+    def _vehicle(self, passenger, step):
+        """Return the vehicle of the passenger at step, or None if he is not in a vehicle
+        """
+        vehicle_id = self.solution.solution[passenger, step]
+        if 0 <= vehicle_id < self.solution.nb_vehicles:
+            return int(vehicle_id)
+        return None
+
+    def _edge_code(self, path_solution, entity, step):
+        """Return the code of the edge used by entity at step
+        """
+        return int(self.solution._edge_codes(path_solution.solution[entity, step]))
+
+    def reset(self):
+        ride_vehicle = self.solution
+        solution = ride_vehicle.solution
+        ride_solution = self.ride_path.solution
+        # passengers per vehicle at each step
+        self._occupancy = ride_vehicle._vehicle_occupancy()
+        self._assigned = self._occupancy.sum(axis=1)
+        self._moving = self.ride_path._moving_passengers(ride_solution)
+        if "ride_link" in self.constraints:
+            self._set_units("ride_link", ride_vehicle._ride_link_units(
+                solution, ride_solution))
+        if "vehicle_number_link" in self.constraints:
+            self._set_units("vehicle_number_link", ride_vehicle._vehicle_number_link_units(
+                self._occupancy, self._moving))
+        if "vehicle_capacity" in self.constraints:
+            self._set_units("vehicle_capacity",
+                            ride_vehicle._vehicle_capacity_units(self._occupancy))
+        if "one_edge" in self.constraints:
+            # edge occupancy of each (step, vehicle)
+            self._edge_counts = defaultdict(Counter)
+            edge_codes = ride_vehicle._edge_codes(ride_solution)
+            for passenger, step in zip(*np.nonzero((solution >= 0) & (solution < ride_vehicle.nb_vehicles))):
+                self._edge_counts[(int(step), int(solution[passenger, step]))][
+                    int(edge_codes[passenger, step])] += 1
+            self._set_units("one_edge", np.zeros(
+                (ride_vehicle.nb_steps, ride_vehicle.nb_vehicles), dtype=bool))
+            for (step, vehicle_id) in self._edge_counts:
+                self._update_one_edge(step, vehicle_id)
+
+    def _update_one_edge(self, step, vehicle_id):
+        """Update the one edge unit of the vehicle at step
+        """
+        drive_code = self._edge_code(self.drive, vehicle_id, step)
+        edge_counts = self._edge_counts[(step, vehicle_id)]
+        # passengers of the vehicle that are not on the vehicle edge
+        self._set_unit("one_edge", (step, vehicle_id),
+                       self._occupancy[step, vehicle_id] > edge_counts[drive_code])
+
+    def _update_number_link(self, step):
+        """Update the vehicle number link unit of step
+        """
+        if "vehicle_number_link" in self.constraints:
+            self._set_unit("vehicle_number_link", step, self._assigned[step] != math.ceil(
+                self._moving[step] / self.solution.vehicle_capacity))
+
+    def _update_ride_link(self, passenger, step):
+        """Update the ride link unit of the passenger at step
+        """
+        if "ride_link" in self.constraints and passenger < self.solution.nb_entity:
+            ride_edge = self.ride_path.solution[passenger, step]
+            self._set_unit("ride_link", (passenger, step), self.solution.solution[passenger, step] != -1 and
+                           ride_edge[0] == ride_edge[1])
+
+    def _move_passenger(self, passenger, step, vehicle_id, code, count):
+        """Add (count=1) or remove (count=-1) a passenger on edge code from a vehicle
+        """
+        if vehicle_id is None:
+            return
+        self._occupancy[step, vehicle_id] += count
+        self._assigned[step] += count
+        if "vehicle_capacity" in self.constraints:
+            self._set_unit("vehicle_capacity", (step, vehicle_id),
+                           self._occupancy[step, vehicle_id] > self.solution.vehicle_capacity)
+        if "one_edge" in self.constraints:
+            self._edge_counts[(step, vehicle_id)][code] += count
+            self._update_one_edge(step, vehicle_id)
+
+    def update(self, solution, entities, steps, old_values):
+        ride_vehicle = self.solution
+        for entity, step, old_value in zip(entities, steps, old_values):
+            if solution is ride_vehicle:
+                code = self._edge_code(self.ride_path, entity, step)
+                if 0 <= old_value < ride_vehicle.nb_vehicles:
+                    self._move_passenger(
+                        entity, step, int(old_value), code, -1)
+                self._move_passenger(
+                    entity, step, self._vehicle(entity, step), code, 1)
+                self._update_ride_link(entity, step)
+                self._update_number_link(step)
+            elif solution is self.ride_path:
+                value = solution.solution[entity, step]
+                self._moving[step] += int(value[0] != value[1]) - \
+                    int(old_value[0] != old_value[1])
+                vehicle_id = self._vehicle(entity, step)
+                if vehicle_id is not None:
+                    # move the passenger from the old edge to the new one
+                    self._move_passenger(entity, step, vehicle_id, int(
+                        ride_vehicle._edge_codes(old_value)), -1)
+                    self._move_passenger(
+                        entity, step, vehicle_id, self._edge_code(solution, entity, step), 1)
+                self._update_ride_link(entity, step)
+                self._update_number_link(step)
+            elif "one_edge" in self.constraints and entity < ride_vehicle.nb_vehicles:
+                self._update_one_edge(step, int(entity))
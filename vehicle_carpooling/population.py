@@ -0,0 +1,153 @@
+# vehicle_carpooling/population.py
+
+"""Defines the population evaluator
+
+Evaluates a population of candidate solutions stacked in arrays with a
+leading population axis, ex: (population, nb_passengers, nb_steps, 2) ride
+paths. The violating units of each constraint are given by the helpers of
+the vectorized check_constraint methods of RidePath, DrivePath and
+RideVehicle, which accept the leading population axis, so all the candidates
+are evaluated at once with whole-array operations.
+"""
+
+import numpy as np
+from vehicle_carpooling import score
+
+
+class PopulationEvaluator:
+    """PopulationEvaluator class
+
+    Counts, for each candidate, the violating units (passenger, cell, step,
+    vehicle...) of each constraint, as the incremental evaluators do, and
+    computes the score of the candidates. The problem data (start points,
+    maps, capacities) is read from template solutions.
+    """
+
+    def __init__(self, ride_path, ride_vehicle=None, drive=None, time_map=None, alpha=0) -> None:
+        """Initialize the PopulationEvaluator object
+
+        Args:
+            ride_path (RidePath): template ride path
+            ride_vehicle (RideVehicle, optional): template ride vehicle. Defaults to None.
+            drive (DrivePath, optional): template drive path. Defaults to None.
+            time_map (np.ndarray or SparseGraph, optional): time to travel each path on the map, no score if None. Defaults to None.
+            alpha (float, optional): balance between time (alpha=0) and number of vehicles (alpha=1). Defaults to 0.
+        """
+        self.ride_path = ride_path
+        self.ride_vehicle = ride_vehicle
+        self.drive = drive
+        self.time_map = time_map
+        self.alpha = alpha
+
+    @classmethod
+    def from_problem(cls, problem, ride_path, ride_vehicle=None, drive=None) -> "PopulationEvaluator":
+        """Return the evaluator of the solutions of a problem, scored with its time map and alpha
+        """
+        return cls(ride_path, ride_vehicle, drive, problem.time_map, problem.alpha)
+
+    @staticmethod
+    def _count(units) -> np.ndarray:
+        """Return the number of violating units of each candidate
+        """
+        return np.count_nonzero(units.reshape(len(units), -1), axis=1)
+
+    def ride_path_violations(self, ride_paths) -> dict:
+        """Return the violations of the RidePath constraints
+
+        Args:
+            ride_paths (np.ndarray): (population, nb_passengers, nb_steps, 2) ride path solutions
+
+        Returns:
+            dict: (population,) number of violating units of each constraint
+        """
+        ride_paths = np.asarray(ride_paths)
+        ride_path = self.ride_path
+        return {
+            "start_finish": self._count(ride_path._start_finish_units(ride_paths)),
+            "path": self._count(ride_path._path_units(ride_paths)),
+            "continuous": self._count(ride_path._continuous_units(ride_paths)),
+            "limit_vehicle": self._count(ride_path._limit_vehicle_units(ride_paths)),
+        }
+
+    def drive_violations(self, drives) -> dict:
+        """Return the violations of the DrivePath constraints
+
+        Args:
+            drives (np.ndarray): (population, nb_vehicles, nb_steps, 2) drive path solutions
+
+        Returns:
+            dict: (population,) number of violating units of each constraint
+        """
+        drives = np.asarray(drives)
+        drive = self.drive
+        return {
+            "start": self._count(drive._vehicle_start_units(drives)),
+            "path": self._count(drive._path_units(drives)),
+            "continuous": self._count(drive._continuous_units(drives)),
+        }
+
+    def ride_vehicle_violations(self, ride_vehicles, ride_paths, drives=None) -> dict:
+        """Return the violations of the RideVehicle constraints
+
+        Args:
+            ride_vehicles (np.ndarray): (population, nb_passengers, nb_steps) ride vehicle solutions
+            ride_paths (np.ndarray): (population, nb_passengers, nb_steps, 2) ride path solutions
+            drives (np.ndarray, optional): (population, nb_vehicles, nb_steps, 2) drive path solutions, the one edge condition is not evaluated if None. Defaults to None.
+
+        Returns:
+            dict: (population,) number of violating units of each constraint
+        """
+        ride_vehicles = np.asarray(ride_vehicles)
+        ride_paths = np.asarray(ride_paths)
+        ride_vehicle = self.ride_vehicle
+        vehicle_groups = ride_vehicle._vehicle_groups(ride_vehicles)
+        occupancy = ride_vehicle._vehicle_occupancy(
+            ride_vehicles, vehicle_groups)
+        violations = {
+            "ride_link": self._count(ride_vehicle._ride_link_units(ride_vehicles, ride_paths)),
+            "vehicle_number_link": self._count(ride_vehicle._vehicle_number_link_units(
+                occupancy, self.ride_path._moving_passengers(ride_paths))),
+            "vehicle_capacity": self._count(ride_vehicle._vehicle_capacity_units(occupancy)),
+        }
+        if drives is not None:
+            nb_edges = ride_vehicle._edge_keys(
+                ride_vehicles, ride_paths, np.asarray(drives), vehicle_groups)[1]
+            violations["one_edge"] = self._count(nb_edges > 1)
+        return violations
+
+    def evaluate(self, ride_paths, ride_vehicles=None, drives=None) -> dict:
+        """Evaluate a population of candidates
+
+        Args:
+            ride_paths (np.ndarray): (population, nb_passengers, nb_steps, 2) ride path solutions
+            ride_vehicles (np.ndarray, optional): (population, nb_passengers, nb_steps) ride vehicle solutions. Defaults to None.
+            drives (np.ndarray, optional): (population, nb_vehicles, nb_steps, 2) drive path solutions. Defaults to None.
+
+        Returns:
+            dict: "violations" (number of violating units of each "solution.constraint"), "violation_count"
+            (number of violated constraints, as the sum of the violation_count of check_constraint) and
+            "score" (see score.compute_score, only with ride vehicles and a time map), all of shape (population,)
+        """
+        ride_paths = np.asarray(ride_paths)
+        violations = dict(("ride_path." + name, units)
+                          for name, units in self.ride_path_violations(ride_paths).items())
+        if drives is not None and self.drive is not None:
+            violations.update(("drive." + name, units)
+                              for name, units in self.drive_violations(drives).items())
+        if ride_vehicles is not None:
+            if self.ride_vehicle is None:
+                raise ValueError("Evaluating ride vehicles needs a template ride vehicle")
+            violations.update(("ride_vehicle." + name, units) for name, units in self.ride_vehicle_violations(
+                ride_vehicles, ride_paths, drives).items())
+        result = {
+            "violations": violations,
+            "violation_count": np.sum([units > 0 for units in violations.values()], axis=0),
+        }
+        if ride_vehicles is not None and self.time_map is not None:
+            travel_time = score.get_travel_times(
+                ride_paths[:, :self.ride_path.nb_entity], self.time_map).sum(axis=(1, 2))
+            vehicles = score.get_vehicles_in_use(
+                np.asarray(ride_vehicles)[:, :self.ride_vehicle.nb_entity], self.ride_vehicle.nb_vehicles).sum(axis=1)
+            result["score"] = score.get_objective(
+                travel_time, vehicles, self.alpha)
+        return result
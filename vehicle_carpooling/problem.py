@@ -4,6 +4,8 @@
 '''
 
 import numpy as np
+from vehicle_carpooling.utils.graphs import SparseGraph
+from vehicle_carpooling.topology import Topology
 
 
 class Problem:
@@ -16,7 +18,7 @@ class Problem:
                  vehicle_capacity: int,
                  nb_passengers: int,
                  nb_steps: int,
-                 path_map: np.ndarray,
+                 path_map: np.ndarray | SparseGraph,
                  time_map: np.ndarray,
                  passenger_start_points: np.ndarray,
                  passenger_finish_points: np.ndarray,
@@ -30,7 +32,7 @@ class Problem:
             vehicle_capacity (int): vehicles capacity. Defaults to 0.
             nb_passengers (int): number of passengers. Defaults to 0.
             nb_steps (int): number of maximum steps of the optimization. Defaults to 0.
-            path_map (numpy.ndarray): possible path on the map. Defaults to np.array([]).
+            path_map (numpy.ndarray or SparseGraph): possible path on the map. Defaults to np.array([]).
             time_map (numpy.ndarray): time to travel each path on the map. Defaults to np.array([]).
             passenger_start_points (numpy.ndarray): starting points of the passengers. Defaults to np.array([]).
             passenger_finish_points (numpy.ndarray): finishing points of the passengers. Defaults to np.array([]).
@@ -48,3 +50,5 @@ class Problem:
         self.passenger_finish_points = passenger_finish_points
         self.vehicle_start_points = vehicle_start_points
         self.alpha = alpha
+        # map data shared by all the solutions of the problem
+        self.topology = Topology(path_map, time_map)
@@ -0,0 +1,213 @@
+# vehicle_carpooling/score.py
+
+"""Defines the score of the solutions
+
+The score is the alpha-weighted objective of a problem, lower is better:
+(1 - alpha) * total travel time of the passengers + alpha * number of
+vehicles in use summed over the steps. The travel time of a passenger cell
+[from, to] is time_map[from, to], a passenger staying on a node takes no time.
+
+The functions broadcast over leading dimensions, so a stack of solutions is
+scored in one call. The ScoreEvaluator follows the in place changes of the
+solutions (see Solution.set_cells) and gives the score change of a single
+cell move without scoring the whole solution.
+"""
+
+import numpy as np
+from vehicle_carpooling.utils.graphs import SparseGraph
+
+
+def get_travel_times(ride_path_solution, time_map) -> np.ndarray:
+    """Return the travel time of each passenger cell
+
+    Args:
+        ride_path_solution (np.ndarray): (..., nb_passengers, nb_steps, 2) [from, to] cells
+        time_map (np.ndarray or SparseGraph): time to travel each path on the map
+
+    Returns:
+        np.ndarray: (..., nb_passengers, nb_steps) travel times, 0 for the still and empty cells
+    """
+    solution = np.asarray(ride_path_solution)
+    from_nodes, to_nodes = solution[..., 0], solution[..., 1]
+    moving = (from_nodes != to_nodes) & (from_nodes >= 0) & (to_nodes >= 0)
+    if isinstance(time_map, SparseGraph):
+        times = np.nan_to_num(time_map.edge_times(from_nodes, to_nodes))
+    else:
+        times = np.asarray(time_map)[np.where(moving, from_nodes, 0),
+                                     np.where(moving, to_nodes, 0)]
+    return np.where(moving, times, 0)
+
+
+def get_vehicles_in_use(ride_vehicle_solution, nb_vehicles) -> np.ndarray:
+    """Return the number of vehicles carrying at least one passenger at each step
+
+    Args:
+        ride_vehicle_solution (np.ndarray): (..., nb_passengers, nb_steps) vehicle of each passenger, -1 if none
+        nb_vehicles (int): number of vehicles
+
+    Returns:
+        np.ndarray: (..., nb_steps) number of vehicles in use
+    """
+    solution = np.asarray(ride_vehicle_solution)
+    *batch_shape, nb_passengers, nb_steps = solution.shape
+    solution = solution.reshape(-1, nb_passengers, nb_steps)
+    # one (solution, step) group per column
+    groups = np.broadcast_to(np.arange(len(solution))[:, None, None] * nb_steps +
+                             np.arange(nb_steps), solution.shape)
+    in_vehicle = (solution >= 0) & (solution < nb_vehicles)
+    occupancy = np.bincount(groups[in_vehicle] * nb_vehicles + solution[in_vehicle],
+                            minlength=len(solution) * nb_steps * nb_vehicles)
+    vehicles = np.count_nonzero(occupancy.reshape(-1, nb_vehicles), axis=1)
+    return vehicles.reshape(*batch_shape, nb_steps)
+
+
+def get_objective(travel_time, vehicles, alpha):
+    """Return the alpha-weighted objective
+
+    Args:
+        travel_time (float or np.ndarray): total travel time of the passengers
+        vehicles (int or np.ndarray): number of vehicles in use summed over the steps
+        alpha (float): balance between time (alpha=0) and number of vehicles (alpha=1)
+    """
+    return (1 - alpha) * travel_time + alpha * vehicles
+
+
+def compute_score(ride_path, ride_vehicle, time_map, alpha) -> float:
+    """Return the score of a solution, lower is better
+
+    Args:
+        ride_path (RidePath): paths of the passengers
+        ride_vehicle (RideVehicle): vehicle of the passengers
+        time_map (np.ndarray or SparseGraph): time to travel each path on the map
+        alpha (float): balance between time (alpha=0) and number of vehicles (alpha=1)
+    """
+    travel_time = get_travel_times(
+        ride_path.solution[:ride_path.nb_entity], time_map).sum()
+    vehicles = get_vehicles_in_use(
+        ride_vehicle.solution[:ride_vehicle.nb_entity], ride_vehicle.nb_vehicles).sum()
+    return float(get_objective(travel_time, vehicles, alpha))
+
+
+class ScoreEvaluator:
+    """ScoreEvaluator class
+
+    Keeps the travel time of each passenger cell and the occupancy of each
+    vehicle at each step. It listens to the in place changes of the ride path
+    and the ride vehicle, so the score is always up to date, and the score
+    change of a single cell move is computed in O(1) before applying it.
+
+    The evaluator is not notified when the solution arrays are replaced
+    (ex: ride_path.solution = matrix), call reset() in that case.
+    """
+
+    def __init__(self, ride_path, ride_vehicle, time_map, alpha) -> None:
+        """Initialize the ScoreEvaluator object
+
+        Args:
+            ride_path (RidePath): paths of the passengers
+            ride_vehicle (RideVehicle): vehicle of the passengers
+            time_map (np.ndarray or SparseGraph): time to travel each path on the map
+            alpha (float): balance between time (alpha=0) and number of vehicles (alpha=1)
+        """
+        self.ride_path = ride_path
+        self.ride_vehicle = ride_vehicle
+        self.time_map = time_map
+        self.alpha = alpha
+        self.reset()
+        ride_path.add_listener(self)
+        ride_vehicle.add_listener(self)
+
+    @property
+    def score(self) -> float:
+        """Score of the current solution, see compute_score
+        """
+        return float(get_objective(self.travel_time, self.vehicles, self.alpha))
+
+    def close(self):
+        """Stop listening to the solutions
+        """
+        self.ride_path.remove_listener(self)
+        self.ride_vehicle.remove_listener(self)
+
+    def reset(self):
+        """Compute the travel times and the occupancy from scratch
+        """
+        ride_path, ride_vehicle = self.ride_path, self.ride_vehicle
+        self._times = get_travel_times(
+            ride_path.solution[:ride_path.nb_entity], self.time_map).astype(float)
+        self.travel_time = float(self._times.sum())
+        self._occupancy = ride_vehicle._vehicle_occupancy()
+        self.vehicles = int(np.count_nonzero(self._occupancy))
+
+    def _vehicle_delta(self, step, old_vehicle, vehicle) -> int:
+        """Return the change of the number of vehicles in use if a passenger changes vehicle at step
+        """
+        if old_vehicle == vehicle:
+            return 0
+        delta = 0
+        if 0 <= old_vehicle < self.ride_vehicle.nb_vehicles and self._occupancy[step, old_vehicle] == 1:
+            delta -= 1
+        if 0 <= vehicle < self.ride_vehicle.nb_vehicles and self._occupancy[step, vehicle] == 0:
+            delta += 1
+        return delta
+
+    def ride_path_delta(self, passenger, step, value) -> float:
+        """Return the score change if the ride path cell (passenger, step) is set to value
+
+        On a compact ride path, the score change covers the neighbouring cells
+        rewritten with the cell (see Path._affected_cells).
+
+        Args:
+            passenger (int): passenger of the cell
+            step (int): step of the cell
+            value (list): new [from, to] of the cell
+        """
+        ride_path = self.ride_path
+        step %= ride_path.nb_steps
+        entities, steps = ride_path._affected_cells(
+            np.array([passenger]), np.array([step]))
+        if ride_path.compact:
+            # the previous and next cells share a node with the set cell
+            nodes = ride_path.nodes[passenger].copy()
+            nodes[step:step + 2] = value
+            values = np.stack([nodes[steps], nodes[steps + 1]], axis=-1)
+        else:
+            values = np.asarray(value)[None]
+        times = get_travel_times(values, self.time_map)
+        return float((1 - self.alpha) * (times.sum() - self._times[entities, steps].sum()))
+
+    def ride_vehicle_delta(self, passenger, step, value) -> float:
+        """Return the score change if the ride vehicle cell (passenger, step) is set to value
+
+        Args:
+            passenger (int): passenger of the cell
+            step (int): step of the cell
+            value (int): new vehicle of the passenger, -1 if none
+        """
+        old_vehicle = int(self.ride_vehicle.solution[passenger, step])
+        return float(self.alpha * self._vehicle_delta(step, old_vehicle, int(value)))
+
+    def update(self, solution, entities, steps, old_values):
+        """Update the state after the cells (entities, steps) of solution changed, see IncrementalEvaluator.update
+        """
+        if solution is self.ride_path:
+            nb_steps = self.ride_path.nb_steps
+            inside = entities < self.ride_path.nb_entity
+            # the same cell can be listed several times
+            cells = np.unique(entities[inside] * nb_steps + steps[inside])
+            entities, steps = cells // nb_steps, cells % nb_steps
+            times = get_travel_times(
+                self.ride_path.solution[entities, steps], self.time_map)
+            self.travel_time += float(times.sum() -
+                                      self._times[entities, steps].sum())
+            self._times[entities, steps] = times
+            return
+        for entity, step, old_value in zip(entities, steps, old_values):
+            if entity >= self.ride_vehicle.nb_entity:
+                continue
+            vehicle = int(self.ride_vehicle.solution[entity, step])
+            self.vehicles += self._vehicle_delta(step, int(old_value), vehicle)
+            if 0 <= old_value < self.ride_vehicle.nb_vehicles:
+                self._occupancy[step, old_value] -= 1
+            if 0 <= vehicle < self.ride_vehicle.nb_vehicles:
+                self._occupancy[step, vehicle] += 1
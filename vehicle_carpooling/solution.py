@@ -10,6 +10,7 @@ import math
 import copy
 import logging
 import vehicle_carpooling.utils as utils
+from vehicle_carpooling.topology import Topology
 from matplotlib import colors as mcolors
 import concurrent.futures
 
@@ -20,7 +21,7 @@ class Solution:
     """Solution class
     """
 
-    def __init__(self, nb_steps, nb_nodes, nb_entity, empty_value, path_map) -> None:
+    def __init__(self, nb_steps, nb_nodes, nb_entity, empty_value, path_map, topology=None) -> None:
         """Initialize the Solution object
 
         Args:
@@ -28,23 +29,93 @@ class Solution:
             nb_nodes (int): number of nodes
             nb_entity (int): number of entity (passenger / vehicles)
             empty_value (int or list): value of empty
-            path_map (np.ndarray): possible path on the map
+            path_map (np.ndarray or SparseGraph): possible path on the map
+            topology (Topology, optional): shared topology of the map, replaces path_map. Defaults to None.
         """
         self.nb_steps = nb_steps
         self.nb_nodes = nb_nodes
         self.nb_entity = nb_entity
-        self.path_map = path_map
-        self.paths = utils.paths.get_paths(path_map)
-        self.next_paths = utils.paths.get_next_paths(path_map)
-        self.next_nodes = utils.paths.get_next_nodes(path_map)
+        self.topology = topology if topology is not None else Topology(
+            path_map)
+        self.path_map = self.topology.path_map
         self.empty_value = empty_value
         self.violation_count = 0
-        self.solution = np.array(
-            [[empty_value for _ in range(self.nb_steps)] for _ in range(self.nb_entity)])
+        # evaluate the constraints with whole-array operations
+        self.vectorized = True
+        self.solution = np.full(
+            (self.nb_entity, self.nb_steps) + np.shape(empty_value), empty_value)
         # solutions per entity
         self.solutions_pe = dict([(entity, [])
                                  for entity in range(self.nb_entity)])
         self.solutions_pe_index = [_ for _ in range(self.nb_entity)]
+        # objects notified of the in place changes (see set_cells)
+        self._listeners = []
+        # (entities, steps, old values) of the changes since the last commit
+        self._undo_log = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # listeners are bound to this object and are not copied
+        state["_listeners"] = []
+        return state
+
+    def add_listener(self, listener):
+        """Notify listener of every in place change of the solution
+
+        Args:
+            listener: object with an update(solution, entities, steps, old_values) method
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """Stop notifying listener of the changes of the solution
+        """
+        self._listeners.remove(listener)
+
+    @property
+    def paths(self):
+        """All possible paths from the map
+        """
+        return self.topology.paths
+
+    @property
+    def next_paths(self):
+        """Possible paths from each node of the map
+        """
+        return self.topology.next_paths
+
+    @property
+    def next_nodes(self):
+        """Legal next nodes of each node of the map
+        """
+        return self.topology.next_nodes
+
+    def set_cells(self, entities, steps, values):
+        """Set the values of (entity, step) cells in place and notify the listeners
+
+        Args:
+            entities (int or np.ndarray): entities of the cells
+            steps (int or np.ndarray): steps of the cells
+            values: new values of the cells
+        """
+        entities, steps = np.broadcast_arrays(entities, steps)
+        entities = entities.ravel()
+        steps = steps.ravel() % self.nb_steps
+        affected_entities, affected_steps = self._affected_cells(
+            entities, steps)
+        old_values = self.solution[affected_entities, affected_steps].copy()
+        self.solution[entities, steps] = values
+        if self._undo_log is not None:
+            self._undo_log.append(
+                (affected_entities, affected_steps, old_values))
+        for listener in self._listeners:
+            listener.update(self, affected_entities,
+                            affected_steps, old_values)
+
+    def _affected_cells(self, entities, steps):
+        """Return the cells whose value can change when the (entities, steps) cells are set
+        """
+        return entities, steps
 
     def _iter(self, depth=4):
         """Return iterator of indexes the solution using the solution shape
@@ -69,70 +140,205 @@ class Solution:
         """
         return self.empty_value
 
-    def _initiate_shuffle(self):
+    def _random_values(self, entities, step, rng):
+        """Return random values for several entities at step
+
+        Args:
+            entities (np.ndarray): entities
+            step (int): step
+            rng (np.random.Generator): random generator
+        """
+        return self.empty_value
+
+    def _initiate_shuffle(self, rng=None):
         """Initiate the shuffle
 
         Select starting points or finish points if exists
 
+        Args:
+            rng (np.random.Generator, optional): random generator, the global random state is used if None. Defaults to None.
+
         Return:
             list of selected steps
         """
         return []
 
-    def shuffle(self, rate):
+    def shuffle(self, rate, rng=None):
         """Shuffle the solution
 
         Args:
             rate (float): rate of shuffle
+            rng (np.random.Generator, optional): random generator, if given the shuffled cells are sampled in bulk. Defaults to None.
         """
-        done_steps = self._initiate_shuffle()
+        done_steps = self._initiate_shuffle(rng)
+        if rng is not None:
+            mask = rng.random((self.nb_entity, self.nb_steps)) < rate
+            mask[:, done_steps] = False
+            # steps are shuffled in order as a value depends on the previous step
+            for step in range(self.nb_steps):
+                entities = np.flatnonzero(mask[:, step])
+                if entities.size:
+                    self.set_cells(entities, step, self._random_values(
+                        entities, step, rng))
+            return
         for entity in range(self.nb_entity):
             for step in range(self.nb_steps):
                 if not step in done_steps:
                     if np.random.rand() < rate:
-                        self.solution[entity, step] = self._random_value(
-                            entity, step)
+                        self.set_cells(entity, step, self._random_value(
+                            entity, step))
+
+    def _nb_solutions(self, entity) -> int:
+        """Return the number of computed solutions of an entity
+        """
+        solutions = self.solutions_pe[entity]
+        if isinstance(solutions, utils.trees.TripDAG):
+            # can exceed the range of len()
+            return solutions.nb_trips
+        return len(solutions)
 
-    def tree_suffle(self):
+    def tree_suffle(self, rng=None):
         """Shuffle the solution using tree
+
+        Args:
+            rng (np.random.Generator, optional): random generator, the global random state is used if None. Defaults to None.
         """
         for entity in range(self.nb_entity):
-            if self.solutions_pe[entity]:
-                index = np.random.randint(0, len(self.solutions_pe[entity]))
-                self.solution[entity] = self.solutions_pe[entity][index]
+            nb_solutions = self._nb_solutions(entity)
+            if nb_solutions:
+                index = utils.trees.random_rank(nb_solutions, rng)
+                self.set_cells(entity, np.arange(self.nb_steps),
+                               self.solutions_pe[entity][index])
                 self.solutions_pe_index[entity] = index
-                if self.solution[entity] == []:
+                if self.solution[entity].size == 0:
                     raise Exception("A entity has no solution", entity)
 
     def copy(self):
-        return copy.deepcopy(self)
+        """Return a copy of the solution
 
-    def get_neighbor(self, rate, temperature):
-        """Return a neighbor of the current solution
+        The topology and the computed solutions are shared with the copy,
+        only the mutable assignment arrays are duplicated.
         """
-        neighbor = self.copy()
+        neighbor = copy.copy(self)
+        neighbor.solution = self.solution.copy()
+        neighbor.solutions_pe_index = self.solutions_pe_index.copy()
+        neighbor._listeners = []
+        neighbor._undo_log = None
+        return neighbor
+
+    def _begin_move(self):
+        """Start recording the changes if they are not already recorded
+        """
+        if self._undo_log is None:
+            self._undo_log = []
+
+    def commit(self):
+        """Keep the moves applied since the last commit or rollback
+        """
+        self._undo_log = None
+
+    def rollback(self):
+        """Undo the moves applied since the last commit or rollback
+        """
+        undo_log, self._undo_log = self._undo_log, None
+        for entities, steps, old_values in reversed(undo_log or []):
+            if steps is None:
+                self.solutions_pe_index[entities] = old_values
+            else:
+                self.set_cells(entities, steps, old_values)
+
+    def _set_changed_cells(self, new_solution):
+        """Set the cells of new_solution that differ from the solution
+        """
+        changed = new_solution != self.solution[:self.nb_entity]
+        if changed.ndim == 3:
+            changed = changed.any(axis=-1)
+        entities, steps = np.nonzero(changed)
+        utils.profiling.count("moves.changed_cells", entities.size)
+        if entities.size:
+            self.set_cells(entities, steps, new_solution[entities, steps])
+
+    @utils.profiling.timed("moves.move")
+    def move(self, rate, temperature, rng=None):
+        """Apply a neighbor move in place
+
+        The changes are recorded until commit() keeps them or rollback() undoes them.
+
+        Args:
+            rate (float): rate of changed cells
+            temperature (int): maximum node shift of the changed cells
+            rng (np.random.Generator, optional): random generator, if given the move is sampled in bulk. Defaults to None.
+        """
+        self._begin_move()
+        if rng is not None:
+            shape = (self.nb_entity, self.nb_steps)
+            mask = rng.random(shape) < rate
+            shifts = temperature * rng.choice([-1, 1], shape)
+            new_solution = self.solution[:self.nb_entity].copy()
+            swap_nodes = np.clip(
+                new_solution[:, :, 1] + shifts, 0, self.nb_nodes - 1)
+            new_solution[:, :, 1] = np.where(
+                mask, swap_nodes, new_solution[:, :, 1])
+            # keep the path continuous
+            new_solution[:, 1:, 0] = np.where(
+                mask[:, :-1], new_solution[:, :-1, 1], new_solution[:, 1:, 0])
+            self._set_changed_cells(new_solution)
+            return
         for entity in range(self.nb_entity):
             for step in range(self.nb_steps):
                 if np.random.rand() < rate:
-                    swap_node = neighbor.solution[entity, step, 1]
+                    swap_node = self.solution[entity, step, 1]
                     swap_node += temperature * np.random.choice([-1, 1])
                     swap_node = max(0, min(swap_node, self.nb_nodes - 1))
-                    neighbor.solution[entity, step, 1] = swap_node
+                    self.set_cells(
+                        entity, step, [self.solution[entity, step, 0], swap_node])
                     if step < self.nb_steps - 1:
-                        neighbor.solution[entity, step+1, 0] = swap_node
+                        self.set_cells(
+                            entity, step+1, [swap_node, self.solution[entity, step+1, 1]])
+
+    def tree_move(self, temperature, rng=None):
+        """Apply a tree neighbor move in place
+
+        The changes are recorded until commit() keeps them or rollback() undoes them.
+
+        Args:
+            temperature (0<float<1): rate of changement for neighbors
+            rng (np.random.Generator, optional): random generator, the global random state is used if None. Defaults to None.
+        """
+        self._begin_move()
+        self.get_tree_neighbor(temperature, rng)
+
+    @utils.profiling.timed("moves.neighbor")
+    def get_neighbor(self, rate, temperature, rng=None):
+        """Return a neighbor of the current solution
+
+        Args:
+            rate (float): rate of changed cells
+            temperature (int): maximum node shift of the changed cells
+            rng (np.random.Generator, optional): random generator, if given the move is sampled in bulk. Defaults to None.
+        """
+        neighbor = self.copy()
+        neighbor.move(rate, temperature, rng)
+        neighbor.commit()
         return neighbor
 
-    def get_tree_neighbor(self, temperature):
+    @utils.profiling.timed("moves.tree_neighbor")
+    def get_tree_neighbor(self, temperature, rng=None):
         """Return a neighbor of the current solution using the computed solutions
 
         Args:
             temperature (0<float<1): rate of changement for neighbors
+            rng (np.random.Generator, optional): random generator, the global random state is used if None. Defaults to None.
         """
         for entity in range(self.nb_entity):
-            if np.random.rand() < temperature:
+            if (rng.random() if rng is not None else np.random.rand()) < temperature:
+                if self._undo_log is not None:
+                    self._undo_log.append(
+                        (entity, None, self.solutions_pe_index[entity]))
                 self.solutions_pe_index[entity] = (
-                    self.solutions_pe_index[entity] + 1) % len(self.solutions_pe[entity])
-                self.solution[entity] = self.solutions_pe[entity][self.solutions_pe_index[entity]]
+                    self.solutions_pe_index[entity] + 1) % self._nb_solutions(entity)
+                self.set_cells(entity, np.arange(self.nb_steps),
+                               self.solutions_pe[entity][self.solutions_pe_index[entity]])
 
 
 class Path(Solution):
@@ -141,7 +347,7 @@ class Path(Solution):
     Used for utils for path type solution
     """
 
-    def __init__(self, nb_steps, nb_nodes, nb_entity, empty_value, path_map, path_type) -> None:
+    def __init__(self, nb_steps, nb_nodes, nb_entity, empty_value, path_map, path_type, topology=None, compact=False) -> None:
         """Initialize the Path object
 
         Args:
@@ -149,21 +355,115 @@ class Path(Solution):
             nb_nodes (int): number of nodes
             nb_entity (int): number of entity (passenger / vehicles)
             empty_value (int or list): value of empty
-            path_map (np.ndarray): possible path on the map
+            path_map (np.ndarray or SparseGraph): possible path on the map
+            topology (Topology, optional): shared topology of the map, replaces path_map. Defaults to None.
+            compact (bool, optional): store the paths as node sequences, see set_node_sequence. Defaults to False.
         """
-        super().__init__(nb_steps, nb_nodes, nb_entity, empty_value, path_map)
+        super().__init__(nb_steps, nb_nodes, nb_entity,
+                         empty_value, path_map, topology)
         self.path_type = path_type
         self.colors = [None for _ in range(self.nb_entity)]
+        self.compact = compact
+        if compact:
+            self.set_node_sequence(np.full((self.nb_entity, self.nb_steps + 1),
+                                           empty_value[0], dtype=utils.paths.get_node_dtype(self.nb_nodes)))
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        if self.compact:
+            # the solution is a view of the nodes
+            del state["solution"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.compact:
+            self.set_node_sequence(self.nodes)
+
+    def copy(self):
+        neighbor = super().copy()
+        neighbor.colors = self.colors.copy()
+        if self.compact:
+            neighbor.set_node_sequence(self.nodes.copy())
+        return neighbor
+
+    def get_node_sequence(self) -> np.ndarray:
+        """Return the (entity, nb_steps + 1) node sequence of the paths
+
+        The node sequence of a non compact path is only valid if the path is continuous.
+        """
+        if self.compact:
+            return self.nodes
+        return utils.paths.get_node_sequence(self.solution)
+
+    def set_node_sequence(self, nodes):
+        """Set the paths from a (entity, nb_steps + 1) node sequence
+
+        A compact path keeps the nodes and its solution is a writeable
+        (entity, nb_steps, 2) [from, to] view of them, so the path is
+        continuous by construction and the constraint checks work unchanged.
+
+        Args:
+            nodes (np.ndarray): node sequence of each entity
+        """
+        if self.compact:
+            self.nodes = nodes
+            self.solution = utils.paths.get_edge_view(nodes)
+        else:
+            self.solution = utils.paths.get_edge_view(nodes).copy()
+
+    def _affected_cells(self, entities, steps):
+        if not self.compact:
+            return entities, steps
+        # the previous and next cells share a node with the set cells
+        entities = np.concatenate([entities, entities, entities])
+        steps = np.concatenate([steps - 1, steps, steps + 1])
+        inside = (steps >= 0) & (steps < self.nb_steps)
+        cells = np.unique(entities[inside] *
+                          self.nb_steps + steps[inside])
+        return cells // self.nb_steps, cells % self.nb_steps
+
+    def _path_units(self, solution) -> np.ndarray:
+        """Return the cells on non paths
+
+        Args:
+            solution (np.ndarray): (..., entity, nb_steps, 2) path solutions, with optional leading batch axes
+
+        Returns:
+            np.ndarray: (..., nb_entity, nb_steps) True for the violating cells
+        """
+        solution = solution[..., :self.nb_entity, :, :]
+        return ~self.path_map[solution[..., 0], solution[..., 1]].astype(bool)
+
+    def _continuous_units(self, solution) -> np.ndarray:
+        """Return the cells not followed by a cell starting at their end, see _path_units
+
+        Returns:
+            np.ndarray: (..., nb_entity, nb_steps - 1) True for the violating cells
+        """
+        solution = solution[..., :self.nb_entity, :, :]
+        return solution[..., :-1, 1] != solution[..., 1:, 0]
+
+    def _random_next_paths(self, nodes, rng):
+        """Return a random legit path from each node
+
+        Args:
+            nodes (np.ndarray): starting nodes
+            rng (np.random.Generator): random generator
+        """
+        return np.stack([nodes, self.topology.graph.random_neighbors(nodes, rng)], axis=1)
+
+    def _random_values(self, entities, step, rng):
+        return self._random_next_paths(self.solution[entities, step-1, 1], rng)
 
     def graph(self, select_entity=None):
         """Create a graph of the solution to visualise the paths
         """
         MDG = nx.MultiDiGraph()
         MDG.add_nodes_from([node for node in range(self.nb_nodes)])
-        for node_i in range(self.nb_nodes):
-            for node_j in range(self.nb_nodes):
-                if node_i != node_j and self.path_map[node_i, node_j]:
-                    MDG.add_edge(node_i, node_j)
+        for node_i, node_j in self.paths:
+            if node_i != node_j:
+                MDG.add_edge(node_i, node_j)
         pos = nx.spring_layout(MDG, seed=111)
         ax = plt.gca()
         ax.set_title('Solution')
@@ -218,7 +518,7 @@ class RidePath(Path):
     This class is used to compute the paths of the passengers
     """
 
-    def __init__(self, nb_steps: int, nb_nodes: int, nb_passengers: int, passenger_start_points: np.ndarray, passenger_finish_points: np.ndarray, path_map: np.ndarray, nb_vehicles: int, vehicle_capacity: int) -> None:
+    def __init__(self, nb_steps: int, nb_nodes: int, nb_passengers: int, passenger_start_points: np.ndarray, passenger_finish_points: np.ndarray, path_map: np.ndarray | utils.graphs.SparseGraph, nb_vehicles: int, vehicle_capacity: int, topology: Topology = None, compact: bool = False, nb_trips: int = None, time_ranking: bool = False, trip_time_budget: float = None, trip_sampling: bool = False, trip_cache: utils.cache.TripCache = None, executor: utils.workers.TripExecutor = None, streaming: bool = False, trip_spill_threshold: int = None, trip_spill_directory: str = None) -> None:
         """Initialize the RidePath object
 
         Args:
@@ -227,51 +527,287 @@ class RidePath(Path):
             nb_passengers (int): number of passengers
             passenger_start_points (np.ndarray): passenger start points
             passenger_finish_points (np.ndarray): passenger finish points
-            path_map (np.ndarray): possible path on the map
+            path_map (np.ndarray or SparseGraph): possible path on the map
             nb_vehicles (int): number of vehicles
             vehicle_capacity (int): vehicle capacity
+            topology (Topology, optional): shared topology of the map, replaces path_map. Defaults to None.
+            compact (bool, optional): store the paths as node sequences. Defaults to False.
+            nb_trips (int, optional): only compute the nb_trips best trips of each passenger instead of all the trips. Defaults to None.
+            time_ranking (bool, optional): rank the best trips by travel time instead of hops, needs a time map. Defaults to False.
+            trip_time_budget (float, optional): maximum time in seconds to compute the best trips of a passenger. Defaults to None.
+            trip_sampling (bool, optional): count the trips of each passenger in a utils.trees.TripDAG instead of computing them. Defaults to False.
+            trip_cache (utils.cache.TripCache, optional): on-disk cache read before computing the trips of a passenger. Defaults to None.
+            executor (utils.workers.TripExecutor, optional): executor computing the trips, the shared process executor if None. Defaults to None.
+            streaming (bool, optional): start with the shortest trip of each passenger and add the other trips as they are computed, see poll_solutions. Defaults to False.
+            trip_spill_threshold (int, optional): size in bytes above which the trip pool is stored in memory-mapped files, see utils.trips.TripPool. Defaults to None.
+            trip_spill_directory (str, optional): parent directory of the spilled trip pool. Defaults to None.
         """
         super().__init__(nb_steps, nb_nodes, nb_passengers,
-                         [-1, -1], path_map, "Ride path")
+                         [-1, -1], path_map, "Ride path", topology, compact)
         self.passenger_start_points = passenger_start_points
         self.passenger_finish_points = passenger_finish_points
         self.nb_vehicles = nb_vehicles
         self.vehicle_capacity = vehicle_capacity
-        self._compute_solutions()
+        time_map = None
+        if time_ranking:
+            time_map = self.topology.graph
+            if time_map.times is None:
+                raise ValueError("Ranking the trips by time needs a time map")
+        # arguments of utils.trees.compute_solutions
+        self.trip_settings = dict(
+            k=nb_trips, time_map=time_map, time_budget=trip_time_budget)
+        self.trip_cache = trip_cache
+        self.executor = executor
+        self.streaming = streaming
+        self.trip_sampling = trip_sampling
+        # futures of the trips computed in the background (streaming)
+        self._pending_trips = []
+        # passengers of each OD pair
+        self._od_passengers = dict()
+        # utils.trees.FlatTree of the trips of each OD pair, built on request
+        self._trip_trees = dict()
+        # trips of the distinct OD pairs, shared by the passengers
+        self.trip_pool = utils.trips.TripPool(nb_steps, utils.paths.get_node_dtype(self.nb_nodes),
+                                              trip_spill_threshold, trip_spill_directory)
+        # (start trip, stop trip) of each passenger in the trip pool
+        self.trip_ranges = np.zeros((self.nb_entity, 2), dtype=np.int64)
+        if trip_cache is not None:
+            # the trips of a passenger only depend on the map, the settings and the OD pair
+            self._trip_settings_fingerprint = utils.cache.get_fingerprint(
+                self.topology.fingerprint, self.nb_steps, *[self.trip_settings[name] for name in sorted(self.trip_settings)])
+        if trip_sampling:
+            self._count_solutions()
+        else:
+            self._compute_solutions()
+        # trip ranges the solutions_pe_index refer to, see _remap_trip_indexes
+        self._index_ranges = self.trip_ranges.copy()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        # the pool of the executor and its futures cannot be pickled
+        state["executor"] = None
+        state["_pending_trips"] = []
+        return state
 
     def _old_compute_solutions(self):
         for passenger in range(self.nb_entity):
             start_point = self.passenger_start_points[passenger]
             finish_point = self.passenger_finish_points[passenger]
             self.solutions_pe[passenger] = utils.trees.compute_solutions(
-                start_point, finish_point, self.nb_steps, self.next_nodes)
+                start_point, finish_point, self.nb_steps, self.next_nodes, **self.trip_settings)
+
+    def _trip_cache_key(self, od_pair) -> str:
+        """Return the key of the trips of an OD pair in the trip cache
+        """
+        return utils.cache.get_fingerprint(self._trip_settings_fingerprint, *od_pair)
 
     def _compute_solutions(self):
-        with concurrent.futures.ProcessPoolExecutor() as executor:
-            futures = {executor.submit(utils.trees.compute_solutions,
-                                       self.passenger_start_points[passenger],
-                                       self.passenger_finish_points[passenger],
-                                       self.nb_steps,
-                                       self.next_nodes): passenger for passenger in range(self.nb_entity)}
-            for future in concurrent.futures.as_completed(futures):
-                passenger = futures[future]
-                try:
-                    self.solutions_pe[passenger] = future.result()
-                    # print(f"Finished {passenger} passenger")
-                except Exception as exc:
-                    print(
-                        f'Passenger {passenger} generated an exception during the initialization: {exc}')
-
-    def _initiate_shuffle(self):
+        """Compute the trips of each distinct OD pair once in the trip pool
+        """
+        od_pairs = self._od_passengers
+        for passenger in range(self.nb_entity):
+            od_pair = (int(self.passenger_start_points[passenger]),
+                       int(self.passenger_finish_points[passenger]))
+            od_pairs.setdefault(od_pair, []).append(passenger)
+        utils.profiling.count("trips.od_pairs", len(od_pairs))
+        missing_od_pairs = []
+        for od_pair in od_pairs:
+            trips = None
+            if self.trip_cache is not None:
+                trips = self.trip_cache.get(self._trip_cache_key(od_pair))
+            if trips is None:
+                missing_od_pairs.append(od_pair)
+            else:
+                self.trip_pool.add(od_pair, trips)
+        if missing_od_pairs:
+            executor = self.executor or utils.workers.get_default_executor()
+            if self.streaming:
+                for od_pair in missing_od_pairs:
+                    self.trip_pool.add(od_pair, self._get_shortest_trip(od_pair))
+                self._pending_trips[:] = executor.submit_trips(self.topology, missing_od_pairs, self.nb_steps,
+                                                            self.trip_settings, self.trip_pool.dtype)
+            else:
+                # each chunk is added as soon as it is computed, so a spilled pool is written sequentially
+                for trips in executor.iter_trips(self.topology, missing_od_pairs, self.nb_steps,
+                                                 self.trip_settings, self.trip_pool.dtype):
+                    self._add_trips(trips)
+        self._set_solutions(od_pairs)
+
+    def _get_shortest_trip(self, od_pair) -> np.ndarray:
+        """Return the (0 or 1, nb_steps + 1) node sequence of the shortest trip of an OD pair
+        """
+        trip = utils.paths.get_shortest_path(
+            self.topology.graph, od_pair[0], self.topology.hop_distances(od_pair[1]))
+        if trip is None or len(trip) > self.nb_steps + 1:
+            return np.empty((0, self.nb_steps + 1), dtype=self.trip_pool.dtype)
+        return np.array([trip + [trip[-1]] * (self.nb_steps + 1 - len(trip))], dtype=self.trip_pool.dtype)
+
+    def _add_trips(self, trips):
+        """Add the computed trips of OD pairs to the trip pool and the trip cache
+        """
+        for od_pair, nodes in trips.items():
+            self.trip_pool.add(od_pair, nodes, replace=True)
+            if self.trip_cache is not None:
+                self.trip_cache.put(self._trip_cache_key(od_pair), nodes)
+
+    def _set_solutions(self, od_pairs):
+        """Set the solutions of the passengers of OD pairs from the trip pool
+        """
+        for od_pair in od_pairs:
+            trips = self.trip_pool.trips(od_pair)
+            for passenger in self._od_passengers[od_pair]:
+                self.solutions_pe[passenger] = trips
+                # in place, the copies of the solution share the ranges
+                self.trip_ranges[passenger] = (trips.start, trips.stop)
+
+    def poll_solutions(self, wait=False) -> bool:
+        """Add the trips computed in the background to the solutions of the passengers
+
+        Args:
+            wait (bool, optional): wait until all the trips are computed. Defaults to False.
+
+        Raises:
+            utils.workers.TripEnumerationError: the trips of an OD pair could not be computed
+
+        Returns:
+            bool: True if all the trips are computed
+        """
+        if wait:
+            concurrent.futures.wait(self._pending_trips)
+        done = [future for future in self._pending_trips if future.done()]
+        if done:
+            # in place, the copies of the solution share the pending trips
+            self._pending_trips[:] = [
+                future for future in self._pending_trips if future not in done]
+            od_pairs = []
+            for future in done:
+                trips = future.result()
+                self._add_trips(trips)
+                od_pairs.extend(trips)
+            self._set_solutions(od_pairs)
+        # the copies of the solution share the trip ranges, not the indexes
+        self._remap_trip_indexes()
+        return not self._pending_trips
+
+    def _remap_trip_indexes(self):
+        """Map the trip indexes of the passengers whose trips changed into their new trips
+
+        A passenger keeps its trip if it is in the new trips. Otherwise a
+        passenger on the removed trip is moved to the first new trip, with
+        set_cells so the listeners are notified. The remapping is not recorded
+        in the undo log, a rollback cannot restore the previous trips.
+        """
+        changed = np.flatnonzero(
+            (self.trip_ranges != self._index_ranges).any(axis=1))
+        if not changed.size:
+            return
+        index_ranges, self._index_ranges = self._index_ranges, self.trip_ranges.copy()
+        undo_log, self._undo_log = self._undo_log, None
+        moved = []
+        for passenger in changed.tolist():
+            start, stop = index_ranges[passenger]
+            index = self.solutions_pe_index[passenger]
+            if not 0 <= index < stop - start:
+                continue
+            # the previous trips stay in the pool
+            trip = self.trip_pool.gather([start + index])[0]
+            new_start, new_stop = self.trip_ranges[passenger]
+            matches = np.flatnonzero((self.trip_pool.gather(
+                np.arange(new_start, new_stop)) == trip).all(axis=1))
+            if matches.size:
+                self.solutions_pe_index[passenger] = int(matches[0])
+            elif new_stop > new_start and np.array_equal(self.solution[passenger], utils.paths.get_edge_view(trip)):
+                moved.append(passenger)
+            else:
+                self.solutions_pe_index[passenger] = 0
+        if moved:
+            self._set_trips(np.array(moved), np.zeros(len(moved), dtype=np.int64))
+        self._undo_log = undo_log
+
+    def _set_trips(self, passengers, indexes):
+        """Set the solution of passengers to their trips of given indexes, with one gather from the trip pool
+        """
+        nodes = self.trip_pool.gather(self.trip_ranges[passengers, 0] + indexes)
+        self.set_cells(passengers[:, None], np.arange(self.nb_steps),
+                       utils.paths.get_edge_view(nodes).reshape(-1, 2))
+        for passenger, index in zip(passengers.tolist(), indexes.tolist()):
+            self.solutions_pe_index[passenger] = index
+
+    def tree_suffle(self, rng=None):
+        self.poll_solutions()
+        if self.trip_sampling:
+            return super().tree_suffle(rng)
+        nb_solutions = self.trip_ranges[:, 1] - self.trip_ranges[:, 0]
+        passengers = np.flatnonzero(nb_solutions)
+        if passengers.size:
+            if rng is None:
+                indexes = np.random.randint(0, nb_solutions[passengers])
+            else:
+                indexes = rng.integers(0, nb_solutions[passengers])
+            self._set_trips(passengers, indexes)
+
+    def get_tree_neighbor(self, temperature, rng=None):
+        self.poll_solutions()
+        if self.trip_sampling:
+            return super().get_tree_neighbor(temperature, rng)
+        with utils.profiling.timer("moves.tree_neighbor"):
+            nb_solutions = self.trip_ranges[:, 1] - self.trip_ranges[:, 0]
+            draws = rng.random(self.nb_entity) if rng is not None else np.random.rand(
+                self.nb_entity)
+            passengers = np.flatnonzero(
+                (draws < temperature) & (nb_solutions > 0))
+            if not passengers.size:
+                return
+            indexes = np.array([self.solutions_pe_index[passenger]
+                               for passenger in passengers.tolist()])
+            if self._undo_log is not None:
+                for passenger, index in zip(passengers.tolist(), indexes.tolist()):
+                    self._undo_log.append((passenger, None, index))
+            self._set_trips(passengers, (indexes + 1) %
+                            nb_solutions[passengers])
+
+    def trip_tree(self, passenger) -> utils.trees.FlatTree:
+        """Return the tree of the trips of a passenger
+
+        The tree is built once per OD pair and shared by the passengers and
+        the copies of the solution, pass it to the utils.trees helpers
+        (get_tree_neighbor, get_solution_from_tree...) to walk it in O(depth).
+
+        Args:
+            passenger (int): passenger
+        """
+        od_pair = (int(self.passenger_start_points[passenger]),
+                   int(self.passenger_finish_points[passenger]))
+        tree = self._trip_trees.get(od_pair)
+        if tree is None:
+            tree = self._trip_trees[od_pair] = utils.trees.compute_flat_tree_trips(
+                *od_pair, self.nb_steps, self.topology.graph, self.topology.hop_distances(od_pair[1]))
+        return tree
+
+    def _count_solutions(self):
+        for passenger in range(self.nb_entity):
+            finish_point = self.passenger_finish_points[passenger]
+            self.solutions_pe[passenger] = utils.trees.TripDAG(
+                self.passenger_start_points[passenger], finish_point, self.nb_steps,
+                self.topology.graph, self.topology.trip_counts(finish_point, self.nb_steps))
+
+    def _initiate_shuffle(self, rng=None):
+        if rng is not None:
+            passengers = np.arange(self.nb_entity)
+            self.set_cells(passengers, 0, self._random_next_paths(
+                self.passenger_start_points[:self.nb_entity], rng))
+            self.set_cells(passengers, -1, self._random_next_paths(
+                self.passenger_finish_points[:self.nb_entity], rng))
+            return [0, -1]
         for passenger in range(self.nb_entity):
             start_node = self.passenger_start_points[passenger]
             start_paths = self.next_paths[start_node]
             start_path = start_paths[np.random.choice(len(start_paths))]
-            self.solution[passenger, 0] = start_path
+            self.set_cells(passenger, 0, start_path)
             finish_node = self.passenger_finish_points[passenger]
             finish_paths = self.next_paths[finish_node]
             finish_path = finish_paths[np.random.choice(len(finish_paths))]
-            self.solution[passenger, -1] = finish_path
+            self.set_cells(passenger, -1, finish_path)
         return [0, -1]
 
     def _random_value(self, entity, step):
@@ -280,9 +816,41 @@ class RidePath(Path):
             len(self.next_paths[previous_node]))]
         return [random_legit_continuous_path[0], random_legit_continuous_path[1]]
 
+    def _start_finish_units(self, solution) -> np.ndarray:
+        '''Return the passengers that do not start or finish in designated places
+
+        Args:
+            solution (np.ndarray): (..., nb_passengers, nb_steps, 2) ride path solutions, with optional leading batch axes
+
+        Returns:
+            np.ndarray: (..., nb_entity) True for the violating passengers
+        '''
+        solution = solution[..., :self.nb_entity, :, :]
+        return (solution[..., 0, 0] != self.passenger_start_points[:self.nb_entity]) | \
+            (solution[..., -1, 1] != self.passenger_finish_points[:self.nb_entity])
+
+    def _moving_passengers(self, solution) -> np.ndarray:
+        '''Return the number of passengers moving at each step, see _start_finish_units
+
+        Returns:
+            np.ndarray: (..., nb_steps) number of passengers that are not staying on the same node
+        '''
+        return np.count_nonzero(solution[..., 0] != solution[..., 1], axis=-2)
+
+    def _limit_vehicle_units(self, solution) -> np.ndarray:
+        '''Return the steps with more moving passengers than the vehicles can carry, see _start_finish_units
+
+        Returns:
+            np.ndarray: (..., nb_steps) True for the violating steps
+        '''
+        return self._moving_passengers(solution) / self.vehicle_capacity > self.nb_vehicles
+
     def _check_start_finish_constraint(self) -> bool:
         '''Constraint: Each passenger must start and finish in designated places
         '''
+        if self.vectorized:
+            check = not np.any(self._start_finish_units(self.solution))
+            return self._check_violation(check)
         check = True
         for passenger in range(self.nb_entity):
             check *= self.solution[passenger, 0,
@@ -294,6 +862,9 @@ class RidePath(Path):
     def _check_path_constraint(self) -> bool:
         '''Constraint: Passengers cannot be on non paths (use R and M)
         '''
+        if self.vectorized:
+            check = not np.any(self._path_units(self.solution))
+            return self._check_violation(check)
         check = True
         for passenger in range(self.nb_entity):
             for step in range(self.nb_steps):
@@ -304,6 +875,9 @@ class RidePath(Path):
     def _check_continuous_constraint(self) -> bool:
         '''Constraint: The path needs to be continuous
         '''
+        if self.vectorized:
+            check = not np.any(self._continuous_units(self.solution))
+            return self._check_violation(check)
         check = True
         for passenger in range(self.nb_entity):
             for step in range(self.nb_steps-1):
@@ -314,6 +888,9 @@ class RidePath(Path):
     def _check_limit_vehicle_constraint(self) -> bool:
         '''Constraint: There is a limited total number of vehicles at each step
         '''
+        if self.vectorized:
+            check = not np.any(self._limit_vehicle_units(self.solution))
+            return self._check_violation(check)
         check = True
         for step in range(self.nb_steps):
             # count (not sum) the number of people that are not staying on the same node
@@ -321,6 +898,7 @@ class RidePath(Path):
                                       self.solution[:, step, 1]) / self.vehicle_capacity <= self.nb_vehicles
         return self._check_violation(check)
 
+    @utils.profiling.timed("constraints.ride_path")
     def check_constraint(self, start_finish_constraint=True, path_constraint=True, continuous_constraint=True, limit_vehicle_constraint=True) -> bool:
         '''Constraint: All constraints
 
@@ -349,7 +927,7 @@ class DrivePath(Path):
     This class is used to compute the paths of the vehicles
     """
 
-    def __init__(self, nb_steps: int, nb_nodes: int, nb_vehicles: int, vehicle_capacity: int, vehicle_start_points: np.ndarray, path_map: np.ndarray) -> None:
+    def __init__(self, nb_steps: int, nb_nodes: int, nb_vehicles: int, vehicle_capacity: int, vehicle_start_points: np.ndarray, path_map: np.ndarray | utils.graphs.SparseGraph, topology: Topology = None, compact: bool = False) -> None:
         """Initialize the Drive object
 
         Args:
@@ -358,19 +936,25 @@ class DrivePath(Path):
             nb_vehicles (int): number of vehicles
             vehicle_capacity (int): vehicle capacity
             vehicle_start_points (np.ndarray): list of vehicle start points
-            path_map (np.ndarray): possible path on the map
+            path_map (np.ndarray or SparseGraph): possible path on the map
+            topology (Topology, optional): shared topology of the map, replaces path_map. Defaults to None.
+            compact (bool, optional): store the paths as node sequences. Defaults to False.
         """
         super().__init__(nb_steps, nb_nodes, nb_vehicles,
-                         [-1, -1], path_map, "Drive path")
+                         [-1, -1], path_map, "Drive path", topology, compact)
         self.vehicle_capacity = vehicle_capacity
         self.vehicle_start_points = vehicle_start_points
 
-    def _initiate_shuffle(self):
+    def _initiate_shuffle(self, rng=None):
+        if rng is not None:
+            self.set_cells(np.arange(self.nb_entity), 0, self._random_next_paths(
+                self.vehicle_start_points[:self.nb_entity], rng))
+            return [0]
         for vehicle in range(self.nb_entity):
             start_node = self.vehicle_start_points[vehicle]
             start_paths = self.next_paths[start_node]
             start_path = start_paths[np.random.choice(len(start_paths))]
-            self.solution[vehicle, 0] = start_path
+            self.set_cells(vehicle, 0, start_path)
         return [0]
 
     def _random_value(self, entity, step):
@@ -379,9 +963,23 @@ class DrivePath(Path):
             len(self.next_paths[previous_node]))]
         return [random_legit_continuous_path[0], random_legit_continuous_path[1]]
 
+    def _vehicle_start_units(self, solution) -> np.ndarray:
+        '''Return the vehicles that do not start at designated places
+
+        Args:
+            solution (np.ndarray): (..., nb_vehicles, nb_steps, 2) drive path solutions, with optional leading batch axes
+
+        Returns:
+            np.ndarray: (..., nb_entity) True for the violating vehicles
+        '''
+        return solution[..., :self.nb_entity, 0, 0] != self.vehicle_start_points[:self.nb_entity]
+
     def _check_vehicle_start_constraint(self) -> bool:
         '''Constraint: Each vehicle must start at designated places
         '''
+        if self.vectorized:
+            check = not np.any(self._vehicle_start_units(self.solution))
+            return self._check_violation(check)
         check = True
         for vehicle in range(self.nb_entity):
             check *= self.solution[vehicle,
@@ -391,6 +989,9 @@ class DrivePath(Path):
     def _check_vehicles_path_constraint(self) -> bool:
         '''Constraint: Vehicle cannot be on non paths
         '''
+        if self.vectorized:
+            check = not np.any(self._path_units(self.solution))
+            return self._check_violation(check)
         check = True
         for vehicle in range(self.nb_entity):
             for step in range(self.nb_steps):
@@ -401,6 +1002,9 @@ class DrivePath(Path):
     def _check_vehicles_continuous_constraint(self) -> bool:
         '''Constraint: The path needs to be continuous
         '''
+        if self.vectorized:
+            check = not np.any(self._continuous_units(self.solution))
+            return self._check_violation(check)
         check = True
         for vehicle in range(self.nb_entity):
             for step in range(self.nb_steps-1):
@@ -408,6 +1012,7 @@ class DrivePath(Path):
                                        1] == self.solution[vehicle, step+1, 0]
         return self._check_violation(check)
 
+    @utils.profiling.timed("constraints.drive_path")
     def check_constraint(self, vehicle_start_constraint=True, vehicles_path_constraint=True, vehicles_continuous_constraint=True) -> bool:
         '''Constraint: All constraints
 
@@ -434,27 +1039,150 @@ class RideVehicle(Solution):
     This class is used to link RidePath and DrivePath
     """
 
-    def __init__(self, nb_steps: int, nb_nodes: int, nb_passengers: int, path_map: np.ndarray, nb_vehicles: int, vehicle_capacity: int):
+    def __init__(self, nb_steps: int, nb_nodes: int, nb_passengers: int, path_map: np.ndarray | utils.graphs.SparseGraph, nb_vehicles: int, vehicle_capacity: int, topology: Topology = None):
         """Initialize the RideVehicle object
 
         Args:
             nb_steps (int): number of maximum steps
             nb_nodes (int): number of nodes
             nb_passengers (int): number of passengers
-            path_map (np.ndarray): possible path on the map
+            path_map (np.ndarray or SparseGraph): possible path on the map
             nb_vehicles (int): number of vehicles
             vehicle_capacity (int): vehicle capacity
+            topology (Topology, optional): shared topology of the map, replaces path_map. Defaults to None.
         """
-        super().__init__(nb_steps, nb_nodes, nb_passengers, -1,  path_map)
+        super().__init__(nb_steps, nb_nodes, nb_passengers, -1,  path_map, topology)
         self.nb_vehicles = nb_vehicles
         self.vehicle_capacity = vehicle_capacity
 
     def _random_value(self, entity, step):
         return np.random.randint(0, self.nb_vehicles)
 
+    def _random_values(self, entities, step, rng):
+        return rng.integers(0, self.nb_vehicles, len(entities))
+
+    def _vehicle_groups(self, solution) -> tuple:
+        '''Return the (step, vehicle) group of each passenger in a vehicle
+
+        The groups of a batch of solutions are numbered one solution after the other.
+
+        Args:
+            solution (np.ndarray): (..., nb_passengers, nb_steps) ride vehicle solutions, with optional leading batch axes
+
+        Returns:
+            tuple: mask of the passengers in a vehicle, group of each of them
+        '''
+        nb_groups = self.nb_steps * self.nb_vehicles
+        batch = np.arange(int(np.prod(solution.shape[:-2]))).reshape(
+            solution.shape[:-2] + (1, 1))
+        groups = np.broadcast_to(
+            batch * nb_groups + np.arange(self.nb_steps) * self.nb_vehicles, solution.shape)
+        in_vehicle = (solution >= 0) & (solution < self.nb_vehicles)
+        return in_vehicle, groups[in_vehicle] + solution[in_vehicle]
+
+    def _vehicle_occupancy(self, solution=None, vehicle_groups=None) -> np.ndarray:
+        '''Return the number of passengers in each vehicle at each step
+
+        Args:
+            solution (np.ndarray, optional): (..., nb_passengers, nb_steps) ride vehicle solutions, the solution if None. Defaults to None.
+            vehicle_groups (tuple, optional): _vehicle_groups of the solutions, computed if None. Defaults to None.
+
+        Returns:
+            np.ndarray: occupancy of shape (..., nb_steps, nb_vehicles)
+        '''
+        solution = self.solution if solution is None else solution
+        if vehicle_groups is None:
+            vehicle_groups = self._vehicle_groups(solution)
+        batch_shape = solution.shape[:-2]
+        occupancy = np.bincount(vehicle_groups[1],
+                                minlength=int(np.prod(batch_shape)) * self.nb_steps * self.nb_vehicles)
+        return occupancy.reshape(batch_shape + (self.nb_steps, self.nb_vehicles))
+
+    def _edge_codes(self, path_solution: np.ndarray) -> np.ndarray:
+        '''Encode each [from, to] edge of a path solution as a single integer
+
+        The empty value -1 is shifted so that every code is non negative. The nodes
+        are widened to int64 first, compact paths store them in int8 or int16 which
+        would overflow.
+
+        Args:
+            path_solution (np.ndarray): array of [from, to] edges
+
+        Returns:
+            np.ndarray: edge codes in [0, (nb_nodes + 1) ** 2)
+        '''
+        from_nodes = path_solution[..., 0].astype(np.int64)
+        to_nodes = path_solution[..., 1].astype(np.int64)
+        return (from_nodes + 1) * (self.nb_nodes + 1) + to_nodes + 1
+
+    def _ride_link_units(self, solution, ride_solution) -> np.ndarray:
+        '''Return the passengers in a vehicle while staying on a node
+
+        Args:
+            solution (np.ndarray): (..., nb_passengers, nb_steps) ride vehicle solutions, with optional leading batch axes
+            ride_solution (np.ndarray): (..., nb_passengers, nb_steps, 2) ride path solutions
+
+        Returns:
+            np.ndarray: (..., nb_entity, nb_steps) True for the violating cells
+        '''
+        ride_solution = ride_solution[..., :self.nb_entity, :, :]
+        return (solution[..., :self.nb_entity, :] != -1) & (ride_solution[..., 0] == ride_solution[..., 1])
+
+    def _vehicle_number_link_units(self, occupancy, moving) -> np.ndarray:
+        '''Return the steps where the number of passengers in a vehicle does not match the moving passengers
+
+        Args:
+            occupancy (np.ndarray): (..., nb_steps, nb_vehicles) occupancy, see _vehicle_occupancy
+            moving (np.ndarray): (..., nb_steps) number of moving passengers, see RidePath._moving_passengers
+
+        Returns:
+            np.ndarray: (..., nb_steps) True for the violating steps
+        '''
+        return occupancy.sum(axis=-1) != np.ceil(moving / self.vehicle_capacity)
+
+    def _vehicle_capacity_units(self, occupancy) -> np.ndarray:
+        '''Return the vehicles above their capacity at each step, see _vehicle_number_link_units
+
+        Returns:
+            np.ndarray: (..., nb_steps, nb_vehicles) True for the violating vehicles
+        '''
+        return occupancy > self.vehicle_capacity
+
+    def _edge_keys(self, solution, ride_solution, drive_solution, vehicle_groups=None) -> tuple:
+        '''Return the distinct (step, vehicle, edge) keys of the vehicles and of the passengers in them
+
+        Args:
+            solution (np.ndarray): (..., nb_passengers, nb_steps) ride vehicle solutions, with optional leading batch axes
+            ride_solution (np.ndarray): (..., nb_passengers, nb_steps, 2) ride path solutions
+            drive_solution (np.ndarray): (..., nb_vehicles, nb_steps, 2) drive path solutions
+            vehicle_groups (tuple, optional): _vehicle_groups of the solutions, computed if None. Defaults to None.
+
+        Returns:
+            tuple: sorted keys group * (nb_nodes + 1) ** 2 + edge code (see _vehicle_groups), (..., nb_steps, nb_vehicles) number of edges of each group
+        '''
+        batch_shape = solution.shape[:-2]
+        nb_groups = int(np.prod(batch_shape)) * self.nb_steps * self.nb_vehicles
+        nb_codes = (self.nb_nodes + 1) ** 2
+        vehicle_edges = self._edge_codes(
+            drive_solution[..., :self.nb_vehicles, :, :]).swapaxes(-1, -2).ravel()
+        if vehicle_groups is None:
+            vehicle_groups = self._vehicle_groups(solution)
+        in_vehicle, passenger_groups = vehicle_groups
+        passenger_edges = self._edge_codes(ride_solution)[in_vehicle]
+        # group by (step, vehicle, edge), sorting is faster than np.unique on large batches
+        keys = np.sort(np.concatenate([np.arange(nb_groups) * nb_codes + vehicle_edges,
+                                       passenger_groups * nb_codes + passenger_edges]))
+        keys = keys[np.concatenate([[True], keys[1:] != keys[:-1]])]
+        nb_edges = np.bincount(keys // nb_codes, minlength=nb_groups)
+        return keys, nb_edges.reshape(batch_shape + (self.nb_steps, self.nb_vehicles))
+
     def _check_ride_link_constraint(self, ride_path: RidePath) -> bool:
         '''Constraint: passenger use car only when they use the path and contrary
         '''
+        if self.vectorized:
+            check = not np.any(self._ride_link_units(
+                self.solution, ride_path.solution))
+            return self._check_violation(check)
         check = True
         for step in range(self.nb_steps):
             for passenger in range(self.nb_entity):
@@ -466,6 +1194,10 @@ class RideVehicle(Solution):
     def _check_vehicle_number_link_ride_constraint(self, ride_path: RidePath) -> bool:
         '''Constraint: vehicle number is the same in ridePath and rideVehicle
         '''
+        if self.vectorized:
+            check = not np.any(self._vehicle_number_link_units(
+                self._vehicle_occupancy(), ride_path._moving_passengers(ride_path.solution)))
+            return self._check_violation(check)
         check = True
         for step in range(self.nb_steps):
             step_nb_vehicle = 0
@@ -479,6 +1211,10 @@ class RideVehicle(Solution):
     def _check_vehicle_capacity_constraint(self) -> bool:
         '''Constraint: Vehicle capacity limit
         '''
+        if self.vectorized:
+            check = not np.any(
+                self._vehicle_capacity_units(self._vehicle_occupancy()))
+            return self._check_violation(check)
         check = True
         for step in range(self.nb_steps):
             for vehicle_id in range(self.nb_vehicles):
@@ -488,7 +1224,23 @@ class RideVehicle(Solution):
 
     def _check_vehicle_only_in_one_edge_condition(self, ride_path: RidePath, drive: DrivePath) -> bool:
         """Constraint: a vehicle can only be in a edge a a time at maximum
+
+        The edges of the vehicles that are in several edges are logged at the debug level.
         """
+        if self.vectorized:
+            nb_codes = (self.nb_nodes + 1) ** 2
+            keys, nb_edges = self._edge_keys(
+                self.solution, ride_path.solution, drive.solution)
+            conflicts = np.flatnonzero(nb_edges > 1)
+            if conflicts.size and logger.isEnabledFor(logging.DEBUG):
+                for group in conflicts:
+                    step, vehicle_id = divmod(int(group), self.nb_vehicles)
+                    codes = keys[keys // nb_codes == group] % nb_codes
+                    edges = [(int(code // (self.nb_nodes + 1)) - 1, int(code % (self.nb_nodes + 1)) - 1)
+                             for code in codes]
+                    logger.debug(
+                        "Vehicle %d is in several edges at step %d: %s", vehicle_id, step, edges)
+            return self._check_violation(conflicts.size == 0)
         check = True
         for step in range(self.nb_steps):
             # check that if passengers use a vehicle at any step, then these passengers needs to be on the same path
@@ -503,11 +1255,14 @@ class RideVehicle(Solution):
                 for path in paths:
                     if (path[0], path[1]) not in unique_paths:
                         unique_paths.append((path[0], path[1]))
-                print(unique_paths)
+                if len(unique_paths) > 1:
+                    logger.debug(
+                        "Vehicle %d is in several edges at step %d: %s", vehicle_id, step, unique_paths)
                 # check that there is only one path
                 check *= len(unique_paths) <= 1
         return self._check_violation(bool(check))
 
+    @utils.profiling.timed("constraints.ride_vehicle")
     def check_constraint(self, ride_path: RidePath, drive: DrivePath, ride_link_constraint=True, vehicle_number_link_ride_constraint=True, vehicle_capacity_constraint=True, vehicle_only_in_one_edge_condition=True) -> bool:
         '''Constraint: All constraints
 
@@ -532,11 +1287,20 @@ class RideVehicle(Solution):
                 ride_path, drive)
         return check
 
-    def get_neighbor(self, rate, temperature):
-        neighbor = self.copy()
+    @utils.profiling.timed("moves.move")
+    def move(self, rate, temperature, rng=None):
+        self._begin_move()
+        if rng is not None:
+            shape = (self.nb_entity, self.nb_steps)
+            mask = rng.random(shape) < rate
+            mask[:, -1] = False
+            shifts = temperature * rng.choice([-1, 1], shape)
+            new_solution = self.solution[:self.nb_entity].copy()
+            new_solution[mask] = new_solution[mask] + shifts[mask]
+            self._set_changed_cells(new_solution)
+            return
         for step in range(self.nb_steps - 1):
             for entity in range(self.nb_entity):
                 if np.random.rand() < rate:
-                    neighbor.solution[entity, step] += temperature * \
-                        np.random.choice([-1, 1])
-        return neighbor
+                    self.set_cells(entity, step, self.solution[entity, step] + temperature *
+                                   np.random.choice([-1, 1]))
@@ -0,0 +1,109 @@
+# vehicle_carpooling/topology.py
+
+"""Defines the Topology class
+"""
+
+from functools import cached_property
+
+import numpy as np
+import vehicle_carpooling.utils as utils
+
+
+class Topology:
+    """Topology class
+
+    Immutable map data shared by all the solutions of a problem. The
+    adjacency structures are computed once, on first use, and are never
+    copied with the solutions. Pickling a topology only stores the maps.
+    """
+
+    def __init__(self, path_map, time_map=None) -> None:
+        """Initialize the Topology object
+
+        Args:
+            path_map (np.ndarray or SparseGraph): possible path on the map
+            time_map (np.ndarray, optional): time to travel each path on the map. Defaults to None.
+        """
+        self.path_map = path_map
+        self.time_map = time_map
+        self.nb_nodes = len(path_map)
+        # hop distances to each finish node, computed on demand
+        self._hop_distances = dict()
+        # trip counts to each (finish node, number of steps), computed on demand
+        self._trip_counts = dict()
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, "_frozen", False):
+            raise AttributeError("Topology objects are immutable")
+        super().__setattr__(name, value)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (self.__class__, (self.path_map, self.time_map))
+
+    @cached_property
+    def graph(self) -> utils.graphs.SparseGraph:
+        """Sparse graph of the map
+        """
+        if isinstance(self.path_map, utils.graphs.SparseGraph):
+            return self.path_map
+        time_map = self.time_map
+        if time_map is not None and np.shape(time_map) != np.shape(self.path_map):
+            time_map = None
+        return utils.graphs.SparseGraph.from_dense(self.path_map, time_map)
+
+    @cached_property
+    def fingerprint(self) -> str:
+        """Hex digest identifying the paths of the map, see utils.cache.get_fingerprint
+        """
+        return utils.cache.get_fingerprint(self.graph.indptr, self.graph.indices)
+
+    @cached_property
+    def paths(self) -> tuple:
+        """All possible paths from the map
+        """
+        return tuple(utils.paths.get_paths(self.path_map))
+
+    @cached_property
+    def next_paths(self) -> dict:
+        """Possible paths from each node of the map
+        """
+        return dict((node, tuple(paths)) for node, paths in utils.paths.get_next_paths(self.path_map).items())
+
+    @cached_property
+    def next_nodes(self) -> dict:
+        """Legal next nodes of each node of the map
+        """
+        return dict((node, tuple(nodes)) for node, nodes in utils.paths.get_next_nodes(self.path_map).items())
+
+    def hop_distances(self, finish_node) -> np.ndarray:
+        """Return the minimum number of hops from each node to finish_node
+
+        The distances are cached per finish node.
+        """
+        finish_node = int(finish_node)
+        if finish_node not in self._hop_distances:
+            distances = utils.paths.get_hop_distances(
+                self.next_nodes, finish_node)
+            distances.setflags(write=False)
+            self._hop_distances[finish_node] = distances
+        return self._hop_distances[finish_node]
+
+    def trip_counts(self, finish_node, nb_steps) -> np.ndarray:
+        """Return the number of trips from each node to finish_node, see utils.trees.compute_trip_counts
+
+        The counts are cached per finish node and number of steps.
+        """
+        key = (int(finish_node), nb_steps)
+        if key not in self._trip_counts:
+            counts = utils.trees.compute_trip_counts(
+                self.graph, key[0], nb_steps)
+            counts.setflags(write=False)
+            self._trip_counts[key] = counts
+        return self._trip_counts[key]
@@ -0,0 +1,147 @@
+# vehicle_carpooling/utils/cache.py
+
+"""Utils for caching the trips on disk
+"""
+
+import hashlib
+import os
+
+import numpy as np
+from vehicle_carpooling.utils.graphs import SparseGraph
+
+
+def get_fingerprint(*values) -> str:
+    """Return a hex digest identifying values
+
+    Args:
+        values: arrays, SparseGraph or values with a stable repr (int, float, str, None)
+    """
+    digest = hashlib.sha1()
+    for value in values:
+        if isinstance(value, SparseGraph):
+            value = get_fingerprint(value.indptr, value.indices, value.times)
+        if isinstance(value, np.ndarray):
+            digest.update(repr((value.dtype.str, value.shape)).encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+        else:
+            digest.update(repr(value).encode())
+        digest.update(b"|")
+    return digest.hexdigest()
+
+
+class TripCache:
+    """TripCache class
+
+    Directory of .npy files storing the trips of an OD pair as a
+    (nb_trips, nb_steps + 1) node sequence array. The files are memory-mapped
+    when read. When the directory exceeds max_bytes, the least recently used
+    files are removed. Several processes can share the same directory.
+
+    The size of the directory is kept in memory and updated by put, the
+    directory is only scanned again when the size exceeds max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=None) -> None:
+        """Initialize the TripCache object
+
+        Args:
+            directory (str): cache directory, created if needed
+            max_bytes (int, optional): maximum size of the cache directory, unlimited if None. Defaults to None.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        # path: size of the cached files, read from the directory on the first put
+        self._sizes = None
+        self._total = 0
+
+    def _path(self, key) -> str:
+        return os.path.join(self.directory, key + ".npy")
+
+    def _files(self) -> list:
+        """Return the (last use time, size, path) of the cached files
+        """
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _refresh(self):
+        """Read the cached files and their sizes from the directory
+        """
+        files = self._files()
+        self._sizes = dict((path, size) for _, size, path in files)
+        self._total = sum(self._sizes.values())
+        return files
+
+    def __len__(self):
+        return len(self._files())
+
+    def get(self, key):
+        """Return the memory-mapped trips of key, or None if they are not cached
+
+        Args:
+            key (str): fingerprint of the trips, see get_fingerprint
+        """
+        path = self._path(key)
+        try:
+            trips = np.load(path, mmap_mode='r')
+            # the modification time orders the files by last use
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return trips
+
+    def put(self, key, trips):
+        """Store the trips of key
+
+        Args:
+            key (str): fingerprint of the trips, see get_fingerprint
+            trips (np.ndarray): (nb_trips, nb_steps + 1) node sequences
+        """
+        path = self._path(key)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'wb') as f:
+            np.save(f, np.asarray(trips))
+            size = f.tell()
+        os.replace(temporary_path, path)
+        if self.max_bytes is None:
+            return
+        if self._sizes is None:
+            self._refresh()
+        else:
+            self._total += size - self._sizes.get(path, 0)
+            self._sizes[path] = size
+        if self._total > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Remove the least recently used files until the cache fits in max_bytes
+        """
+        # the other processes sharing the directory may have added or removed files
+        files = sorted(self._refresh())
+        for _, size, path in files:
+            if self._total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._total -= size
+            del self._sizes[path]
+
+    def clear(self):
+        """Remove all the cached files
+        """
+        for _, _, path in self._files():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._sizes = None
+        self._total = 0
@@ -0,0 +1,149 @@
+# vehicle_carpooling/utils/graphs.py
+
+"""Utils for sparse graphs
+"""
+
+import numpy as np
+
+
+class SparseGraph:
+    """SparseGraph class
+
+    Road network stored in compressed sparse row (CSR) format, the memory
+    is bounded by the number of edges instead of nodes². Can be used
+    everywhere a dense path_map is expected: graph[i, j] is True if there
+    is a path from node i to node j (i and j can be arrays).
+    """
+
+    def __init__(self, indptr, indices, times=None) -> None:
+        """Initialize the SparseGraph object
+
+        Args:
+            indptr (np.ndarray): the next nodes of node i are indices[indptr[i]:indptr[i+1]]
+            indices (np.ndarray): next nodes, sorted for each node
+            times (np.ndarray, optional): time to travel each edge. Defaults to None.
+        """
+        self.indptr = np.asarray(indptr, dtype=np.int32)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.times = None if times is None else np.asarray(
+            times, dtype=float)
+        self.nb_nodes = len(self.indptr) - 1
+        # sorted edge keys used to look for edges
+        rows = np.repeat(np.arange(self.nb_nodes, dtype=np.int64),
+                         np.diff(self.indptr))
+        self._keys = rows * self.nb_nodes + self.indices
+
+    @classmethod
+    def from_edges(cls, nb_nodes, edges, times=None):
+        """Create a graph from a list of edges
+
+        Args:
+            nb_nodes (int): number of nodes
+            edges (array like): (from, to) edges
+            times (array like, optional): time to travel each edge. Defaults to None.
+        """
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        keys, index = np.unique(
+            edges[:, 0] * nb_nodes + edges[:, 1], return_index=True)
+        rows = keys // nb_nodes
+        indptr = np.zeros(nb_nodes + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=nb_nodes), out=indptr[1:])
+        if times is not None:
+            times = np.asarray(times, dtype=float)[index]
+        return cls(indptr, keys % nb_nodes, times)
+
+    @classmethod
+    def from_sparse(cls, matrix, time_matrix=None):
+        """Create a graph from a scipy-style sparse matrix
+
+        Args:
+            matrix: sparse matrix with a tocoo() method, non zero values are paths
+            time_matrix (optional): sparse matrix of the time to travel each path. Defaults to None.
+        """
+        coo = matrix.tocoo()
+        non_zero = coo.data != 0
+        edges = np.stack([coo.row[non_zero], coo.col[non_zero]], axis=1)
+        times = None
+        if time_matrix is not None:
+            times = np.asarray(time_matrix.tocsr()[
+                edges[:, 0], edges[:, 1]]).ravel()
+        return cls.from_edges(matrix.shape[0], edges, times)
+
+    @classmethod
+    def from_dense(cls, path_map, time_map=None):
+        """Create a graph from a dense path map
+
+        Args:
+            path_map (np.ndarray): possible path on the map
+            time_map (np.ndarray, optional): time to travel each path on the map. Defaults to None.
+        """
+        edges = np.argwhere(np.asarray(path_map))
+        times = None
+        if time_map is not None:
+            times = np.asarray(time_map)[edges[:, 0], edges[:, 1]]
+        return cls.from_edges(len(path_map), edges, times)
+
+    def __len__(self):
+        return self.nb_nodes
+
+    @property
+    def nb_edges(self) -> int:
+        """Number of edges
+        """
+        return len(self.indices)
+
+    def neighbors(self, node) -> np.ndarray:
+        """Return the next nodes of node
+        """
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def random_neighbors(self, nodes, rng) -> np.ndarray:
+        """Return a random next node of each node
+
+        Args:
+            nodes (np.ndarray): nodes, negative nodes are wrapped like numpy indexes
+            rng (np.random.Generator): random generator
+        """
+        nodes = np.asarray(nodes, dtype=np.int64) % self.nb_nodes
+        start = self.indptr[nodes]
+        degree = self.indptr[nodes + 1] - start
+        if np.any(degree == 0):
+            raise ValueError("A node has no next node")
+        offsets = (rng.random(nodes.shape) * degree).astype(np.int64)
+        return self.indices[start + offsets]
+
+    def edges(self):
+        """Return the (from, to) arrays of all the edges
+        """
+        return self._keys // self.nb_nodes, self._keys % self.nb_nodes
+
+    def _find(self, rows, cols):
+        """Return the edge positions and whether the edges exist
+
+        Negative nodes are wrapped like numpy indexes.
+        """
+        rows = np.asarray(rows, dtype=np.int64) % self.nb_nodes
+        cols = np.asarray(cols, dtype=np.int64) % self.nb_nodes
+        keys = rows * self.nb_nodes + cols
+        position = np.searchsorted(self._keys, keys)
+        position = np.minimum(position, max(self.nb_edges - 1, 0))
+        found = self._keys[position] == keys if self.nb_edges else np.zeros(
+            keys.shape, dtype=bool)
+        return position, found
+
+    def has_edge(self, rows, cols):
+        """Return True where there is a path from rows to cols
+        """
+        return self._find(rows, cols)[1]
+
+    def __getitem__(self, index):
+        rows, cols = index
+        return self.has_edge(rows, cols)
+
+    def edge_times(self, rows, cols):
+        """Return the time to travel from rows to cols (nan if there is no path)
+        """
+        if self.times is None:
+            raise ValueError("The graph has no travel times")
+        position, found = self._find(rows, cols)
+        return np.where(found, self.times[position] if self.nb_edges else np.nan, np.nan)
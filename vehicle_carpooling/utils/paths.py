@@ -4,11 +4,16 @@
 """
 
 import numpy as np
+from collections import deque
+from vehicle_carpooling.utils.graphs import SparseGraph
 
 
 def get_paths(path_map):
     """Return all possible paths from the map
     """
+    if isinstance(path_map, SparseGraph):
+        rows, cols = path_map.edges()
+        return list(zip(rows.tolist(), cols.tolist()))
     paths = []
     for i in range(len(path_map)):
         for j in range(len(path_map[i])):
@@ -20,6 +25,9 @@ def get_paths(path_map):
 def get_next_paths(path_map):
     """Return all possible paths from the node on the map
     """
+    if isinstance(path_map, SparseGraph):
+        return dict((node, [(node, next_node) for next_node in path_map.neighbors(node).tolist()])
+                    for node in range(path_map.nb_nodes))
     paths = dict()
     for node, path in enumerate(path_map):
         paths[node] = []
@@ -32,6 +40,9 @@ def get_next_paths(path_map):
 def get_next_nodes(path_map):
     """Return a dictionnary of all legal next node on the map
     """
+    if isinstance(path_map, SparseGraph):
+        return dict((node, path_map.neighbors(node).tolist())
+                    for node in range(path_map.nb_nodes))
     next_nodes = dict()
     for node, path in enumerate(path_map):
         next_nodes[node] = []
@@ -39,3 +50,88 @@ def get_next_nodes(path_map):
             if path_or_not:
                 next_nodes[node].append(next_node)
     return next_nodes
+
+
+def _get_next_nodes_function(next_nodes):
+    """Return a function giving the legal next nodes of a node
+    """
+    if isinstance(next_nodes, SparseGraph):
+        return lambda node: next_nodes.neighbors(node).tolist()
+    return lambda node: next_nodes.get(node, [])
+
+
+def get_node_dtype(nb_nodes):
+    """Return the smallest integer dtype able to store the nodes and the empty value -1
+    """
+    return np.min_scalar_type(-max(nb_nodes, 1))
+
+
+def get_node_sequence(solution, dtype=None):
+    """Return the (..., nb_steps + 1) node sequence of a continuous (..., nb_steps, 2) path solution
+    """
+    solution = np.asarray(solution)
+    nodes = np.empty(solution.shape[:-2] + (solution.shape[-2] + 1,),
+                     dtype=dtype or solution.dtype)
+    nodes[..., :-1] = solution[..., 0]
+    nodes[..., -1] = solution[..., -1, 1]
+    return nodes
+
+
+def get_edge_view(nodes):
+    """Return the writeable (..., nb_steps, 2) [from, to] view of a (..., nb_steps + 1) node sequence
+
+    Writing the [from, to] edge of a step also writes the to node of the
+    previous step and the from node of the next step.
+    """
+    return np.lib.stride_tricks.sliding_window_view(nodes, 2, axis=-1, writeable=True)
+
+
+def get_hop_distances(next_nodes, finish_node):
+    """Return the minimum number of hops from each node to finish_node
+
+    Args:
+        next_nodes (dict or SparseGraph): legal next nodes of each node
+        finish_node (int): destination node
+
+    Returns:
+        np.ndarray: number of hops of each node, inf if finish_node cannot be reached
+    """
+    if isinstance(next_nodes, SparseGraph):
+        next_nodes = get_next_nodes(next_nodes)
+    previous_nodes = dict((node, []) for node in range(len(next_nodes)))
+    for node, nodes in next_nodes.items():
+        for next_node in nodes:
+            previous_nodes[next_node].append(node)
+    distances = np.full(len(next_nodes), np.inf)
+    distances[finish_node] = 0
+    queue = deque([finish_node])
+    while queue:
+        node = queue.popleft()
+        for previous_node in previous_nodes[node]:
+            if distances[previous_node] == np.inf:
+                distances[previous_node] = distances[node] + 1
+                queue.append(previous_node)
+    return distances
+
+
+def get_shortest_path(next_nodes, start_node, distances):
+    """Return a shortest path from start_node, following decreasing hop distances
+
+    Args:
+        next_nodes (dict or SparseGraph): legal next nodes of each node
+        start_node (int): start node
+        distances (np.ndarray): hop distances to the finish node, see get_hop_distances
+
+    Returns:
+        list: nodes of the path, None if the finish node cannot be reached
+    """
+    if not np.isfinite(distances[start_node]):
+        return None
+    get_next_nodes = _get_next_nodes_function(next_nodes)
+    node = int(start_node)
+    path = [node]
+    while distances[node] > 0:
+        node = next(next_node for next_node in get_next_nodes(node)
+                    if distances[next_node] == distances[node] - 1)
+        path.append(node)
+    return path
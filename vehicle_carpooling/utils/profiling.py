@@ -0,0 +1,216 @@
+# vehicle_carpooling/utils/profiling.py
+
+"""Utils for profiling
+
+Named timers and counters, disabled by default. They are enabled for the
+whole run by the VEHICLE_CARPOOLING_PROFILE environment variable ("1" to
+print the stats at exit, or the path of a json file to write them to, "0"
+or empty to keep them disabled), or for a block with the profiling()
+context manager.
+"""
+
+import atexit
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+ENV_VARIABLE = "VEHICLE_CARPOOLING_PROFILE"
+
+
+def _parse_setting(value) -> tuple:
+    """Return (enabled, export path) from the value of the environment variable
+
+    Args:
+        value (str or None): value of the environment variable, None if it is not set
+
+    Returns:
+        tuple: True if the instrumentation is enabled, path of the json file of the stats (None to print them)
+    """
+    value = (value or "").strip()
+    if value.lower() in ("", "0", "false", "no"):
+        return False, None
+    if value.lower() in ("1", "true", "yes"):
+        return True, None
+    return True, value
+
+
+_enabled, _export_path = _parse_setting(os.environ.get(ENV_VARIABLE))
+# name: [number of calls, total time in seconds]
+_timers = dict()
+# name: total
+_counters = dict()
+
+
+def is_enabled() -> bool:
+    """Return True if the instrumentation is enabled
+    """
+    return _enabled
+
+
+def reset():
+    """Clear the timers and counters
+    """
+    _timers.clear()
+    _counters.clear()
+
+
+def count(name, value=1):
+    """Add value to the counter name
+    """
+    if _enabled:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def _add_time(name, seconds, calls=1):
+    """Add calls and seconds to the timer name
+    """
+    timer = _timers.setdefault(name, [0, 0.0])
+    timer[0] += calls
+    timer[1] += seconds
+
+
+class _Timer:
+    """Context manager adding the time spent in a block to a timer
+    """
+
+    def __init__(self, name) -> None:
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _add_time(self.name, time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    """Context manager doing nothing, used when the instrumentation is disabled
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name):
+    """Return a context manager adding the time spent in the block to the timer name
+    """
+    return _Timer(name) if _enabled else _NULL_TIMER
+
+
+def timed(name):
+    """Decorator adding the time spent in the function to the timer name
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _add_time(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def get_stats() -> dict:
+    """Return the aggregated stats
+
+    Returns:
+        dict: {"timers": {name: {"calls", "total", "mean"}}, "counters": {name: total}}
+    """
+    timers = dict()
+    for name, (calls, total) in sorted(_timers.items()):
+        timers[name] = dict(calls=calls, total=total,
+                            mean=total / calls if calls else 0.0)
+    return dict(timers=timers, counters=dict(sorted(_counters.items())))
+
+
+def merge(stats):
+    """Add stats of get_stats (from a worker process) to the timers and counters
+    """
+    if not stats:
+        return
+    for name, timer_stats in stats["timers"].items():
+        _add_time(name, timer_stats["total"], timer_stats["calls"])
+    for name, value in stats["counters"].items():
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def collect(enabled, function, *args, **kwargs):
+    """Call function and return (result, stats), used to profile a worker process
+
+    Args:
+        enabled (bool): enable the instrumentation in the worker, see is_enabled
+        function (callable): function to call with args and kwargs
+
+    Returns:
+        tuple: (result, stats of the call or None if not enabled), the stats are merged back with merge
+    """
+    global _enabled, _timers, _counters
+    saved = (_enabled, _timers, _counters)
+    _enabled, _timers, _counters = enabled, dict(), dict()
+    try:
+        result = function(*args, **kwargs)
+        return result, get_stats() if enabled else None
+    finally:
+        _enabled, _timers, _counters = saved
+
+
+def export(path=None) -> dict:
+    """Export the aggregated stats
+
+    Args:
+        path (str, optional): json file to write the stats to, printed on stderr if None. Defaults to None.
+    """
+    stats = get_stats()
+    if path is not None:
+        with open(path, 'w') as f:
+            json.dump(stats, f, indent=2)
+        return stats
+    for name, timer_stats in stats["timers"].items():
+        print(f"{name}: {timer_stats['calls']} calls, {timer_stats['total']:.6f} s "
+              f"({timer_stats['mean']:.6f} s per call)", file=sys.stderr)
+    for name, value in stats["counters"].items():
+        print(f"{name}: {value}", file=sys.stderr)
+    return stats
+
+
+@contextmanager
+def profiling(path=None):
+    """Enable the instrumentation in a block and export the stats at its end
+
+    Args:
+        path (str, optional): json file to write the stats to, not exported if None. Defaults to None.
+    """
+    global _enabled
+    previous = _enabled
+    _enabled = True
+    reset()
+    try:
+        yield
+    finally:
+        _enabled = previous
+        if path is not None:
+            export(path)
+
+
+def _export_at_exit():
+    export(_export_path)
+
+
+# only the main process exports, the workers send their stats back with collect
+if _enabled and multiprocessing.parent_process() is None:
+    atexit.register(_export_at_exit)
@@ -4,32 +4,64 @@
 """
 
 import numpy as np
-import copy
+import array
+import heapq
 import random
-import cProfile
+import time
 from collections import deque
+from vehicle_carpooling.utils import paths, profiling
+from vehicle_carpooling.utils.graphs import SparseGraph
 
-profiler = cProfile.Profile()
 
-
-def compute_solutions(start_point, finish_point, nb_steps, next_nodes: dict):
+@profiling.timed("trees.compute_solutions")
+def compute_solutions(start_point, finish_point, nb_steps, next_nodes: dict, distances=None, k=None, time_map=None, time_budget=None):
     """Compute all the solutions of a passenger
+
+    Args:
+        distances (np.ndarray, optional): hop distances to finish_point, see new_compute_trips. Defaults to None.
+        k (int, optional): only compute the k best trips, see compute_k_shortest_trips. Defaults to None.
+        time_map (np.ndarray or SparseGraph, optional): rank the k best trips by time instead of hops. Defaults to None.
+        time_budget (float, optional): maximum time in seconds to compute the k best trips. Defaults to None.
     """
-    profiler.enable()
     solutions = []
-    for trip in new_compute_trips(
-            start_point, finish_point, nb_steps, next_nodes):
+    trips = _compute_trips(start_point, finish_point, nb_steps,
+                           next_nodes, distances, k, time_map, time_budget)
+    for trip in trips:
         solution = []
         for i in range(1, len(trip)):
             solution.append([trip[i-1], trip[i]])
         solutions.append(solution)
         for i in range(len(trip), nb_steps+1):
             solution.append([trip[-1], trip[-1]])
-    profiler.disable()
-    profiler.dump_stats('profiles/trees/profile_compute_solutions.prof')
+    profiling.count("trees.trips", len(solutions))
     return solutions
 
 
+@profiling.timed("trees.compute_trip_nodes")
+def compute_trip_nodes(start_point, finish_point, nb_steps, next_nodes: dict, distances=None, k=None, time_map=None, time_budget=None, dtype=np.int64):
+    """Compute the trips of a passenger as a (nb_trips, nb_steps + 1) node sequence array
+
+    Same arguments as compute_solutions, the trips ending before nb_steps
+    stay on their last node.
+
+    Args:
+        dtype (np.dtype, optional): dtype of the nodes. Defaults to np.int64.
+    """
+    trips = _compute_trips(start_point, finish_point, nb_steps,
+                           next_nodes, distances, k, time_map, time_budget)
+    nodes = [trip + [trip[-1]] * (nb_steps + 1 - len(trip)) for trip in trips]
+    profiling.count("trees.trips", len(nodes))
+    return np.array(nodes, dtype=dtype).reshape(-1, nb_steps + 1)
+
+
+def _compute_trips(start_point, finish_point, nb_steps, next_nodes, distances, k, time_map, time_budget):
+    """Return the trips (lists of nodes) of a passenger, see compute_solutions
+    """
+    if k is None:
+        return new_compute_trips(start_point, finish_point, nb_steps, next_nodes, distances)
+    return compute_k_shortest_trips(start_point, finish_point, nb_steps, next_nodes, k, time_map, time_budget)
+
+
 def compute_trips(start_point, finish_point, nb_steps, next_nodes: dict):
     """Compute the list of trips of a passenger
     """
@@ -37,35 +69,336 @@ def compute_trips(start_point, finish_point, nb_steps, next_nodes: dict):
     return get_all_solutions_from_tree(tree)
 
 
-def new_compute_trips(start_node, finish_node, nb_steps, next_nodes: dict):
-    profiler.enable()
-    with open('output.txt', 'w') as f:
-        queue = deque([(start_node, [start_node])])
-        # n-1 + n-1 = min number of steps, n-1 + n-1 + n-1 = max number of steps
-        nb_nodes = len(next_nodes)
-        level_found = [nb_steps]
-        mean_level_found = nb_steps
-        while queue:
-            node, path = queue.popleft()
-            if node == finish_node:
-                yield path
-                level_found.append(len(path))
-                mean_level_found = np.mean(level_found)
-                print(mean_level_found, file=f)
+def new_compute_trips(start_node, finish_node, nb_steps, next_nodes: dict, distances=None):
+    """Compute the trips of a passenger with a breadth first search
+
+    The partial trips that cannot reach finish_node in the remaining steps are pruned.
+
+    Args:
+        next_nodes (dict or SparseGraph): legal next nodes of each node
+        distances (np.ndarray, optional): hop distances to finish_node, computed if None. Defaults to None.
+    """
+    if distances is None:
+        distances = paths.get_hop_distances(next_nodes, finish_node)
+    get_next_nodes = paths._get_next_nodes_function(next_nodes)
+    # the frontier entries are parent pointers, a path is only built when it reaches finish_node
+    entry_nodes = array.array('l', [start_node])
+    entry_parents = array.array('l', [-1])
+    # bit of each node in the visited masks, given on the first visit
+    node_bits = {start_node: 1}
+    # (entry, path length, visited mask)
+    queue = deque([(0, 1, 1)])
+    # mean length of the found trips, starting with one of nb_steps
+    total_level_found = nb_steps
+    nb_level_found = 1
+    mean_level_found = nb_steps
+    while queue:
+        entry, length, visited = queue.popleft()
+        node = entry_nodes[entry]
+        if node == finish_node:
+            yield _get_entry_path(entry_nodes, entry_parents, entry)
+            total_level_found += length
+            nb_level_found += 1
+            mean_level_found = total_level_found / nb_level_found
+        else:
+            if length <= nb_steps and length <= mean_level_found:
+                for next_node in get_next_nodes(node):
+                    if length + distances[next_node] > nb_steps:
+                        continue
+                    bit = node_bits.get(next_node)
+                    if bit is None:
+                        bit = node_bits[next_node] = 1 << len(node_bits)
+                    if not visited & bit or node == next_node:
+                        entry_nodes.append(next_node)
+                        entry_parents.append(entry)
+                        queue.append(
+                            (len(entry_nodes) - 1, length + 1, visited | bit))
+    profiling.count("trees.frontier_entries", len(entry_nodes))
+
+
+def _get_entry_path(entry_nodes, entry_parents, entry) -> list:
+    """Return the path (list of nodes) ending at a frontier entry of new_compute_trips
+    """
+    path = []
+    while entry != -1:
+        path.append(entry_nodes[entry])
+        entry = entry_parents[entry]
+    return path[::-1]
+
+
+def _get_next_costs_function(next_nodes, time_map):
+    """Return a function giving the {next node: cost} of the legal next nodes of a node
+
+    The cost of an edge is one per hop if time_map is None. The costs of a
+    node are read once, with one slice of the graph, and kept for the next calls.
+    """
+    get_next_nodes = paths._get_next_nodes_function(next_nodes)
+    node_costs = dict()
+
+    def get_next_costs(node):
+        next_costs = node_costs.get(node)
+        if next_costs is None:
+            if time_map is None:
+                nodes = get_next_nodes(node)
+                costs = [1] * len(nodes)
+            elif isinstance(time_map, SparseGraph) and time_map is next_nodes:
+                start, stop = time_map.indptr[node], time_map.indptr[node + 1]
+                nodes = time_map.indices[start:stop].tolist()
+                costs = time_map.times[start:stop].tolist()
             else:
-                if len(path) <= nb_steps and len(path) <= mean_level_found:
-                    for next_node in next_nodes.get(node, []):
-                        if next_node not in path or node == next_node:
-                            queue.append((next_node, path + [next_node]))
-    profiler.disable()
-    profiler.dump_stats('profiles/trees/profile_new_compute_trips.prof')
+                nodes = get_next_nodes(node)
+                if isinstance(time_map, SparseGraph):
+                    costs = time_map.edge_times(node, nodes).tolist()
+                else:
+                    costs = np.asarray(time_map)[node, nodes].tolist()
+            next_costs = node_costs[node] = dict(zip(nodes, costs))
+        return next_costs
+    return get_next_costs
+
+
+def _shortest_trip(start_node, finish_node, max_hops, get_next_costs, removed_nodes=(), removed_edges=()):
+    """Return the (cost, trip) of the cheapest loopless trip with at most max_hops hops
+
+    Label setting search on (node, hops) states: a label is only expanded if
+    no cheaper label of the same node with fewer hops was expanded before.
+
+    Returns:
+        tuple: (cost, trip), or None if finish_node cannot be reached
+    """
+    # labels: (node, parent label)
+    labels = [(start_node, -1)]
+    heap = [(0, 0, 0)]
+    min_hops = dict()
+    while heap:
+        cost, hops, label = heapq.heappop(heap)
+        node = labels[label][0]
+        if node == finish_node:
+            trip = []
+            while label != -1:
+                trip.append(labels[label][0])
+                label = labels[label][1]
+            return cost, trip[::-1]
+        if hops >= min_hops.get(node, max_hops + 1):
+            continue
+        min_hops[node] = hops
+        if hops == max_hops:
+            continue
+        for next_node, next_cost in get_next_costs(node).items():
+            if next_node == node or next_node in removed_nodes or (node, next_node) in removed_edges:
+                continue
+            labels.append((next_node, label))
+            heapq.heappush(heap, (cost + next_cost, hops + 1, len(labels) - 1))
+    return None
+
+
+@profiling.timed("trees.compute_k_shortest_trips")
+def compute_k_shortest_trips(start_node, finish_node, nb_steps, next_nodes: dict, k, time_map=None, time_budget=None):
+    """Compute the k best loopless trips of a passenger with Yen's algorithm
+
+    Args:
+        start_node (int): start node
+        finish_node (int): finish node
+        nb_steps (int): maximum number of hops of a trip
+        next_nodes (dict or SparseGraph): legal next nodes of each node
+        k (int): maximum number of trips
+        time_map (np.ndarray or SparseGraph, optional): rank the trips by time instead of hops. Defaults to None.
+        time_budget (float, optional): maximum time in seconds, the trips found so far are returned when it is exceeded. Defaults to None.
+
+    Returns:
+        list: trips (list of nodes), best first
+    """
+    if start_node == finish_node:
+        return [[start_node]]
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    get_next_costs = _get_next_costs_function(next_nodes, time_map)
+    shortest = _shortest_trip(
+        start_node, finish_node, nb_steps, get_next_costs)
+    if shortest is None or k < 1:
+        return []
+    trips = [shortest[1]]
+    candidates = []
+    seen = set([tuple(shortest[1])])
+    while len(trips) < k:
+        previous_trip = trips[-1]
+        for i in range(len(previous_trip) - 1):
+            if deadline is not None and time.perf_counter() > deadline:
+                return trips
+            root = previous_trip[:i+1]
+            removed_edges = set((trip[i], trip[i+1])
+                                for trip in trips if trip[:i+1] == root)
+            spur = _shortest_trip(root[-1], finish_node, nb_steps - i, get_next_costs,
+                                  set(root[:-1]), removed_edges)
+            if spur is None:
+                continue
+            trip = root[:-1] + spur[1]
+            if tuple(trip) in seen:
+                continue
+            seen.add(tuple(trip))
+            cost = sum(get_next_costs(trip[j])[trip[j+1]]
+                       for j in range(len(trip) - 1))
+            heapq.heappush(candidates, (cost, len(trip), trip))
+        if not candidates:
+            break
+        trips.append(heapq.heappop(candidates)[2])
+    return trips
+
+
+@profiling.timed("trees.compute_trip_counts")
+def compute_trip_counts(next_nodes, finish_node, nb_steps) -> np.ndarray:
+    """Count the trips reaching finish_node from each node of the map
+
+    counts[t, node] is the number of trips from node that reach finish_node
+    in at most t hops. A trip stops as soon as it reaches finish_node, it can
+    wait on a node if the node is its own next node. The counts are exact:
+    int64 if they fit, python integers (object array) otherwise.
+
+    Args:
+        next_nodes (dict or SparseGraph): legal next nodes of each node
+        finish_node (int): finish node
+        nb_steps (int): maximum number of hops of a trip
+
+    Returns:
+        np.ndarray: (nb_steps+1, nb_nodes) counts
+    """
+    graph = next_nodes if isinstance(
+        next_nodes, SparseGraph) else _get_graph(next_nodes)
+    rows = np.repeat(np.arange(graph.nb_nodes), np.diff(graph.indptr))
+    counts = np.zeros((nb_steps + 1, graph.nb_nodes))
+    counts[:, finish_node] = 1
+    for step in range(1, nb_steps + 1):
+        counts[step] = np.bincount(rows, weights=counts[step - 1][graph.indices],
+                                   minlength=graph.nb_nodes)
+        counts[step, finish_node] = 1
+    # floats are exact up to 2**53
+    if counts.max(initial=0) < 2**53:
+        return counts.astype(np.int64)
+    counts = np.zeros((nb_steps + 1, graph.nb_nodes), dtype=object)
+    counts[:, finish_node] = 1
+    for step in range(1, nb_steps + 1):
+        counts[step] = [counts[step - 1][graph.neighbors(node)].sum()
+                        for node in range(graph.nb_nodes)]
+        counts[step, finish_node] = 1
+    return counts
+
+
+def _get_graph(next_nodes: dict) -> SparseGraph:
+    """Return the SparseGraph of a next_nodes dict
+    """
+    edges = [(node, next_node) for node, nodes in next_nodes.items()
+             for next_node in nodes]
+    nb_nodes = max([max(edge) for edge in edges], default=-1) + 1
+    return SparseGraph.from_edges(max(nb_nodes, len(next_nodes)), edges)
+
+
+def random_rank(nb_trips, rng=None) -> int:
+    """Return a uniformly random rank in [0, nb_trips)
+
+    Args:
+        nb_trips (int): number of trips, can exceed the int64 range
+        rng (np.random.Generator, optional): random generator, the global numpy one if None. Defaults to None.
+    """
+    nb_trips = int(nb_trips)
+    if nb_trips < 2**63:
+        if rng is None:
+            return int(np.random.randint(0, nb_trips, dtype=np.int64))
+        return int(rng.integers(nb_trips))
+    # one more word than needed so that the modulo bias is negligible
+    nb_words = nb_trips.bit_length() // 63 + 2
+    if rng is None:
+        words = np.random.randint(0, 2**63, nb_words, dtype=np.int64)
+    else:
+        words = rng.integers(0, 2**63, nb_words)
+    value = 0
+    for word in words.tolist():
+        value = (value << 63) | word
+    return value % nb_trips
+
+
+class TripDAG:
+    """TripDAG class
+
+    Time-expanded graph of the trips of a passenger: the states are the
+    (step, node) pairs and each state is annotated with the number of trips
+    completing it (see compute_trip_counts). The trips are never stored, the
+    i-th trip by rank or a uniformly random trip is built in O(nb_steps).
+    Can be used like the list of solutions of a passenger: dag[i] is the
+    i-th solution, padded to nb_steps.
+    """
+
+    def __init__(self, start_node, finish_node, nb_steps, next_nodes, counts=None) -> None:
+        """Initialize the TripDAG object
+
+        Args:
+            start_node (int): start node
+            finish_node (int): finish node
+            nb_steps (int): maximum number of hops of a trip
+            next_nodes (dict or SparseGraph): legal next nodes of each node
+            counts (np.ndarray, optional): counts of compute_trip_counts for finish_node, computed if None. Defaults to None.
+        """
+        self.start_node = int(start_node)
+        self.finish_node = int(finish_node)
+        self.nb_steps = nb_steps
+        self.graph = next_nodes if isinstance(
+            next_nodes, SparseGraph) else _get_graph(next_nodes)
+        if counts is None:
+            counts = compute_trip_counts(self.graph, finish_node, nb_steps)
+        self.counts = counts
+
+    @property
+    def nb_trips(self) -> int:
+        """Number of trips from start_node to finish_node
+        """
+        return int(self.counts[self.nb_steps, self.start_node])
+
+    def __len__(self):
+        return self.nb_trips
+
+    def __bool__(self):
+        return self.nb_trips > 0
+
+    def trip(self, rank) -> list:
+        """Return the trip (list of nodes) of a given rank
+
+        The trips are ranked by their successive next nodes, in the order of
+        the graph.
+        """
+        rank = int(rank)
+        if not 0 <= rank < self.nb_trips:
+            raise IndexError("Trip rank out of range", rank)
+        node = self.start_node
+        trip = [node]
+        remaining = self.nb_steps
+        while node != self.finish_node:
+            remaining -= 1
+            for next_node in self.graph.neighbors(node).tolist():
+                count = int(self.counts[remaining, next_node])
+                if rank < count:
+                    break
+                rank -= count
+            node = next_node
+            trip.append(node)
+        return trip
+
+    def sample(self, rng=None) -> list:
+        """Return a uniformly random trip (list of nodes)
+
+        Args:
+            rng (np.random.Generator, optional): random generator, the global numpy one if None. Defaults to None.
+        """
+        return self.trip(random_rank(self.nb_trips, rng))
+
+    def __getitem__(self, rank) -> list:
+        trip = self.trip(rank)
+        solution = [[trip[i-1], trip[i]] for i in range(1, len(trip))]
+        for i in range(len(trip), self.nb_steps+1):
+            solution.append([trip[-1], trip[-1]])
+        return solution
 
 
 # depreciated
 def compute_tree_trips(start_point, finish_point, nb_steps, next_nodes: dict):
     """Compute the tree of trips of a passenger
     """
-    profiler.enable()
 
     def rec_compute_trips(node, finish_point, nb_steps, next_nodes: dict, used_path=[]):
         """Compute the trips of a passenger (node = starting_point)
@@ -89,121 +422,240 @@ def compute_tree_trips(start_point, finish_point, nb_steps, next_nodes: dict):
         start_point, finish_point, nb_steps, next_nodes)
     if len(trips) == 1:
         return []
-    profiler.disable()
-    profiler.dump_stats('profiles/trees/profile_compute_trips.prof')
     return trips
 
 
-def _get_node_from_tree(tree, tree_path, level):
-    """Get node used in tree_path at level
+class FlatTree:
+    """FlatTree class
+
+    Tree of trips stored in flat arrays instead of nested lists: the node,
+    parent, first child, number of children and depth of each tree node. The
+    tree nodes are in breadth-first order, so the children of a tree node are
+    contiguous and the b-th branch of a tree path is first_children + b - 1.
+    Walking a tree path is O(depth) and never copies the tree.
     """
-    next_tree = copy.deepcopy(tree)
-    for i in range(level):
-        next_tree = next_tree[tree_path[i]]
-    return next_tree[0]
 
+    def __init__(self, nodes, parents, first_children, nb_children, depths) -> None:
+        """Initialize the FlatTree object
 
-def get_solution_from_tree(tree, tree_path):
-    """Return solution using tree_path
-    """
-    solution = []
-    current_node = tree[0]
-    for level, _ in enumerate(tree_path):
-        next_node = _get_node_from_tree(tree, tree_path, level+1)
-        solution.append([current_node, next_node])
-        current_node = next_node
-    return solution
+        Args:
+            nodes (np.ndarray): node of each tree node, the root first
+            parents (np.ndarray): parent of each tree node, -1 for the root
+            first_children (np.ndarray): first child of each tree node, -1 for the leaves
+            nb_children (np.ndarray): number of children of each tree node
+            depths (np.ndarray): depth of each tree node, 0 for the root
+        """
+        self.nodes = np.asarray(nodes, dtype=np.int64)
+        self.parents = np.asarray(parents, dtype=np.int64)
+        self.first_children = np.asarray(first_children, dtype=np.int64)
+        self.nb_children = np.asarray(nb_children, dtype=np.int64)
+        self.depths = np.asarray(depths, dtype=np.int64)
 
+    @classmethod
+    def from_nested(cls, tree) -> "FlatTree":
+        """Return the FlatTree of a nested-list tree, see compute_tree_trips
+        """
+        nodes, parents, first_children, nb_children, depths = [], [], [], [], []
+        queue = deque([(tree, -1, 0)] if len(tree) > 0 else [])
+        while queue:
+            subtree, parent, depth = queue.popleft()
+            index = len(nodes)
+            nodes.append(subtree[0])
+            parents.append(parent)
+            depths.append(depth)
+            nb_children.append(len(subtree) - 1)
+            # the children come after the tree nodes already queued
+            first_children.append(index + len(queue) + 1 if len(subtree) > 1 else -1)
+            for branch in subtree[1:]:
+                queue.append((branch, index, depth + 1))
+        return cls(nodes, parents, first_children, nb_children, depths)
 
-def get_all_tree_paths(tree):
-    """Return list of all tree paths
+    def to_nested(self) -> list:
+        """Return the nested-list tree
+        """
+        if len(self) == 0:
+            return []
+
+        def rec(index):
+            return [int(self.nodes[index]), *[rec(child) for child in self.children(index)]]
+        return rec(0)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def children(self, index) -> range:
+        """Return the children of a tree node
+        """
+        first_child = int(self.first_children[index])
+        return range(first_child, first_child + int(self.nb_children[index]))
+
+    def child(self, index, branch) -> int:
+        """Return the child of a tree node at a branch (starting at 1) of a tree path
+        """
+        if not 1 <= branch <= self.nb_children[index]:
+            raise IndexError("Tree branch out of range", branch)
+        return int(self.first_children[index]) + branch - 1
+
+    def walk(self, tree_path, level=None) -> int:
+        """Return the tree node reached by the first level branches of tree_path, all if None
+        """
+        index = 0
+        for branch in tree_path[:level]:
+            index = self.child(index, branch)
+        return index
+
+    def get_tree_path(self, index) -> list:
+        """Return the tree path from the root to a tree node
+        """
+        tree_path = []
+        while self.parents[index] >= 0:
+            parent = int(self.parents[index])
+            tree_path.append(index - int(self.first_children[parent]) + 1)
+            index = parent
+        return tree_path[::-1]
+
+    def get_nodes(self, index) -> list:
+        """Return the nodes from the root to a tree node
+        """
+        nodes = []
+        while index >= 0:
+            nodes.append(int(self.nodes[index]))
+            index = int(self.parents[index])
+        return nodes[::-1]
+
+    def leaves(self):
+        """Yield the leaves in depth-first order
+        """
+        stack = [0] if len(self) > 0 else []
+        while stack:
+            index = stack.pop()
+            if self.nb_children[index] == 0:
+                yield index
+            else:
+                stack.extend(reversed(self.children(index)))
+
+
+def _get_flat_tree(tree) -> FlatTree:
+    """Return tree as a FlatTree, a nested-list tree is converted
     """
-    def rec(tree, tree_path):
-        if len(tree) == 1:
-            return [tree_path]
-        branches = tree[1:]
-        tree_paths = []
-        for node, branch in enumerate(branches):
-            tmp_tree_paths = (rec(branch, tree_path + [node+1]))
-            tree_paths += tmp_tree_paths
-        return tree_paths
-    return rec(tree, [])
+    return tree if isinstance(tree, FlatTree) else FlatTree.from_nested(tree)
 
 
-def get_all_solutions_from_tree(tree):
-    """Return all half solution from the tree
+@profiling.timed("trees.compute_flat_tree_trips")
+def compute_flat_tree_trips(start_point, finish_point, nb_steps, next_nodes: dict, distances=None) -> FlatTree:
+    """Compute the tree of trips of a passenger as a FlatTree
+
+    Same tree as compute_tree_trips, built with an iterative breadth first
+    search instead of recursive nested lists. The branches that cannot reach
+    finish_point in the remaining steps are not expanded, the dead ends
+    (loops) are removed once the search is done.
+
+    Args:
+        next_nodes (dict or SparseGraph): legal next nodes of each node
+        distances (np.ndarray, optional): hop distances to finish_point, computed if None. Defaults to None.
     """
-    if len(tree) == 0:
-        return []
+    if distances is None:
+        distances = paths.get_hop_distances(next_nodes, finish_point)
+    if start_point == finish_point or distances[start_point] > nb_steps:
+        return FlatTree([], [], [], [], [])
+    get_next_nodes = paths._get_next_nodes_function(next_nodes)
+    nodes = array.array('l', [start_point])
+    parents = array.array('l', [-1])
+    depths = array.array('l', [0])
+    # bit of each node in the visited masks, given on the first visit
+    node_bits = {start_point: 1}
+    # (tree node, visited mask)
+    queue = deque([(0, 1)])
+    while queue:
+        index, visited = queue.popleft()
+        node = nodes[index]
+        if node == finish_point:
+            continue
+        depth = depths[index] + 1
+        for next_node in get_next_nodes(node):
+            if depth + distances[next_node] > nb_steps:
+                continue
+            bit = node_bits.get(next_node)
+            if bit is None:
+                bit = node_bits[next_node] = 1 << len(node_bits)
+            # a passenger can wait on a node but not come back to it
+            if visited & bit and next_node != node:
+                continue
+            nodes.append(next_node)
+            parents.append(index)
+            depths.append(depth)
+            queue.append((len(nodes) - 1, visited | bit))
+    profiling.count("trees.frontier_entries", len(nodes))
+    nodes = np.frombuffer(nodes, dtype=np.dtype('l')).astype(np.int64)
+    parents = np.frombuffer(parents, dtype=np.dtype('l')).astype(np.int64)
+    depths = np.frombuffer(depths, dtype=np.dtype('l')).astype(np.int64)
+    # keep the tree nodes with a finish point below them, the children come after their parent
+    alive = nodes == finish_point
+    for index in range(len(nodes) - 1, 0, -1):
+        if alive[index]:
+            alive[parents[index]] = True
+    if not alive[0]:
+        return FlatTree([], [], [], [], [])
+    kept = np.flatnonzero(alive)
+    new_indexes = np.cumsum(alive) - 1
+    parents = np.where(parents[kept] >= 0, new_indexes[parents[kept]], -1)
+    # breadth-first order: the children of a tree node are contiguous and sorted by parent
+    nb_children = np.bincount(parents[1:], minlength=len(kept))
+    first_children = np.where(nb_children > 0, np.searchsorted(
+        parents[1:], np.arange(len(kept))) + 1, -1)
+    return FlatTree(nodes[kept], parents, first_children, nb_children, depths[kept])
 
-    def rec(tree, sol):
-        if len(tree) == 1:
-            return [sol]
-        branches = tree[1:]
-        solutions = []
-        for branch in branches:
-            solutions += rec(branch, sol + [branch[0]])
-        return solutions
-    return rec(tree, [tree[0]])
 
+def get_solution_from_tree(tree, tree_path):
+    """Return solution using tree_path
 
-def _get_level_branch_nb(tree, tree_path, level):
-    """Get number of branch at level
+    Args:
+        tree (FlatTree or list): tree of trips, a nested-list tree is converted at each call, keep a FlatTree to walk it in O(depth)
+        tree_path (list): branch (starting at 1) taken at each level
     """
-    next_tree = copy.deepcopy(tree)
-    for i in range(level):
-        next_tree = next_tree[tree_path[i]]
-    return len(next_tree)
+    tree = _get_flat_tree(tree)
+    nodes = tree.get_nodes(tree.walk(tree_path))
+    return [[nodes[i], nodes[i+1]] for i in range(len(nodes) - 1)]
 
 
-def _get_branches(tree, tree_path, impact_level):
-    """Return the new branches of the new tree path at impact level
+def get_all_tree_paths(tree):
+    """Return list of all tree paths
     """
-    next_tree = copy.deepcopy(tree)
-    for i in range(impact_level):
-        next_tree = next_tree[tree_path[i]]
-    return next_tree[1:]
+    tree = _get_flat_tree(tree)
+    return [tree.get_tree_path(leaf) for leaf in tree.leaves()]
 
 
-def _get_tree_max_level(tree):
-    """Return the maximum level of the tree
+def get_all_solutions_from_tree(tree):
+    """Return all half solution from the tree
     """
-    if len(tree) == 1:
-        return 0
-    branches = tree[1:]
-    max_level = 0
-    for branch in branches:
-        max_level = max(max_level, _get_tree_max_level(branch))
-    return max_level
+    tree = _get_flat_tree(tree)
+    return [tree.get_nodes(leaf) for leaf in tree.leaves()]
 
 
 def get_tree_neighbor(tree, tree_path: list, level):
     """Return a tree neighbor of this level
+
+    The branch of tree_path at level is replaced by the next one, the
+    following branches are kept while they exist and the path is completed
+    with random branches until the finish point.
+
+    Args:
+        tree (FlatTree or list): tree of trips, a nested-list tree is converted at each call, keep a FlatTree to walk it in O(depth)
+        tree_path (list): branch (starting at 1) taken at each level
+        level (int): level of the changed branch
     """
-    modulo = _get_level_branch_nb(tree, tree_path, level)
-    max_level = _get_tree_max_level(tree)
-    new_tree_path = tree_path.copy()
-    new_tree_path[level] = ((new_tree_path[level] + 1) % modulo)
-    if new_tree_path[level] == 0:
-        new_tree_path[level] = 1
-    # impact on lower branch
-    for impact_level in range(level, max_level):
-        new_branches = _get_branches(tree, new_tree_path, impact_level)
-        previous_next_node = _get_node_from_tree(
-            tree, tree_path, impact_level + 1)
-        for i in range(len(new_branches)):
-            if previous_next_node in new_branches[i]:
-                new_tree_path.append(i + 1)
-        new_tree_path[level+1] = new_tree_path[level+1] % len(new_branches)
-        if new_tree_path[level+1] == 0:
-            new_tree_path[level+1] = 1
+    tree = _get_flat_tree(tree)
+    index = tree.walk(tree_path, level)
+    previous_finish_point = tree.nodes[tree.walk(tree_path)]
+    new_tree_path = tree_path[:level]
+    branch = tree_path[level] % tree.nb_children[index] + 1
+    for branch in [branch, *tree_path[level+1:]]:
+        if not 1 <= branch <= tree.nb_children[index]:
+            break
+        new_tree_path.append(branch)
+        index = tree.child(index, branch)
     # filling until finish point
-    finish_point = _get_node_from_tree(tree, new_tree_path, len(new_tree_path))
-    previous_finish_point = _get_node_from_tree(
-        tree, tree_path, len(tree_path))
-    while finish_point != previous_finish_point:
-        level = len(new_tree_path)
-        branches = _get_branches(tree, new_tree_path, level)
-        new_tree_path.append(random.randint(1, len(branches)))
-        finish_point = branches[new_tree_path[-1]-1][0]
+    while tree.nodes[index] != previous_finish_point and tree.nb_children[index] > 0:
+        new_tree_path.append(random.randint(1, int(tree.nb_children[index])))
+        index = tree.child(index, new_tree_path[-1])
     return new_tree_path
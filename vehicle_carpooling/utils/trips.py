@@ -0,0 +1,232 @@
+# vehicle_carpooling/utils/trips.py
+
+"""Utils for storing the trips
+"""
+
+import os
+import shutil
+import tempfile
+import weakref
+from collections.abc import Sequence
+
+import numpy as np
+
+
+def get_trip_lengths(nodes) -> np.ndarray:
+    """Return the number of nodes of (nb_trips, nb_steps + 1) padded node sequences
+
+    The trips ending before nb_steps are padded with their last node.
+    """
+    nodes = np.asarray(nodes)
+    # trailing nodes equal to the last node, the last node included
+    padding = (nodes == nodes[:, -1:])[:, ::-1]
+    nb_padding = np.where(padding.all(axis=1), nodes.shape[1],
+                          np.argmin(padding, axis=1))
+    return nodes.shape[1] - nb_padding + 1
+
+
+class TripPool:
+    """TripPool class
+
+    Trips of distinct OD pairs stored once as a ragged array: the nodes of
+    all the trips in one flat array and the offset of each trip, the padding
+    up to nb_steps is implicit. The passengers sharing an OD pair share its
+    range of trips instead of holding their own copy of the trips.
+
+    Above spill_threshold bytes, the arrays are moved to files in a
+    temporary directory: the new trips are appended to the files and the
+    arrays are read through memory maps, so the memory of the process stays
+    bounded. The directory is removed with the pool.
+    """
+
+    def __init__(self, nb_steps, dtype=np.int64, spill_threshold=None, spill_directory=None) -> None:
+        """Initialize the TripPool object
+
+        Args:
+            nb_steps (int): number of steps of the trips
+            dtype (np.dtype, optional): dtype of the nodes, see utils.paths.get_node_dtype. Defaults to np.int64.
+            spill_threshold (int, optional): size in bytes above which the trips are stored in files, never if None. Defaults to None.
+            spill_directory (str, optional): parent directory of the spill files, the system temporary directory if None. Defaults to None.
+        """
+        self.nb_steps = nb_steps
+        self.dtype = np.dtype(dtype)
+        self.spill_threshold = spill_threshold
+        self.spill_directory = spill_directory
+        # directory of the files once the trips are spilled
+        self.directory = None
+        # od pair: (start trip, stop trip)
+        self.ranges = dict()
+        self._node_chunks = []
+        self._length_chunks = []
+        self._nb_trips = 0
+        self._nb_nodes = 0
+        self._nodes = np.empty(0, dtype=self.dtype)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        # the memory maps do not cover the last writes
+        self._stale = False
+
+    def __len__(self):
+        return self._nb_trips
+
+    def __contains__(self, od_pair):
+        return self._key(od_pair) in self.ranges
+
+    @staticmethod
+    def _key(od_pair) -> tuple:
+        start_node, finish_node = od_pair
+        return int(start_node), int(finish_node)
+
+    @property
+    def spilled(self) -> bool:
+        """True if the trips are stored in files
+        """
+        return self.directory is not None
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the nodes and offsets of the trips in bytes
+        """
+        return self._nb_nodes * self.dtype.itemsize + (self._nb_trips + 1) * 8
+
+    def _path(self, name) -> str:
+        return os.path.join(self.directory, name + ".bin")
+
+    def _spill(self):
+        """Move the trips to files
+        """
+        self._consolidate()
+        self.directory = tempfile.mkdtemp(
+            prefix="trips-", dir=self.spill_directory)
+        weakref.finalize(self, shutil.rmtree, self.directory, True)
+        self._nodes.tofile(self._path("nodes"))
+        self._offsets.tofile(self._path("offsets"))
+        self._stale = True
+        self._consolidate()
+
+    def _append(self, nodes, offsets):
+        """Append nodes and offsets to the files
+        """
+        with open(self._path("nodes"), 'ab') as f:
+            nodes.tofile(f)
+        with open(self._path("offsets"), 'ab') as f:
+            offsets.astype(np.int64).tofile(f)
+        self._stale = True
+
+    def _consolidate(self):
+        """Append the added chunks to the flat arrays
+        """
+        if self.spilled:
+            if self._stale:
+                self._nodes = np.memmap(self._path("nodes"), self.dtype, 'r') if self._nb_nodes else np.empty(
+                    0, dtype=self.dtype)
+                self._offsets = np.memmap(self._path("offsets"), np.int64, 'r')
+                self._stale = False
+            return
+        if self._node_chunks:
+            lengths = np.concatenate(self._length_chunks)
+            self._offsets = np.concatenate(
+                [self._offsets, self._offsets[-1] + np.cumsum(lengths)])
+            self._nodes = np.concatenate([self._nodes] + self._node_chunks)
+            self._node_chunks = []
+            self._length_chunks = []
+
+    @property
+    def nodes(self) -> np.ndarray:
+        """Nodes of all the trips, one after the other
+        """
+        self._consolidate()
+        return self._nodes
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """(nb_trips + 1) offsets of the trips in nodes
+        """
+        self._consolidate()
+        return self._offsets
+
+    def add(self, od_pair, nodes, replace=False) -> tuple:
+        """Add the trips of an OD pair, if it is not already in the pool
+
+        Args:
+            od_pair (tuple): (start node, finish node)
+            nodes (np.ndarray): (nb_trips, nb_steps + 1) node sequences, padded with their last node
+            replace (bool, optional): replace the trips of the OD pair if it is already in the pool. Defaults to False.
+
+        Returns:
+            tuple: (start trip, stop trip) of the trips of the OD pair
+        """
+        key = self._key(od_pair)
+        if key not in self.ranges or replace:
+            nodes = np.asarray(nodes, dtype=self.dtype).reshape(
+                -1, self.nb_steps + 1)
+            lengths = get_trip_lengths(nodes)
+            flat_nodes = nodes[np.arange(self.nb_steps + 1) < lengths[:, None]]
+            if self.spilled:
+                self._append(flat_nodes, self._nb_nodes + np.cumsum(lengths))
+            else:
+                self._node_chunks.append(flat_nodes)
+                self._length_chunks.append(lengths)
+            self.ranges[key] = (self._nb_trips, self._nb_trips + len(nodes))
+            self._nb_trips += len(nodes)
+            self._nb_nodes += len(flat_nodes)
+            if not self.spilled and self.spill_threshold is not None and self.nbytes > self.spill_threshold:
+                self._spill()
+        return self.ranges[key]
+
+    def range(self, od_pair) -> tuple:
+        """Return the (start trip, stop trip) of the trips of an OD pair
+        """
+        return self.ranges[self._key(od_pair)]
+
+    def gather(self, trips) -> np.ndarray:
+        """Return the (len(trips), nb_steps + 1) padded node sequences of trips
+
+        Args:
+            trips (np.ndarray): indexes of the trips in the pool
+        """
+        offsets = self.offsets
+        trips = np.asarray(trips, dtype=np.int64)
+        starts = offsets[trips]
+        positions = np.minimum(np.arange(self.nb_steps + 1),
+                               (offsets[trips + 1] - starts - 1)[..., None])
+        return self.nodes[starts[..., None] + positions]
+
+    def trips(self, od_pair) -> "TripRange":
+        """Return the trips of an OD pair
+        """
+        return TripRange(self, *self.range(od_pair))
+
+
+class TripRange(Sequence):
+    """TripRange class
+
+    Range of trips of a TripPool, used like the list of solutions of a
+    passenger: trip_range[i] is the (nb_steps, 2) [from, to] solution of the
+    i-th trip.
+    """
+
+    def __init__(self, pool: TripPool, start, stop) -> None:
+        """Initialize the TripRange object
+
+        Args:
+            pool (TripPool): pool of the trips
+            start (int): first trip
+            stop (int): end of the range
+        """
+        self.pool = pool
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError("Trip index out of range", index)
+        nodes = self.pool.gather([self.start + index % len(self)])[0]
+        return np.lib.stride_tricks.sliding_window_view(nodes, 2)
+
+    def nodes(self) -> np.ndarray:
+        """Return the (nb_trips, nb_steps + 1) padded node sequences of the trips
+        """
+        return self.pool.gather(np.arange(self.start, self.stop))
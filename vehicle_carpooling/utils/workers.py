@@ -0,0 +1,330 @@
+# vehicle_carpooling/utils/workers.py
+
+"""Utils for computing the trips in parallel
+"""
+
+import atexit
+import concurrent.futures
+import functools
+import math
+import os
+import sys
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+from vehicle_carpooling.utils import profiling, trees
+from vehicle_carpooling.utils.graphs import SparseGraph
+
+BACKENDS = ("serial", "thread", "process")
+
+# shared memory blocks attached by this process, by name
+_attached_blocks = dict()
+# graphs attached by this process, by block names
+_attached_graphs = dict()
+
+
+class TripEnumerationError(RuntimeError):
+    """Error raised when the trips of OD pairs could not be computed
+    """
+
+
+def _attach_block(name):
+    """Attach the shared memory block name, the block stays owned by its creator
+    """
+    if name not in _attached_blocks:
+        if sys.version_info >= (3, 13):
+            _attached_blocks[name] = shared_memory.SharedMemory(
+                name=name, track=False)
+        else:
+            _attached_blocks[name] = shared_memory.SharedMemory(name=name)
+    return _attached_blocks[name]
+
+
+def _get_error(message, exc) -> TripEnumerationError:
+    """Return a TripEnumerationError caused by exc
+    """
+    error = TripEnumerationError(message)
+    error.__cause__ = exc
+    return error
+
+
+class SharedGraph:
+    """SharedGraph class
+
+    Arrays of a SparseGraph copied once into shared memory. Pickling a
+    SharedGraph only sends the names of the blocks: the worker processes
+    attach them and build the graph without copying the arrays.
+    """
+
+    def __init__(self, graph: SparseGraph) -> None:
+        """Initialize the SharedGraph object
+
+        Args:
+            graph (SparseGraph): graph to share
+        """
+        self._blocks = []
+        # array name: (block name, shape, dtype)
+        self.specs = dict()
+        for name in ("indptr", "indices", "times"):
+            array = getattr(graph, name)
+            if array is None:
+                continue
+            block = shared_memory.SharedMemory(
+                create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            self._blocks.append(block)
+            self.specs[name] = (block.name, array.shape, array.dtype.str)
+
+    def __getstate__(self):
+        return {"specs": self.specs, "_blocks": []}
+
+    def attach(self) -> SparseGraph:
+        """Return the graph, backed by the shared memory blocks
+        """
+        key = tuple(spec[0] for spec in self.specs.values())
+        if key not in _attached_graphs:
+            arrays = dict()
+            for name, (block_name, shape, dtype) in self.specs.items():
+                arrays[name] = np.ndarray(
+                    shape, dtype, buffer=_attach_block(block_name).buf)
+            _attached_graphs[key] = SparseGraph(**arrays)
+        return _attached_graphs[key]
+
+    def close(self):
+        """Free the shared memory blocks, only called by the creator
+        """
+        blocks, self._blocks = self._blocks, []
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def _compute_chunk(graph, od_pairs, nb_steps, distances, settings, dtype):
+    """Compute the trips of a chunk of OD pairs
+
+    Args:
+        graph (SparseGraph or SharedGraph): graph of the map
+        od_pairs (list): (start node, finish node) pairs
+        nb_steps (int): number of steps
+        distances (dict): hop distances to each finish node
+        settings (dict): arguments of utils.trees.compute_trip_nodes, time_map is True to rank the trips with the graph times
+        dtype (np.dtype): dtype of the nodes
+
+    Returns:
+        tuple: (nodes, counts), the (nb_trips, nb_steps + 1) node sequences of all the OD pairs and their number of trips
+    """
+    if isinstance(graph, SharedGraph):
+        graph = graph.attach()
+    settings = dict(settings, time_map=graph if settings["time_map"] else None)
+    nodes = [np.empty((0, nb_steps + 1), dtype=dtype)]
+    counts = []
+    for start_node, finish_node in od_pairs:
+        nodes.append(trees.compute_trip_nodes(start_node, finish_node, nb_steps, graph,
+                                              distances[finish_node], dtype=dtype, **settings))
+        counts.append(len(nodes[-1]))
+    return np.concatenate(nodes), np.array(counts, dtype=np.int64)
+
+
+class TripExecutor:
+    """TripExecutor class
+
+    Computes the trips of OD pairs in chunks, with a serial, thread or
+    process backend. The pool and the shared graphs are kept between the
+    calls, so the executor can be reused by several RidePath objects. With
+    the process backend, the graph is sent once through shared memory and
+    the trips come back as compact node arrays.
+    """
+
+    def __init__(self, backend="process", max_workers=None, chunk_size=None) -> None:
+        """Initialize the TripExecutor object
+
+        Args:
+            backend (str, optional): "serial", "thread" or "process". Defaults to "process".
+            max_workers (int, optional): number of workers, the number of cpus if None. Defaults to None.
+            chunk_size (int, optional): number of OD pairs per task, about 4 tasks per worker if None. Defaults to None.
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}")
+        self.backend = backend
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._executor = None
+        # shared graph of each topology
+        self._shared_graphs = weakref.WeakKeyDictionary()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _get_executor(self) -> concurrent.futures.Executor:
+        if self._executor is None:
+            if self.backend == "thread":
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.max_workers)
+            else:
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    self.max_workers)
+        return self._executor
+
+    def _get_graph(self, topology):
+        """Return the graph sent to the workers
+        """
+        if self.backend != "process":
+            return topology.graph
+        shared_graph = self._shared_graphs.get(topology)
+        if shared_graph is None:
+            shared_graph = SharedGraph(topology.graph)
+            self._shared_graphs[topology] = shared_graph
+            weakref.finalize(topology, shared_graph.close)
+        return shared_graph
+
+    def _chunks(self, od_pairs) -> list:
+        chunk_size = self.chunk_size or max(
+            1, math.ceil(len(od_pairs) / (4 * self.max_workers)))
+        return [od_pairs[i:i + chunk_size] for i in range(0, len(od_pairs), chunk_size)]
+
+    def compute_trips(self, topology, od_pairs, nb_steps, trip_settings, dtype=np.int64) -> dict:
+        """Compute the trips of OD pairs
+
+        Args:
+            topology (Topology): topology of the map
+            od_pairs (list): (start node, finish node) pairs
+            nb_steps (int): number of steps
+            trip_settings (dict): arguments of utils.trees.compute_trip_nodes, a time_map must be the topology graph
+            dtype (np.dtype, optional): dtype of the nodes. Defaults to np.int64.
+
+        Raises:
+            TripEnumerationError: the trips of a chunk could not be computed
+
+        Returns:
+            dict: (nb_trips, nb_steps + 1) node sequences of each OD pair
+        """
+        trips = dict()
+        for chunk_trips in self.iter_trips(topology, od_pairs, nb_steps, trip_settings, dtype):
+            trips.update(chunk_trips)
+        return trips
+
+    def iter_trips(self, topology, od_pairs, nb_steps, trip_settings, dtype=np.int64):
+        """Compute the trips of OD pairs and yield them chunk by chunk, see compute_trips
+
+        Only the chunks being consumed are held in memory, the serial
+        backend computes a chunk when the previous one has been consumed.
+
+        Yields:
+            dict: (nb_trips, nb_steps + 1) node sequences of each OD pair of a chunk, in completion order
+        """
+        chunks = self._chunks(self._get_od_pairs(od_pairs))
+        # a single task is not worth the dispatch
+        if self.backend == "serial" or len(chunks) <= 1:
+            for chunk in chunks:
+                yield self._submit(topology, chunk, nb_steps, trip_settings, dtype, inline=True).result()
+            return
+        futures = [self._submit(topology, chunk, nb_steps, trip_settings, dtype)
+                   for chunk in chunks]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def submit_trips(self, topology, od_pairs, nb_steps, trip_settings, dtype=np.int64) -> list:
+        """Compute the trips of OD pairs in the background, see compute_trips
+
+        Returns:
+            list: futures of the node sequences of each OD pair of a chunk (dict), they raise TripEnumerationError on failure
+        """
+        return [self._submit(topology, chunk, nb_steps, trip_settings, dtype)
+                for chunk in self._chunks(self._get_od_pairs(od_pairs))]
+
+    @staticmethod
+    def _get_od_pairs(od_pairs) -> list:
+        return [(int(start_node), int(finish_node)) for start_node, finish_node in od_pairs]
+
+    def _submit(self, topology, chunk, nb_steps, trip_settings, dtype, inline=False) -> concurrent.futures.Future:
+        """Compute the trips of a chunk of OD pairs, inline or in the pool
+        """
+        settings = dict(trip_settings,
+                        time_map=trip_settings.get("time_map") is not None)
+        distances = dict((finish_node, topology.hop_distances(finish_node))
+                         for _, finish_node in chunk)
+        future = concurrent.futures.Future()
+        if self.backend == "serial" or inline:
+            try:
+                result = _compute_chunk(
+                    topology.graph, chunk, nb_steps, distances, settings, dtype)
+            except Exception as exc:
+                future.set_exception(_get_error(
+                    f"Could not compute the trips of the OD pairs {chunk}", exc))
+            else:
+                future.set_result(self._split(chunk, *result))
+            return future
+        graph = self._get_graph(topology)
+        if self.backend == "process":
+            task = self._get_executor().submit(profiling.collect, profiling.is_enabled(), _compute_chunk,
+                                               graph, chunk, nb_steps, distances, settings, dtype)
+        else:
+            task = self._get_executor().submit(_compute_chunk, graph, chunk,
+                                               nb_steps, distances, settings, dtype)
+        future.add_done_callback(
+            lambda future: future.cancelled() and task.cancel())
+        task.add_done_callback(functools.partial(
+            self._resolve, future, chunk))
+        return future
+
+    def _resolve(self, future, chunk, task):
+        """Set the result of future from the task of the pool
+        """
+        if future.done():
+            return
+        if task.cancelled():
+            future.cancel()
+            return
+        try:
+            result = task.result()
+        except concurrent.futures.process.BrokenProcessPool as exc:
+            # the pool cannot be used anymore, a new one is created on the next call
+            self._executor = None
+            future.set_exception(_get_error(
+                f"A worker died while computing the trips of the OD pairs {chunk}", exc))
+            return
+        except Exception as exc:
+            future.set_exception(_get_error(
+                f"Could not compute the trips of the OD pairs {chunk}", exc))
+            return
+        if self.backend == "process":
+            result, stats = result
+            profiling.merge(stats)
+        future.set_result(self._split(chunk, *result))
+
+    @staticmethod
+    def _split(chunk, nodes, counts) -> dict:
+        """Return the node sequences of each OD pair of a chunk
+        """
+        return dict(zip(chunk, np.split(nodes, np.cumsum(counts)[:-1])))
+
+    def close(self):
+        """Shut the pool down and free the shared graphs
+        """
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        for shared_graph in list(self._shared_graphs.values()):
+            shared_graph.close()
+        self._shared_graphs.clear()
+
+
+_default_executor = None
+
+
+def get_default_executor() -> TripExecutor:
+    """Return the process executor shared by the RidePath objects without an executor
+    """
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = TripExecutor()
+        atexit.register(_default_executor.close)
+    return _default_executor